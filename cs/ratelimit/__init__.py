@@ -5,19 +5,47 @@ This can be particular useful for taking advantage of the
 pattern to manage client-side rate limiting for 3rd party APIs and services independently
 from your application logic.
 """
-from .interfaces import IRateLimitProperties
-
-from .components import RateLimitProperties
-from .components import ratelimitproperties_factory
+import importlib
 
+from .decorators import RateLimiter
 from .decorators import ratelimited
 from .decorators import ratelimitedmethod
 
 from .exceptions import RateLimitError
 from .exceptions import RateLimitExceeded
 
+from .keyed import KeyedRateLimiter
+
+from .properties import RateLimitProperties
+from .properties import ratelimitproperties_factory
 
+
+# pylint: disable=undefined-all-variable
 __all__ = [
     'IRateLimitProperties', 'RateLimitProperties', 'ratelimitproperties_factory', 'ratelimited',
-    'ratelimitedmethod', 'RateLimitError', 'RateLimitExceeded',
+    'ratelimitedmethod', 'RateLimitError', 'RateLimitExceeded', 'KeyedRateLimiter', 'RateLimiter',
+    'WaiterQueue', 'AdaptiveLimit', 'SnapshotRegistry', 'RateLimitedExecutor', 'paced', 'apaced',
 ]
+# pylint: enable=undefined-all-variable
+
+
+# names imported from their module when first used, importing the package doesn't need zope or
+# the modules of features not used
+_LAZY = {
+    'IRateLimitProperties': '.interfaces',
+    'AdaptiveLimit': '.adaptive',
+    'RateLimitedExecutor': '.executor',
+    'paced': '.pacing',
+    'apaced': '.pacing',
+    'SnapshotRegistry': '.persistence',
+    'WaiterQueue': '.queueing',
+}
+
+
+def __getattr__(name):
+    """Import lazily served names when first used."""
+    if name in _LAZY:
+        value = getattr(importlib.import_module(_LAZY[name], __name__), name)
+        globals()[name] = value  # later lookups skip this
+        return value
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,128 @@
+"""Limits adapting to upstream feedback, e.g. vendors with undocumented limits.
+
+An `AdaptiveLimit` given to a `RateLimitProperties` or limiter as `adaptive`
+raises its max_count while calls succeed and lowers it when calls are
+throttled, additive increase and multiplicative decrease (AIMD) like TCP
+congestion control.  Decorated callables report their outcome on their own,
+other code reports with `AdaptiveLimit.throttled` and
+`AdaptiveLimit.observe`.
+"""
+import threading
+
+from .exceptions import RateLimitError
+from .state import clock as monotonic_clock, to_ns
+
+
+class AdaptiveLimit:  # pylint: disable=too-many-instance-attributes
+    """AIMD controller of the max_count of one limit.
+
+    Every call completed in time raises max_count by `increase` / max_count,
+    about `increase` per interval at full rate, up to `ceiling`.  Throttled
+    calls and calls slower than `max_latency` multiply it by `decrease`,
+    down to `floor`, at most once per interval since calls in flight are
+    often throttled together.
+
+    errors: exception types of throttled calls, e.g. the error raised for
+            HTTP 429 responses.  Other errors don't change the limit.
+    retry_after: callable passed a throttled error and returning the seconds
+                 to back off for, e.g. from its Retry-After header, or None.
+                 The limit isn't raised until then.
+    max_latency: seconds (or timedelta) calls may take before the limit is
+                 lowered, None (default) to ignore latency
+    increase: max_count added per max_count calls completed in time
+    decrease: factor applied to max_count for throttled or slow calls
+    floor: lowest max_count
+    ceiling: highest max_count, defaults to the initial max_count, needed
+             for limits starting out unlimited
+    clock: callable returning monotonic nanoseconds, see
+           `.testing.FakeClock`
+
+    max_count only changes when its integer value does.  The limit is set
+    when the controller is given to properties or a limiter, see `bind`.
+    """
+
+    def __init__(self, errors=(), retry_after=None, max_latency=None, increase=1, decrease=.5, floor=1,
+                 ceiling=None, clock=None):
+        """Create an unbound controller, see class docstring for kwargs."""
+        # pylint: disable=too-many-arguments
+        if not 0 < decrease < 1:
+            raise ValueError(f"expected a decrease factor between 0 and 1, got {decrease!r}")
+        self.errors = tuple(errors) if isinstance(errors, (list, tuple)) else errors
+        self.retry_after = retry_after
+        self.max_latency = max_latency
+        self.increase = increase
+        self.decrease = decrease
+        self.floor = floor
+        self.ceiling = ceiling
+        self.clock = clock if clock is not None else monotonic_clock
+        self.limit = None
+        self.count = 0.0
+        self._lock = threading.Lock()
+        self._decreased = None  # time of the last decrease
+        self._hold = 0  # time until which the limit isn't raised
+
+    def bind(self, limit):
+        """Adjust the max_count of `limit`, an `IRateLimitProperties` provider or `RateLimiter`.
+
+        An unlimited `limit`, of max_count 0, starts out at `ceiling`.
+        """
+        if not limit.max_count and self.ceiling is None:
+            raise ValueError("adaptive needs a ceiling to adjust an unlimited max_count of 0")
+        with self._lock:
+            self.limit = limit
+            self.count = float(limit.max_count or self.ceiling)
+            if self.ceiling is None:
+                self.ceiling = limit.max_count
+
+    def observe(self, latency=None):
+        """Report a completed call that took `latency` seconds (or timedelta)."""
+        self._check_bound()
+        if latency is not None and self.max_latency is not None and to_ns(latency) > to_ns(self.max_latency):
+            self._lower(None)
+            return
+        with self._lock:
+            if self.clock() < self._hold or self.count >= self.ceiling:
+                return
+            self.count = min(self.ceiling, self.count + self.increase / max(self.count, 1))
+            self._apply()
+
+    def throttled(self, retry_after=None):
+        """Report a throttled call, backing off for `retry_after` seconds (or timedelta) when given."""
+        self._lower(retry_after)
+
+    def failed(self, error):
+        """Report a call that raised `error`, which lowers the limit for one of `errors`."""
+        if isinstance(error, self.errors):
+            self._lower(self.retry_after(error) if self.retry_after is not None else None)
+
+    def _check_bound(self):
+        if self.limit is None:
+            raise RateLimitError(f"{self!r} reports to no limit, give it to properties or a limiter first")
+
+    def _interval(self):
+        """Return the interval of the limit in nanoseconds, as last resolved by a limiter when a callable."""
+        resolved = getattr(self.limit, '_interval_ns', None)
+        if resolved is not None:
+            return resolved() or 0
+        return to_ns(self.limit.interval)
+
+    def _lower(self, retry_after):
+        self._check_bound()
+        with self._lock:
+            now = self.clock()
+            if retry_after:
+                self._hold = max(self._hold, now + to_ns(retry_after))
+            if self._decreased is not None and now - self._decreased < self._interval():
+                return
+            self._decreased = now
+            self.count = max(self.floor, self.count * self.decrease)
+            self._apply()
+
+    def _apply(self):
+        count = int(self.count)
+        if count != self.limit.max_count:
+            self.limit.max_count = count
+
+    def __repr__(self):
+        """Show the current max_count."""
+        return f"<{type(self).__name__} max_count={self.count:.1f} of {self.floor}..{self.ceiling}>"
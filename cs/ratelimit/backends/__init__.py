@@ -0,0 +1,5 @@
+"""Rate limiter state backends shared between processes and hosts, or threads.
+
+Backends provide `..interfaces.IRateLimiterBackend` and can be used as the
+`state` of any limiter in place of the default in-memory mapping.
+"""
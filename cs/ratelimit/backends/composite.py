@@ -0,0 +1,123 @@
+"""Several limits enforced on the same calls at once, e.g. vendor quotas.
+
+Vendors often impose limits over several windows, e.g. 10 calls per second
+and 500 per minute and 10k per day, and per-key limits nested under a
+global one.  Stacked limiters each take their own lock and permits, so a
+call rejected by an outer limiter has already used up quota of the inner
+ones.  A `CompositeState` used as the `state` of a limiter checks the limit
+of the limiter along with all of its `limits` under one lock, and takes the
+permits of all of them or none::
+
+    @ratelimited(max_count=10, interval=timedelta(seconds=1), block=True,
+                 state=CompositeState([(500, 60), (10000, 86400)]))
+    def call_vendor():
+        ...
+
+Limiters with a `key` keep the per-key limit nested under the limits of the
+composite.  Composites nest as well, a composite with a `parent` enforces
+the limits of the parent (and its parents) along with its own.
+"""
+from datetime import timedelta
+import threading
+
+from ..engines import get_engine
+from ..properties import RateLimitProperties
+from ..state import LimiterState, clock as monotonic_clock, to_ns
+
+
+class CompositeState:
+    """Limiter state enforcing extra `limits` atomically, see module docstring.
+
+    limits: `..interfaces.IRateLimitProperties` providers, e.g.
+            `RateLimitProperties`, or (max_count, interval) pairs with
+            the interval in seconds or as a timedelta.  Their max_count,
+            interval and engine may be changed at runtime, the engine of
+            the limiter is used for limits without one.
+    parent: composite whose limits are enforced as well, sharing its lock
+    state: `LimiterState` of the limit of the limiter itself
+    rlock: lock guarding the states of all limits, defaults to the lock of
+           the parent or a new one
+    clock: callable returning monotonic nanoseconds, see
+           `..testing.FakeClock`
+
+    The states of the limits must only be used through composites sharing
+    the same lock, or by limiters given that lock as `rlock`.  Other
+    backends can't be limits, they keep their own atomicity.
+    """
+
+    __slots__ = ('limits', 'parent', 'state', 'rlock', 'clock')
+
+    def __init__(self, limits=(), parent=None, state=None, rlock=None, clock=None):
+        """Create a composite, see class docstring for args."""
+        # pylint: disable=too-many-arguments
+        self.limits = tuple(_limit(limit) for limit in limits)
+        self.parent = parent
+        self.state = state if state is not None else LimiterState()
+        self.rlock = rlock if rlock is not None else parent.rlock if parent is not None else threading.RLock()
+        self.clock = clock if clock is not None else parent.clock if parent is not None else monotonic_clock
+
+    def child(self, state, limits=()):
+        """Return a composite of `limits` nested under this one, whose own limit is kept in `state`."""
+        return CompositeState(limits, self, state, self.rlock, self.clock)
+
+    def acquire(self, engine, max_count, interval, block, n=1):
+        """Reserve `n` permits from every limit, returning the nanoseconds until they may be used.
+
+        All limits are probed first and the permits are only taken when
+        they are available right now from all of them or `block` is True.
+        Blocked calls reserve the slot at which all limits admit them.
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        if not n:
+            return 0
+        levels = self._levels(engine, max_count, interval)
+        with self.rlock:
+            now = self.clock()
+            states = [state if isinstance(state, LimiterState) else LimiterState.from_mapping(state)
+                      for _, _, _, state in levels]
+            slot = now
+            for (level_engine, level_count, level_interval, _), state in zip(levels, states):
+                slot = max(slot, level_engine.reserve(state.copy(), now, level_count, level_interval, True, n))
+            if slot > now and not block:
+                return slot - now
+            start = slot
+            for (level_engine, level_count, level_interval, mapping), state in zip(levels, states):
+                slot = max(slot, level_engine.reserve(state, start, level_count, level_interval, True, n))
+                if state is not mapping:
+                    state.to_mapping(mapping)
+        return slot - now
+
+    def _levels(self, engine, max_count, interval):
+        """Return (engine, max_count, interval, state) of the limits with a max_count and interval."""
+        levels = []
+        if max_count and interval:
+            levels.append((engine, max_count, interval, self.state))
+        composite = self
+        while composite is not None:
+            for limit in composite.limits:
+                limit_interval = to_ns(limit.interval)
+                if limit.max_count and limit_interval:
+                    levels.append((engine if limit.engine is None else get_engine(limit.engine), limit.max_count,
+                                   limit_interval, limit.state))
+            composite = composite.parent
+        return levels
+
+    def __repr__(self):
+        """Show the limits, own ones first."""
+        limits = []
+        composite = self
+        while composite is not None:
+            limits.extend(f"{limit.max_count}/{limit.interval}" for limit in composite.limits)
+            composite = composite.parent
+        return f"<{type(self).__name__} of {', '.join(limits)} {self.state!r}>"
+
+
+def _limit(limit):
+    """Return an `IRateLimitProperties` provider for a limit given as a provider or (max_count, interval) pair."""
+    if isinstance(limit, tuple):
+        max_count, interval = limit
+        limit = RateLimitProperties(max_count=max_count, interval=interval if isinstance(interval, timedelta)
+                                    else timedelta(seconds=interval))
+    if hasattr(limit.state, 'acquire') and not isinstance(limit.state, LimiterState):
+        raise ValueError(f"expected the limits of a composite to keep their state in memory, got {limit.state!r}")
+    return limit
@@ -0,0 +1,212 @@
+"""Limiter state kept in a Redis (or Redis protocol compatible) server.
+
+Every permit acquisition is a single EVALSHA round-trip running `SCRIPT`
+on the server, which reads the state, applies the engine and writes the
+result back atomically.  The server clock is used, so all processes and
+hosts sharing a key agree on the time.
+
+Any client with redis-py compatible `evalsha` and `script_load` methods can
+be used, `RedisClient` is a minimal dependency free one.
+"""
+import socket
+import threading
+
+from ..exceptions import RateLimitBackendError
+
+
+# KEYS[1] state hash
+# ARGV engine, max_count, interval (us), block (0/1), permits, burst
+# returns microseconds until the permits may be used
+SCRIPT = """
+if redis.replicate_commands then redis.replicate_commands() end
+local engine, max_count, interval = ARGV[1], tonumber(ARGV[2]), tonumber(ARGV[3])
+local block, n, burst = ARGV[4] == '1', tonumber(ARGV[5]), tonumber(ARGV[6])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000000 + tonumber(time[2])
+if max_count <= 0 or interval <= 0 then
+    return 0
+end
+local slot, expire
+if engine == 'fixed_window' then
+    local state = redis.call('HMGET', KEYS[1], 'updated', 'counter')
+    local updated, counter = tonumber(state[1]) or 0, tonumber(state[2]) or 0
+    slot = math.max(now, updated)
+    local reset = counter + n > max_count
+    if reset then
+        slot = math.max(slot, updated + interval)
+        counter = 0
+    end
+    if slot > now and not block then
+        return math.ceil(slot - now)
+    end
+    redis.call('HMSET', KEYS[1], 'updated', slot, 'counter', counter + n)
+    expire = slot - now + interval
+else
+    local emission = interval / max_count
+    local tat = math.max(now, tonumber(redis.call('HGET', KEYS[1], 'tat')) or now)
+    slot = math.max(now, tat + emission * (n - burst))
+    if slot > now and not block then
+        return math.ceil(slot - now)
+    end
+    redis.call('HMSET', KEYS[1], 'tat', tat + emission * n, 'updated', slot)
+    expire = tat + emission * n - now
+end
+redis.call('PEXPIRE', KEYS[1], math.ceil(expire / 1000) + 1)
+return math.ceil(slot - now)
+"""
+
+# engine names the script can run, token buckets run as the equivalent GCRA
+ENGINES = {'fixed_window': 'fixed_window', 'gcra': 'gcra', 'token_bucket': 'gcra'}  # nosec B105
+
+
+class RedisState:
+    """Rate limiter state stored in a Redis hash at `key`.
+
+    Limiters sharing a server and key share one limit, e.g. a vendor quota
+    across a fleet of workers.  The 'fixed_window', 'token_bucket' and
+    'gcra' engines are supported.  Keys expire once their state no longer
+    affects the limit.
+    """
+
+    def __init__(self, client, key):
+        """Use `client` (see `RedisClient`) to keep state at `key`."""
+        self.client = client
+        self.key = key
+        self._sha = None
+
+    def acquire(self, engine, max_count, interval, block, n=1):
+        """Satisfy `IRateLimiterBackend`, running `SCRIPT` on the server."""
+        try:
+            script_engine = ENGINES[engine.name]
+        except (AttributeError, KeyError):
+            raise ValueError(f"engine {engine!r} is not supported by {type(self).__name__}, "
+                             f"expected one of {sorted(ENGINES)}") from None
+        burst = getattr(engine, 'burst', None) or max_count
+        args = (script_engine, max_count, interval // 1000, int(bool(block)), n, max(burst, n))
+        try:
+            if self._sha is None:
+                self._sha = _decode(self.client.script_load(SCRIPT))
+            try:
+                delay = self.client.evalsha(self._sha, 1, self.key, *args)
+            except Exception as e:  # pylint: disable=broad-except
+                if 'NOSCRIPT' not in str(e):
+                    raise
+                self._sha = _decode(self.client.script_load(SCRIPT))  # server restarted or flushed
+                delay = self.client.evalsha(self._sha, 1, self.key, *args)
+        except RateLimitBackendError:
+            raise
+        except Exception as e:
+            raise RateLimitBackendError(f"failed to acquire permits from {self!r}: {e}") from e
+        return int(delay) * 1000
+
+    def __repr__(self):
+        """Identify the key state is kept at."""
+        return f"<{type(self).__name__} {self.key!r}>"
+
+
+class RedisClient:
+    """Minimal thread safe Redis protocol (RESP2) client.
+
+    Each thread uses its own connection, opened on first use.
+    """
+
+    def __init__(self, host='localhost', port=6379, password=None, db=0, timeout=None):
+        """Set the server address and connection options."""
+        self.host = host
+        self.port = port
+        self.password = password
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def execute(self, *args):
+        """Send a command and return its reply, raising RateLimitBackendError for errors."""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+        try:
+            return _command(conn, args)
+        except OSError:
+            self.close()
+            raise
+
+    def evalsha(self, sha, numkeys, *args):
+        """Run a loaded script."""
+        return self.execute('EVALSHA', sha, numkeys, *args)
+
+    def script_load(self, script):
+        """Load a script, returning its SHA."""
+        return self.execute('SCRIPT', 'LOAD', script)
+
+    def close(self):
+        """Close the connection of the current thread."""
+        conn = getattr(self._local, 'conn', None)
+        self._local.conn = None
+        if conn is not None:
+            conn[1].close()
+            conn[0].close()
+
+    def _connect(self):
+        """Open the connection of the current thread, only keeping it once AUTH and SELECT succeeded."""
+        sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+        conn = (sock, sock.makefile('rb'))
+        try:
+            if self.password is not None:
+                _command(conn, ('AUTH', self.password))
+            if self.db:
+                _command(conn, ('SELECT', self.db))
+        except BaseException:
+            conn[1].close()
+            sock.close()
+            raise
+        self._local.conn = conn
+        return conn
+
+
+class _Error(str):
+    """An error reply."""
+
+
+def _decode(value):
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def _command(conn, args):
+    """Send a command over `conn` and return its reply, raising RateLimitBackendError for errors."""
+    conn[0].sendall(_encode(args))
+    reply = _read_reply(conn[1])
+    if isinstance(reply, _Error):
+        raise RateLimitBackendError(str(reply))
+    return reply
+
+
+def _encode(args):
+    out = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        out.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(out)
+
+
+def _read_reply(rfile):  # pylint: disable=too-many-return-statements
+    line = rfile.readline()
+    if not line.endswith(b'\r\n'):
+        raise ConnectionError("connection closed by server")
+    kind, value = line[:1], line[1:-2]
+    if kind == b'+':
+        return value.decode()
+    if kind == b'-':
+        return _Error(value.decode())
+    if kind == b':':
+        return int(value)
+    if kind == b'$':
+        if int(value) < 0:
+            return None
+        data = rfile.read(int(value) + 2)
+        return data[:-2]
+    if kind == b'*':
+        if int(value) < 0:
+            return None
+        return [_read_reply(rfile) for _ in range(int(value))]
+    raise ConnectionError(f"unexpected reply {line!r}")
@@ -0,0 +1,166 @@
+"""Limiter state shared by the processes of one host through shared memory.
+
+A `SharedMemorySegment` holds the state of many named limiters in fixed
+size slots of a `multiprocessing.shared_memory` segment.  Updates are
+serialized between processes with an `fcntl.flock` lock file, so this
+backend is only available on POSIX platforms.  Times are stored as
+readings of the monotonic clock, which is shared by all processes of a
+host.
+"""
+from multiprocessing import resource_tracker
+from multiprocessing import shared_memory
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import threading
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+from ..exceptions import RateLimitBackendError
+from ..state import NEVER, LimiterState, clock
+
+
+_HEADER = struct.Struct('<8sQ')  # magic, slot count
+_MAGIC = b'csrl\x00\x00\x00\x02'
+# slots are an id followed by the `LimiterState` fields updated, counter, tat,
+# tokens (NaN for None), window and previous
+_IDENT = struct.Struct('<Q')
+_FIELDS = struct.Struct('<qqqdqQ')
+_SLOT = struct.Struct(_IDENT.format + _FIELDS.format[1:])
+
+
+class SharedMemorySegment:
+    """Fixed layout shared memory segment holding limiter state in slots.
+
+    The segment is created by the first process to open `name` and attached
+    to by the others, which must use the same number of `slots`.  Each named
+    limiter takes up one slot for the life of the segment.  Segments persist
+    until `unlink` is called, processes exiting don't remove them.
+    """
+
+    def __init__(self, name='cs_ratelimit', slots=1024):
+        """Open or create the segment called `name` with room for `slots` limiters."""
+        if fcntl is None:
+            raise RateLimitBackendError("shared memory limiter state requires fcntl (POSIX)")
+        self.name = name
+        self.slots = slots
+        self._rlock = threading.RLock()  # flock doesn't exclude threads sharing the lock file
+        self._lock_path = os.path.join(tempfile.gettempdir(), f'{name}.lock')
+        self._lock_file = os.open(self._lock_path, os.O_RDWR | os.O_CREAT, 0o600)
+        with self:
+            try:
+                self._shm = _attach(name)
+            except FileNotFoundError:
+                self._shm = _attach(name, create=True, size=_HEADER.size + slots * _SLOT.size)
+                _HEADER.pack_into(self._shm.buf, 0, _MAGIC, slots)
+        magic, count = _HEADER.unpack_from(self._shm.buf, 0)
+        if magic != _MAGIC or count != slots:
+            self.close()
+            raise RateLimitBackendError(f"shared memory segment {name!r} doesn't have the expected layout")
+
+    def __enter__(self):
+        """Lock the segment for this thread and process."""
+        self._rlock.acquire()  # pylint: disable=consider-using-with
+        fcntl.flock(self._lock_file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Unlock the segment."""
+        fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+        self._rlock.release()
+
+    def state(self, name):
+        """Return the `SharedMemoryState` of the limiter called `name`."""
+        return SharedMemoryState(self, name)
+
+    def slot(self, name):
+        """Return the offset of the slot for `name`, claiming it if needed.
+
+        Callers must hold the segment lock.
+        """
+        ident = int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'little') or 1
+        for probe in range(self.slots):
+            offset = _HEADER.size + (ident + probe) % self.slots * _SLOT.size
+            slot_ident = _IDENT.unpack_from(self._shm.buf, offset)[0]
+            if slot_ident == ident:
+                return offset
+            if not slot_ident:
+                _SLOT.pack_into(self._shm.buf, offset, ident, NEVER, 0, NEVER, math.nan, NEVER, 0)
+                return offset
+        raise RateLimitBackendError(f"shared memory segment {self.name!r} has no free slots for {name!r}")
+
+    def read(self, offset):
+        """Return the `LimiterState` stored at `offset`, caller must hold the segment lock."""
+        state = LimiterState()
+        (_, state.updated, state.counter, state.tat, tokens, state.window,
+         state.previous) = _SLOT.unpack_from(self._shm.buf, offset)
+        state.tokens = None if math.isnan(tokens) else tokens
+        return state
+
+    def write(self, offset, state):
+        """Store a `LimiterState` at `offset`, caller must hold the segment lock."""
+        _FIELDS.pack_into(self._shm.buf, offset + _IDENT.size, state.updated, state.counter, state.tat,
+                          math.nan if state.tokens is None else state.tokens, state.window, state.previous)
+
+    def close(self):
+        """Detach from the segment, leaving it in place for other processes."""
+        self._shm.close()
+        os.close(self._lock_file)
+
+    def unlink(self):
+        """Remove the segment and its lock file, processes still attached keep using their copy."""
+        if not hasattr(self._shm, '_track'):  # Python < 3.13 unregisters on unlink
+            resource_tracker.register(self._shm._name, 'shared_memory')  # pylint: disable=protected-access
+        self._shm.unlink()
+        try:
+            os.unlink(self._lock_path)
+        except FileNotFoundError:
+            pass
+
+
+class SharedMemoryState:
+    """State of one named limiter kept in a `SharedMemorySegment`.
+
+    All engines are supported.  Limiters in any process of the host using
+    the same segment and name share one limit.
+    """
+
+    def __init__(self, segment, name):
+        """Keep state for `name` in `segment`."""
+        self.segment = segment
+        self.name = name
+        self._offset = None
+
+    def acquire(self, engine, max_count, interval, block, n=1):
+        """Satisfy `IRateLimiterBackend`, running `engine` under the segment lock."""
+        if not n:
+            return 0
+        with self.segment:
+            if self._offset is None:
+                self._offset = self.segment.slot(self.name)
+            state = self.segment.read(self._offset)
+            now = clock()
+            slot = engine.reserve(state, now, max_count, interval, block, n)
+            if slot > now and not block:
+                return slot - now  # nothing is written back
+            self.segment.write(self._offset, state)
+        return max(slot - now, 0)
+
+    def __repr__(self):
+        """Identify the segment and name state is kept at."""
+        return f"<{type(self).__name__} {self.segment.name!r} {self.name!r}>"
+
+
+def _attach(name, create=False, size=0):
+    """Open a segment without letting the resource tracker remove it at exit."""
+    try:
+        return shared_memory.SharedMemory(name, create=create, size=size, track=False)  # pylint: disable=E1123
+    except TypeError:  # Python < 3.13
+        shm = shared_memory.SharedMemory(name, create=create, size=size)
+        resource_tracker.unregister(shm._name, 'shared_memory')  # pylint: disable=protected-access
+        return shm
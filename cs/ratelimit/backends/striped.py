@@ -0,0 +1,89 @@
+"""Limiter state leasing permits to the threads calling a limiter.
+
+A `StripedState` hands each thread a lease of permits drawn from the shared
+budget in chunks.  Calls covered by the lease of their thread take no lock
+of the state, only drawing a new lease does, once per `chunk` calls of a
+thread.  Leased calls still count in the stats of the limiter, which are
+kept without a lock as well.
+
+Leases don't make calls cheaper than the one lock of a plain
+`.state.LimiterState` on CPython builds with the GIL, where limiters take
+a fast path for in-memory state.  Measure with ``util/benchmark.py``
+before choosing one over the other.
+
+The shared budget is kept by the engine of the limiter, so no more permits
+are drawn than it allows.  Threads use drawn permits for up to `lease`
+after drawing them though, so calls within an interval may use permits
+drawn in the lease before it.  Any interval thus admits at most
+``max_count * lease / interval`` calls more than the engine itself allows,
+10% with the default lease of a tenth of the interval.
+
+Permits a thread doesn't use within its lease lapse, so this suits limits
+of many calls per interval compared to `chunk` times the number of calling
+threads, e.g. hot callables that only need guarding against runaway rates.
+"""
+import threading
+
+from ..state import LimiterState, clock as monotonic_clock, to_ns
+
+
+class StripedState:
+    """Limiter state leasing permits to threads, see module docstring.
+
+    chunk: number of permits drawn by a thread at once
+    lease: seconds or timedelta a thread may use drawn permits for, None
+           (default) for a tenth of the interval
+    clock: callable returning monotonic nanoseconds that leases expire by,
+           defaults to the clock of the limiter given this state
+    """
+
+    __slots__ = ('chunk', 'lease', 'clock', 'state', '_lock', '_local')
+
+    def __init__(self, chunk=16, lease=None, clock=None):
+        """Create empty shared state, see class docstring for args."""
+        self.chunk = chunk
+        self.lease = lease
+        self.clock = clock if clock is not None else monotonic_clock
+        self.state = LimiterState()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    @property
+    def rlock(self):
+        """Return the lock guarding the shared `state`, e.g. to copy it."""
+        return self._lock
+
+    def acquire(self, engine, max_count, interval, block, n=1):
+        """Take `n` permits from the lease of the calling thread, drawing a new lease when it runs out."""
+        # pylint: disable=too-many-arguments
+        if not max_count or not interval or not n:
+            return 0
+        local = self._local
+        permits = getattr(local, 'permits', 0)
+        if permits >= n and self.clock() < local.expires:
+            local.permits = permits - n
+            return 0
+
+        lease = to_ns(self.lease) if self.lease is not None else interval // 10
+        with self._lock:
+            now = self.clock()
+            if permits and now >= local.expires:
+                permits = 0  # lapsed
+            drawn = 0
+            for wanted in (max(n, self.chunk) - permits, n - permits):  # a full chunk, or just enough for this call
+                if engine.reserve(self.state, now, max_count, interval, False, wanted) <= now:
+                    drawn = wanted
+                    break
+            if drawn:
+                local.expires = now + lease
+                local.permits = permits + drawn - n
+                return 0
+            local.permits = permits
+            slot = engine.reserve(self.state, now, max_count, interval, block, n - permits)
+            if block:  # the leased permits and the slot reserved from the future make up the n permits
+                local.permits = 0
+        return slot - now
+
+    def __repr__(self):
+        """Show the shared state."""
+        return f"<{type(self).__name__} chunk={self.chunk} {self.state!r}>"
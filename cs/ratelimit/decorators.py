@@ -2,13 +2,18 @@
 
 See the README for more info and usage examples.
 """
-from datetime import datetime, timedelta
+from datetime import timedelta
 import functools
+import inspect
 import logging
 import threading
 import time
 
+from .engines import get_engine
 from .exceptions import RateLimitExceeded
+from .instrumentation import Instrumentation, bounded_repr
+from .keyed import KeyedRateLimiter
+from .state import LimiterState, clock as monotonic_clock, to_ns
 
 
 logger = logging.getLogger(__name__)
@@ -21,6 +26,10 @@ def ratelimited(**kwargs):
     initialization values do not limit call rate.  If either max_count
     or interval evaluate to False, call rate is not limited.
 
+    Coroutine functions (``async def``) are detected and wrapped with a
+    coroutine function.  When blocking, these wait with ``asyncio.sleep`` so
+    the event loop keeps running.
+
     Kwargs:
         max_count: maximum integer number of calls per interval
         interval: either int/long/float (seconds) or datetime.timedelta
@@ -29,7 +38,69 @@ def ratelimited(**kwargs):
                   evaluation is determined by Python datetime.timedelta.
         block: True indicates to block if max_count is reached before internal
                rate counter is reset.  If not set, a
-               RateLimitExceeded is raised.
+               RateLimitExceeded is raised.  Blocked calls reserve the next
+               available slot and then sleep without holding the limiter lock,
+               so waiters proceed in the order they arrived.
+        max_wait: longest time blocking calls may wait for their slot, either
+                  int/float (seconds) or datetime.timedelta.  Calls that
+                  would wait longer raise RateLimitExceeded right away, with
+                  the seconds until the slot in its `retry_after`, 0 never
+                  waits.  Defaults to None, waiting as long as needed.
+        engine: algorithm used to limit calls, either the name of one of
+                `.engines.ENGINES` or an engine instance.  Defaults to the
+                'fixed_window' counter.  'token_bucket', 'gcra' and
+                'sliding_window' allow calls at the sustained rate of
+                max_count per interval without bursts at window boundaries.
+        state: mutable limiter state, a `.interfaces.IRateLimiterState`
+               mapping or a `.interfaces.IRateLimiterBackend` provider such
+               as `.backends.redis.RedisState` to share a limit between
+               processes, or `.backends.composite.CompositeState` to
+               enforce more limits on the same calls atomically.
+        key: callable accepting the args and kwargs of a call and returning a
+             hashable key.  Each key is limited independently, with its state
+             kept in `keys` instead of `state`.  The limits of a composite
+             `state` apply to all keys together.
+        keys: `.keyed.KeyedRateLimiter` keeping per-key state, which bounds
+              the number of keys kept.  A default one is created if a key is
+              given without it.
+        cost: number of permits a call takes out of max_count, either an
+              integer or a callable accepting the args and kwargs of a call,
+              e.g. ``lambda batch: len(batch)``, returning one.  Defaults to
+              1.  Any count is charged in constant time.
+        queue: `.queueing.WaiterQueue` admitting blocked calls in priority
+               and arrival order, and turning calls away with
+               RateLimitExceeded once `max_depth` calls wait.  Only calls
+               from threads queue, not coroutines or calls with a key.
+        priority: lane of calls in `queue`, lower lanes are admitted first,
+                  either an integer or a callable accepting the args and
+                  kwargs of a call.  Defaults to 0.
+        oversized: policy for calls costing more permits than the limiter
+                   can hold (max_count, or the burst of the engine).
+                   'reject' (default) raises RateLimitExceeded right away,
+                   as they would never be admitted without waiting.
+                   'clamp' charges them the capacity of the limiter.
+                   'borrow' admits them once the limiter is at capacity and
+                   charges the full cost, delaying the calls that follow.
+        debug: True to log limiter decisions and calls at DEBUG level, False
+               to skip all logging work.  Defaults to logging when this
+               module's logger is enabled for DEBUG.  Can be changed at
+               runtime with ``my_func.ratelimit.debug``.
+        metrics: `.instrumentation.LimiterStats` to count calls in, e.g. the
+                 one of a `RateLimitProperties`.  ``my_func.ratelimit.stats()``
+                 returns the counts of a decorated callable.
+        on_admit, on_reject, on_wait: hooks called for admitted, rejected
+                 and waiting calls, see `.instrumentation.Instrumentation`.
+                 Can be changed at runtime through ``my_func.ratelimit``.
+        adaptive: `.adaptive.AdaptiveLimit` lowering max_count when calls
+                  are throttled and raising it while they succeed.  Calls
+                  report their outcome to it.  Needs a static max_count.
+        clock: callable returning the current time of a monotonic clock in
+               integer nanoseconds, e.g. a `.testing.FakeClock` to simulate
+               traffic without waiting.  Its `sleep` and `asleep` methods
+               are used to wait, when it has them.  Backends shared
+               between processes keep real time, in-memory ones like
+               `.backends.striped.StripedState` take this clock unless
+               given their own.
 
     Use-cases
      * dev decorates class method with/without code-time limits
@@ -53,141 +124,692 @@ def ratelimited(**kwargs):
 
 
 def ratelimitedmethod(*args, **kwargs):
-    """Threadsafe decorator like `ratelimited` but for instance methods."""
+    """Threadsafe decorator like `ratelimited` but for instance methods.
+
+    A `key` callable is passed the instance along with the call args.
+    """
     if args:  # assumes callable producing IRateLimitProperties provider
-        kwargs = {
-            'max_count': lambda self: args[0](self).mapping()['max_count'],
-            'interval': lambda self: args[0](self).mapping()['interval'],
-            'block': lambda self: args[0](self).mapping()['block'],
-            'state': lambda self: args[0](self).mapping()['state'],
-            'rlock': lambda self: args[0](self).mapping()['rlock'],
-        }
+        kwargs = {**kwargs, 'properties': args[0]}
     return functools.partial(_rate_limited_method, **kwargs)
 
 
-def _rate_limited(func, **kwargs):
-    # setup closure params
-    max_count = kwargs['max_count'] if 'max_count' in kwargs else 0
-    interval = kwargs['interval'] if 'interval' in kwargs else timedelta(seconds=0)
-    block = kwargs['block'] if 'block' in kwargs else False
-    state = kwargs['state'] if 'state' in kwargs else None
-    rlock = kwargs['rlock'] if 'rlock' in kwargs else None
-
-    # set appropriate default mutable types for state and lock.
-    if state is None:
-        state = {'updated': datetime.min,
-                 'counter': 0}
-    if rlock is None:
-        rlock = threading.RLock()
-
-    # turn all param access into callables
-    def call(value):
-        return value
-    if not callable(max_count):
-        max_count = functools.partial(call, max_count)
-    if not callable(interval):
-        interval = functools.partial(call, interval)
-    if not callable(block):
-        block = functools.partial(call, block)
-    if not callable(state):
-        state = functools.partial(call, state)
-    if not callable(rlock):
-        rlock = functools.partial(call, rlock)
-
-    @functools.wraps(func)
-    def rate_limited(*args, **kwargs):
-        with rlock():
-            _max_count, _interval, _block, _state = \
-                                    max_count(), interval(), block(), state()
-
-            if not _state['updated']:
-                _state['updated'] = datetime.min
-            if not _state['counter']:
-                _state['counter'] = 0
-
-            if _max_count and _state['counter'] >= _max_count:
-                gap = (_state['updated'] + _interval) - datetime.now()
-                if _interval and gap.total_seconds() > 0:
-                    if not _block:
-                        raise RateLimitExceeded(
-                            f"attempt to exceed rate limit of {func} with {_max_count} calls per "
-                            f"{_interval} timedelta was made.")
-                    logger.debug("Call limit exceeded, sleeping %s seconds", gap.total_seconds())
-                    time.sleep(gap.total_seconds())
-                logger.debug("ratelimit counter reset due to exceeded time interval of %s", _interval)
-                _state['counter'] = 0  # reset
-
-            _state['counter'] += 1
-            _state['updated'] = datetime.now()
-            logger.debug("counter for %s is now %s of %s", rate_limited, _state['counter'], _max_count)
-
-        logger.debug("calling %s with args <%s> and kwargs <%s>", func, args, kwargs)
-        return func(*args, **kwargs)
+# policies for calls costing more permits than a limiter holds
+OVERSIZED = ('reject', 'clamp', 'borrow')
 
-    rate_limited.__wrapped__ = func  # setup external bypass
+_NO_KEY = object()  # permits taken from the limiter state instead of per-key state
+_CONFIGURED = object()  # wait for permits if the limiter blocks
+
+
+class _Setting:
+    """Config attribute of a `RateLimiter`, setting it resolves the config again."""
+
+    def __set_name__(self, owner, name):
+        self.name = '_' + name  # pylint: disable=attribute-defined-outside-init
+
+    def __get__(self, instance, owner=None):
+        return self if instance is None else getattr(instance, self.name)
+
+    def __set__(self, instance, value):
+        previous = getattr(instance, self.name)
+        setattr(instance, self.name, value)
+        try:
+            instance._configure()  # pylint: disable=protected-access
+        except Exception:
+            setattr(instance, self.name, previous)
+            raise
+
+
+class RateLimiter(Instrumentation):  # pylint: disable=too-many-instance-attributes
+    """Threadsafe rate limiter for arbitrary operations.
+
+    Gates anything, e.g. loop iterations, stream chunks or socket writes,
+    without wrapping a callable.  Accepts the same kwargs as `ratelimited`.
+    Config may be changed at runtime by assigning the attributes of the
+    same name.  Config given as callables is called on every use.
+
+    >>> limiter = RateLimiter(max_count=10, interval=timedelta(seconds=1))
+    >>> for chunk in chunks:
+    ...     limiter.acquire(len(chunk))
+    ...     sock.sendall(chunk)
+
+    Used as a (async) context manager, one permit is taken on entry and the
+    limiter waits or raises RateLimitExceeded as configured by `block`.
+    Decorated callables are limited by a RateLimiter, available as
+    ``my_func.ratelimit``.
+    """
+
+    max_count = _Setting()
+    interval = _Setting()
+    block = _Setting()
+    max_wait = _Setting()
+    state = _Setting()
+    rlock = _Setting()
+    engine = _Setting()
+    queue = _Setting()
+    adaptive = _Setting()
+    key = _Setting()
+    cost = _Setting()
+
+    def __init__(self, max_count=0, interval=timedelta(seconds=0), block=False, max_wait=None, state=None,
+                 rlock=None, engine=None, key=None, keys=None, cost=None, oversized='reject', queue=None, priority=0,
+                 metrics=None, debug=None, on_admit=None, on_reject=None, on_wait=None, adaptive=None, clock=None,
+                 properties=None, func=None, method=False):
+        """Create a limiter, see `ratelimited` for kwargs.
+
+        `func` is the callable limited by the limiter, if any, and `method`
+        is True when callable config is passed the instance of a method.
+        `properties` is a callable passed the instance of a method and
+        returning the `.interfaces.IRateLimitProperties` provider whose
+        config is used instead of the config kwargs.
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        super().__init__(debug, None if callable(metrics) else metrics, on_admit, on_reject, on_wait)
+        self._metrics = metrics if callable(metrics) else None
+        self._max_count = max_count
+        self._interval = interval
+        self._block = block
+        self._max_wait = max_wait
+        self._state = state if state is not None else LimiterState()
+        self._rlock = rlock if rlock is not None else threading.RLock()
+        self._engine = engine
+        self._queue = queue
+        self._clock = clock if clock is not None else monotonic_clock
+        self._sleep = getattr(clock, 'sleep', time.sleep)
+        self._asleep = getattr(clock, 'asleep', _asyncio_sleep)
+        self._properties = properties
+        self._adaptive = adaptive
+        self._derived = (None, None)  # settings and values last derived from them by `_resolve`
+        self.priority = priority
+        self._key = key
+        self.keys = keys if keys is not None or key is None else KeyedRateLimiter(clock=self._clock)
+        if oversized not in OVERSIZED:
+            raise ValueError(f"unknown oversized policy {oversized!r}, expected one of {OVERSIZED}")
+        self._cost = cost
+        self.oversized = oversized
+        self.func = func
+        self.method = method
+        self._subject = func if func is not None else self
+        if adaptive is not None and not callable(adaptive):
+            if callable(max_count):
+                raise ValueError("adaptive needs a static max_count to adjust, not a callable")
+            adaptive.bind(self)
+        self._configure()
+
+    def _configure(self):
+        """Resolve static config once, so that it costs nothing per use."""
+        config = (self._max_count, self._interval, self._block, self._max_wait, self._state, self._rlock,
+                  self._engine, self._queue, self._adaptive)
+        dynamic = (any(callable(value) for value in config) or self._properties is not None
+                   or self._metrics is not None)
+        if dynamic and not callable(self._engine):
+            get_engine(self._engine)  # validate
+        if self._cost is not None and not callable(self._cost) and (not isinstance(self._cost, int) or self._cost < 0):
+            raise ValueError(f"expected a cost of at least 0 permits or a callable, got {self._cost!r}")
+        if self._clock is not monotonic_clock and getattr(self._state, 'clock', None) is monotonic_clock:
+            self._state.clock = self._clock  # in-memory backends, e.g. striped state leases, keep the same time
+        fast = None
+        if not dynamic:
+            self._config = (self._max_count, to_ns(self._interval), _blocking(self._block, self._max_wait),
+                            self._state, self._rlock, get_engine(self._engine), _is_backend(self._state), self._queue,
+                            None, self._adaptive)
+            simple = all(value is None for value in (self._key, self._cost, self._queue, self._adaptive))
+            if simple and not self._config[2] and isinstance(self._state, LimiterState):
+                fast = self._fast_take(*self._config[:6])
+        self._dynamic = dynamic
+        self._fast = fast
+
+    def _fast_take(self, max_count, interval, blocking, state, rlock, engine):
+        """Return a function taking the permit of a call when config is static and simple.
+
+        Calls without key, cost, queue, backend or adaptive limit, waiting
+        as long as needed or not at all, take one permit from in-memory
+        state: one lock, one clock read and one engine reservation.  The
+        wrappers of `_wrap` call it instead of `_call` when not debugging.
+        Returns the seconds to wait, raises RateLimitExceeded.
+        """
+        # pylint: disable=too-many-arguments
+        clock, reserve, subject, block = self._clock, engine.reserve, self._subject, blocking is None
+
+        def take():
+            with rlock:
+                now = clock()
+                delay = reserve(state, now, max_count, interval, block) - now
+            if delay <= 0:
+                self.admit(subject, 0)
+                return 0
+            if not block:
+                self._refuse(delay, max_count, interval, None, True)
+            self.admit(subject, delay / 1e9)
+            return delay / 1e9
+        return take
+
+    def _resolve(self, bound):
+        """Return config given as callables or `properties` for one use, `bound` holds the instance of a method."""
+        # pylint: disable=too-many-locals
+        if self._properties is not None:
+            # one provider lookup per use, whatever the number of settings
+            properties = self._properties(*bound)
+            max_count, interval, block, state, rlock = (properties.max_count, properties.interval, properties.block,
+                                                        properties.state, properties.rlock)
+            max_wait, engine, queue, metrics, adaptive = (
+                getattr(properties, 'max_wait', None), getattr(properties, 'engine', None),
+                getattr(properties, 'queue', None), getattr(properties, 'metrics', None),
+                getattr(properties, 'adaptive', None))
+        else:
+            max_count, interval, block, max_wait, state, rlock, engine, queue, adaptive = (
+                value(*bound) if callable(value) else value
+                for value in (self._max_count, self._interval, self._block, self._max_wait, self._state, self._rlock,
+                              self._engine, self._queue, self._adaptive))
+            metrics = self._metrics(*bound) if self._metrics is not None else None
+        settings = (interval, block, max_wait, engine)
+        derived = self._derived
+        if derived[0] != settings:  # usually the same for all instances of a method
+            derived = self._derived = (settings, (to_ns(interval), _blocking(block, max_wait), get_engine(engine)))
+        interval, blocking, engine = derived[1]
+        return max_count, interval, blocking, state, rlock, engine, _is_backend(state), queue, metrics, adaptive
+
+    def _interval_ns(self):
+        """Return the interval in nanoseconds, the one last resolved when given as a callable, None before that."""
+        if not self._dynamic:
+            return self._config[1]
+        derived = self._derived[1]
+        return derived[0] if derived is not None else None
+
+    def _debugging(self):
+        debug = self.debug
+        return logger.isEnabledFor(logging.DEBUG) if debug is None else debug
+
+    def try_acquire(self, n=1, key=_NO_KEY):
+        """Take `n` permits if they are available right now, returning True if they were taken.
+
+        `key` selects the per-key state kept in `keys`.
+        """
+        return not self._take(n, 0, (), key, self._debugging(), False)
+
+    def acquire(self, n=1, timeout=None, key=_NO_KEY, priority=0):
+        """Take `n` permits, sleeping until they may be used.
+
+        Returns False without taking permits if they aren't available
+        within `timeout` (seconds or timedelta) or the `queue` is full, True
+        otherwise.  `priority` is the lane of the caller in the `queue`.
+        """
+        delay = self._take(n, None if timeout is None else to_ns(timeout), (), key, self._debugging(), False,
+                           priority)
+        if delay < 0:
+            return False
+        if delay:
+            self._sleep(delay)
+        return True
+
+    def reserve(self, n=1, key=_NO_KEY):
+        """Take `n` permits without waiting, returning the seconds until they may be used.
+
+        The permits are reserved, callers must wait for the returned delay
+        before using them.
+        """
+        return self._take(n, None, (), key, self._debugging(), False)
+
+    def acquire_many(self, n, key=_NO_KEY):
+        """Take up to `n` permits available right now in one locked operation, returning how many were taken."""
+        return len(self._take_each([1] * n, 0, (), key, self._debugging()))
+
+    def reserve_many(self, n, key=_NO_KEY):
+        """Take `n` permits in one locked operation, returning the seconds until each may be used.
+
+        Permits not available right now are reserved from future slots like
+        `reserve`, the delays are in the order the slots come.
+        """
+        return self._take_each([1] * n, None, (), key, self._debugging())
+
+    def map(self, *iterables, chunk=64):
+        """Yield the results of calling the limited callable with the items of `iterables`, like `map`.
+
+        Permits for up to `chunk` items are taken in one locked operation.
+        Items admitted right away are yielded first, the others are given
+        future slots and yielded once their slot comes, whatever `block` is.
+        Limiters that don't limit a callable yield the items themselves, or
+        tuples of them for several iterables.  For methods the first
+        iterable gives the instances, e.g. ``itertools.repeat(obj)``.
+
+        Permits reserved for items that aren't consumed are lost, so use a
+        small `chunk` when the consumer may stop early.  Calls report to the
+        adaptive limit, if any.  Coroutine functions raise TypeError, pace
+        their calls with `.pacing.apaced` instead.
+        """
+        if not iterables:
+            raise TypeError("map() must have at least one iterable")
+        if inspect.iscoroutinefunction(self.func):
+            raise TypeError(f"map() would block the event loop calling coroutine function {self.func!r}, "
+                            "pace its calls with apaced() instead")
+        return self._map(iterables, chunk)
+
+    def _map(self, iterables, chunk):
+        """Yield the results of `map`."""
+        single = len(iterables) == 1
+        batch, bound, key = [], (), _NO_KEY
+        for args in zip(*iterables):
+            args_bound = args[:1] if self.method else ()
+            args_key = self._key(*args) if self._key is not None else _NO_KEY
+            # a batch shares its config and state, so it ends where those may change
+            if batch and (len(batch) >= chunk or args_key != key or (bound and args_bound[0] is not bound[0])):
+                yield from self._map_batch(batch, bound, key, single)
+                batch = []
+            batch.append(args)
+            bound, key = args_bound, args_key
+        if batch:
+            yield from self._map_batch(batch, bound, key, single)
+
+    def _map_batch(self, batch, bound, key, single):
+        """Take the permits of a batch of `map` items, yielding each once its slot comes."""
+        config = self._resolve(bound) if self._dynamic else self._config
+        delays = self._take_each([self._permits(args, {}) for args in batch], None, bound, key, self._debugging(),
+                                 config)
+        start = self._clock()
+        func, adaptive = self.func, config[9]
+        for args, delay in zip(batch, delays):
+            pause = delay - (self._clock() - start) / 1e9
+            if pause > 0:
+                self._sleep(pause)
+            if func is not None:
+                yield func(*args) if adaptive is None else self._adapt(adaptive, func, args, {})
+            else:
+                yield args[0] if single else args
+
+    def __enter__(self):
+        """Take a permit, waiting for it or raising RateLimitExceeded as configured."""
+        delay = self._take(1, _CONFIGURED, (), _NO_KEY, self._debugging(), True, 0)
+        if delay:
+            self._sleep(delay)
+        return self
+
+    def __exit__(self, *exc_info):
+        """Permits aren't returned."""
+
+    async def __aenter__(self):
+        """Take a permit like `__enter__`, waiting without blocking the event loop."""
+        delay = self._take(1, _CONFIGURED, (), _NO_KEY, self._debugging(), True)
+        if delay:
+            await self._asleep(delay)
+        return self
+
+    async def __aexit__(self, *exc_info):
+        """Permits aren't returned."""
+
+    def _call(self, args, kwargs, debug, queued=True):
+        """Take the permits of a call of the limited callable.
+
+        Returns the seconds to wait and the `.adaptive.AdaptiveLimit` the
+        outcome of the call is reported to, if any.  Calls from coroutines
+        aren't `queued`, waiting in the queue would block the event loop.
+        """
+        key = self._key(*args, **kwargs) if self._key is not None else _NO_KEY
+        bound = args[:1] if self.method else ()
+        config = self._resolve(bound) if self._dynamic else self._config
+        priority = None
+        if queued and config[7] is not None:
+            priority = self.priority(*args, **kwargs) if callable(self.priority) else self.priority
+        return self._take(self._permits(args, kwargs), _CONFIGURED, bound, key, debug, True, priority, config), config[9]
+
+    def _permits(self, args, kwargs):
+        """Return the number of permits a call of the limited callable takes."""
+        cost = self._cost
+        if cost is None:
+            return 1
+        if callable(cost):
+            return cost(*args, **kwargs)
+        return cost
+
+    def _adapt(self, adaptive, func, args, kwargs):
+        """Call `func` reporting its outcome to `adaptive`."""
+        start = self._clock()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as error:
+            adaptive.failed(error)
+            raise
+        adaptive.observe((self._clock() - start) / 1e9)
+        return result
+
+    async def _aadapt(self, adaptive, func, args, kwargs):
+        """Await `func` reporting its outcome to `adaptive`."""
+        start = self._clock()
+        try:
+            result = await func(*args, **kwargs)
+        except Exception as error:
+            adaptive.failed(error)
+            raise
+        adaptive.observe((self._clock() - start) / 1e9)
+        return result
+
+    def _take(self, n, wait, bound, key, debug, strict, priority=None, config=None):
+        """Take `n` permits, returning the seconds until they may be used.
+
+        wait: nanoseconds callers may wait for permits, None to wait as long
+              as needed or _CONFIGURED to wait as configured by `block` and
+              `max_wait`.
+        bound: args for config given as callables
+        key: key of the per-key state to use, or _NO_KEY
+        strict: True raises RateLimitExceeded when the permits aren't
+                available within `wait`, otherwise the negated delay is
+                returned.  No permits are taken in that case.
+        priority: lane in the `queue` of callers waiting in this thread for
+                  the permits, None for callers that don't wait here
+        config: config already resolved for `bound`
+        """
+        # pylint: disable=too-many-arguments,too-many-locals,too-many-branches
+        if config is None:
+            config = self._resolve(bound) if self._dynamic else self._config
+        max_count, interval, blocking, state, rlock, engine, backend, queue, metrics, _ = config
+        if wait is _CONFIGURED:
+            wait = blocking
+        extra = 0
+        if n != 1:
+            n, extra = self._oversized(n, max_count, interval, engine)
+
+        if key is not _NO_KEY:
+            with self.keys.rlock(key):
+                keyed = self.keys.state(key)
+                if backend and hasattr(state, 'child'):  # per-key limit nested under a composite
+                    delay = _acquire(engine, state.child(keyed), max_count, interval, n, wait, extra)
+                else:
+                    delay = _reserve(engine, keyed, max_count, interval, n, wait, extra, self._clock)
+                if debug:
+                    self._log(delay, wait, keyed, max_count)
+        elif queue is not None and priority is not None and wait != 0:
+            take = functools.partial(self._take_now, engine, state, rlock, backend, max_count, interval, n, extra, debug)
+            return self._wait_turn(queue, take, priority, wait, metrics, strict, max_count, interval)
+        elif backend:
+            delay = _acquire(engine, state, max_count, interval, n, wait, extra)
+            if debug:
+                self._log(delay, wait, state, max_count)
+        else:
+            with rlock:
+                delay = _reserve(engine, state, max_count, interval, n, wait, extra, self._clock)
+                if debug:
+                    self._log(delay, wait, state, max_count)
+
+        if wait is not None and delay > wait:
+            return self._refuse(delay, max_count, interval, metrics, strict)
+        seconds = delay / 1e9 if delay > 0 else 0
+        self.admit(self._subject, seconds, metrics)
+        return seconds
+
+    def _refuse(self, delay, max_count, interval, metrics, strict):
+        """Reject a call whose permits come in `delay` nanoseconds, see `_take` for args."""
+        # pylint: disable=too-many-arguments
+        if strict:
+            error = RateLimitExceeded(retry_after=delay / 1e9, limit=max_count,
+                                      interval=_timedelta(interval), limiter=self._subject)
+            self.reject(self._subject, error, metrics)
+            raise error
+        self.reject(self._subject, None, metrics)
+        return -delay / 1e9
+
+    def _take_each(self, costs, wait, bound, key, debug, config=None):  # pylint: disable=R0913,R0914
+        """Take the permits of each of `costs` in one locked operation, returning the seconds until each may be used.
+
+        wait: None to reserve future slots for all of them, or 0 to stop at
+              the first not available right now, so fewer delays are returned
+        See `_take` for other args.
+        """
+        if config is None:
+            config = self._resolve(bound) if self._dynamic else self._config
+        max_count, interval, _, state, rlock, engine, backend, _, metrics, _ = config
+        permits = [(1, 0) if n == 1 else self._oversized(n, max_count, interval, engine) for n in costs]
+
+        if key is not _NO_KEY:
+            with self.keys.rlock(key):
+                keyed = self.keys.state(key)
+                state = state.child(keyed) if backend and hasattr(state, 'child') else keyed
+                delays = _reserve_each(engine, state, max_count, interval, permits, wait, self._clock)
+        elif backend:
+            delays = _reserve_each(engine, state, max_count, interval, permits, wait, self._clock)
+        else:
+            with rlock:
+                delays = _reserve_each(engine, state, max_count, interval, permits, wait, self._clock)
+        if debug:
+            logger.debug("%s of %s permits reserved, state for ratelimit %s is now %s with max count of %s",
+                         len(delays), len(permits), self._subject, state, max_count)
+
+        seconds = [delay / 1e9 if delay > 0 else 0 for delay in delays]
+        for wait_seconds in seconds:
+            self.admit(self._subject, wait_seconds, metrics)
+        if len(delays) < len(permits):
+            self.reject(self._subject, None, metrics)
+        return seconds
+
+    def _take_now(self, engine, state, rlock, backend, max_count, interval, n, extra, debug):
+        """Take `n` permits for a queued caller if available right now, see `.queueing.WaiterQueue.wait`."""
+        # pylint: disable=too-many-arguments
+        if backend:
+            delay = _acquire(engine, state, max_count, interval, n, 0, extra)
+        else:
+            with rlock:
+                delay = _reserve(engine, state, max_count, interval, n, 0, extra, self._clock)
+        if debug:
+            self._log(delay, 0, state, max_count)
+        return delay
+
+    def _wait_turn(self, queue, take, priority, wait, metrics, strict, max_count, interval):
+        """Wait in `queue` until `take` admits the caller, see `_take` for args."""
+        # pylint: disable=too-many-arguments
+        if self._clock is monotonic_clock:
+            waited = queue.wait(take, priority, wait)
+        else:
+            waited = queue.wait(take, priority, wait, self._clock, self._sleep)
+        if waited is None:  # the queue is full, when permits come isn't known
+            if strict:
+                error = RateLimitExceeded(limit=max_count, interval=_timedelta(interval),
+                                          limiter=self._subject)
+                self.reject(self._subject, error, metrics)
+                raise error
+            self.reject(self._subject, None, metrics)
+            return -1e-9
+        if waited < 0:
+            return self._refuse(-waited, max_count, interval, metrics, strict)
+        self.admit(self._subject, waited / 1e9 if waited > 0 else 0, metrics)
+        return 0
+
+    def _oversized(self, n, max_count, interval, engine):
+        """Apply the oversized policy to `n` permits, returning the permits to take now and to borrow."""
+        if not isinstance(n, int) or n < 0:
+            raise ValueError(f"expected a permit count of at least 0, got {n!r}")
+        capacity = getattr(engine, 'burst', None) or max_count
+        if n <= capacity or not max_count or not interval:
+            return n, 0
+        if self.oversized == 'clamp':
+            return capacity, 0
+        if self.oversized == 'borrow':
+            return capacity, n - capacity
+        raise RateLimitExceeded(
+            f"attempt to take {n} permits from {self._subject}, which holds at most {capacity} permits.",
+            limit=max_count, interval=_timedelta(interval), limiter=self._subject)
+
+    def _log(self, delay, wait, state, max_count):
+        if wait is not None and delay > wait:
+            return
+        if delay > 0:
+            logger.debug("Call limit exceeded, sleeping %s seconds", delay / 1e9)
+            logger.debug("call slot reserved %s seconds ahead", delay / 1e9)
+        logger.debug("state for ratelimit %s is now %s with max count of %s", self._subject, state, max_count)
+
+    def __repr__(self):
+        """Identify the limited callable, if any."""
+        if self.func is None:
+            return f"<{type(self).__name__} at {id(self):#x}>"
+        return f"<{type(self).__name__} of {self.func!r}>"
+
+
+def _reserve(engine, state, max_count, interval, n, wait, extra=0, clock=monotonic_clock):
+    """Reserve `n` permits in `state` at the time of `clock`, caller must hold the limiter lock.
+
+    Returns the nanoseconds until the permits may be used.  The permits are
+    only taken when that is at most `wait` nanoseconds, or any time when
+    `wait` is None.  In that case `extra` permits are also taken from the
+    future, delaying later callers.  Blocking callers are given slots in the
+    order they reserve them and wait for them without the lock held.
+    """
+    # pylint: disable=too-many-arguments
+    if not isinstance(state, LimiterState):  # IRateLimiterState mapping holding datetime values
+        _state = LimiterState.from_mapping(state)
+        delay = _reserve(engine, _state, max_count, interval, n, wait, extra, clock)
+        if wait is None or delay <= wait:
+            _state.to_mapping(state)
+        return delay
+
+    if extra:
+        delay = _reserve(engine, state, max_count, interval, n, wait, 0, clock)
+        if wait is None or delay <= wait:
+            _reserve(engine, state, max_count, interval, extra, None, 0, clock)
+        return delay
+    if not n:
+        return 0
+    now = clock()
+    if not wait:
+        return engine.reserve(state, now, max_count, interval, wait is None, n) - now
+    snapshot = state.copy()
+    slot = engine.reserve(state, now, max_count, interval, True, n)
+    if slot - now > wait:
+        state.restore(snapshot)
+    return slot - now
+
+
+def _reserve_each(engine, state, max_count, interval, permits, wait, clock=monotonic_clock):
+    """Reserve each of `permits`, (n, extra) pairs, like `_reserve`, returning their delays.
+
+    With `wait` 0 reserving stops at the first permits not available right
+    now, so fewer delays than permits are returned.
+    """
+    # pylint: disable=too-many-arguments
+    if _is_backend(state):
+        reserve = _acquire
+    elif not isinstance(state, LimiterState):
+        _state = LimiterState.from_mapping(state)
+        delays = _reserve_each(engine, _state, max_count, interval, permits, wait, clock)
+        _state.to_mapping(state)
+        return delays
+    else:
+        reserve = functools.partial(_reserve, clock=clock)
+    delays = []
+    for n, extra in permits:
+        delay = reserve(engine, state, max_count, interval, n, wait, extra)
+        if wait is not None and delay > wait:
+            break
+        delays.append(delay)
+    return delays
+
+
+def _acquire(engine, state, max_count, interval, n, wait, extra=0):  # pylint: disable=too-many-arguments
+    """Reserve permits like `_reserve` in a `.interfaces.IRateLimiterBackend`.
+
+    Backends don't need the limiter lock.  Waits limited to some time take
+    two round-trips, so other processes may take permits in between and
+    make the wait slightly longer than `wait`.
+    """
+    if extra:
+        delay = _acquire(engine, state, max_count, interval, n, wait)
+        if wait is None or delay <= wait:
+            state.acquire(engine, max_count, interval, True, extra)
+        return delay
+    if not wait:
+        return state.acquire(engine, max_count, interval, wait is None, n)
+    delay = state.acquire(engine, max_count, interval, False, n)
+    if 0 < delay <= wait:
+        delay = state.acquire(engine, max_count, interval, True, n)
+    return delay
 
+
+@functools.lru_cache(maxsize=64)
+def _timedelta(interval):
+    """Return the timedelta of `interval` nanoseconds, cached for rejecting calls cheaply."""
+    return timedelta(microseconds=interval // 1000)
+
+
+def _blocking(block, max_wait):
+    """Return the nanoseconds calls wait for permits with `block` and `max_wait`, None to wait as needed."""
+    if not block:
+        return 0
+    if max_wait is None:
+        return None
+    return to_ns(max_wait)  # 0 doesn't wait at all, like acquire(timeout=0)
+
+
+async def _asyncio_sleep(seconds):
+    """Sleep with ``asyncio.sleep``, importing asyncio only in code running coroutines, which has it already."""
+    import asyncio  # pylint: disable=import-outside-toplevel
+    await asyncio.sleep(seconds)
+
+
+def _is_backend(state):
+    """Return True for `.interfaces.IRateLimiterBackend` states, which don't need the limiter lock."""
+    return not isinstance(state, LimiterState) and hasattr(state, 'acquire')
+
+
+def _wrap(func, limiter):
+    """Return a wrapper calling `func` once `limiter` admits the call."""
+    wrap = _wrap_coroutine if inspect.iscoroutinefunction(func) else _wrap_function
+    rate_limited = functools.wraps(func)(wrap(func, limiter))
+    rate_limited.__wrapped__ = func  # setup external bypass
+    rate_limited.ratelimit = limiter  # runtime access to the limiter
     return rate_limited
 
 
-def _rate_limited_method(func, **kwargs):
-    # setup closure params
-    max_count = kwargs['max_count'] if 'max_count' in kwargs else 0
-    interval = kwargs['interval'] if 'interval' in kwargs else timedelta(seconds=0)
-    block = kwargs['block'] if 'block' in kwargs else False
-    state = kwargs['state'] if 'state' in kwargs else None
-    rlock = kwargs['rlock'] if 'rlock' in kwargs else None
-
-    # set appropriate default mutable types for state and lock.
-    if state is None:
-        state = {'updated': datetime.min,
-                 'counter': 0}
-    if rlock is None:
-        rlock = threading.RLock()
-
-    # turn all param access into callables
-    def call(value, _):
-        return value
-    if not callable(max_count):
-        max_count = functools.partial(call, max_count)
-    if not callable(interval):
-        interval = functools.partial(call, interval)
-    if not callable(block):
-        block = functools.partial(call, block)
-    if not callable(state):
-        state = functools.partial(call, state)
-    if not callable(rlock):
-        rlock = functools.partial(call, rlock)
-
-    @functools.wraps(func)
+def _wrap_function(func, limiter):
+    """Return the wrapper of a plain callable, see `_wrap`."""
     def rate_limited(*args, **kwargs):
-        self = args[0]
-        with rlock(self):
-            _max_count, _interval, _block, _state = \
-                                max_count(self), interval(self), block(self), state(self)
-
-            if not _state['updated']:
-                _state['updated'] = datetime.min
-            if not _state['counter']:
-                _state['counter'] = 0
-
-            if _max_count and _state['counter'] >= _max_count:
-                gap = (_state['updated'] + _interval) - datetime.now()
-                if _interval and gap.total_seconds() > 0:
-                    if not _block:
-                        raise RateLimitExceeded(
-                            f"attempt to exceed rate limit of {func} with {_max_count} calls per "
-                            f"{_interval} timedelta was made.")
-                    logger.debug("Call limit exceeded, sleeping %s seconds", gap.total_seconds())
-                    time.sleep(gap.total_seconds())
-                logger.debug("ratelimit counter reset due to exceeded time interval of %s", _interval)
-                _state['counter'] = 0  # reset
-
-            _state['counter'] += 1
-            _state['updated'] = datetime.now()
-            logger.debug("state for ratelimit %s is now %s with max count of %s", rate_limited, _state, _max_count)
-
-        logger.debug("calling %s with args <%s> and kwargs <%s>", func, args, kwargs)
+        debug = limiter.debug
+        if debug is None:
+            debug = logger.isEnabledFor(logging.DEBUG)
+        take = limiter._fast  # pylint: disable=protected-access
+        if take is not None and not debug:
+            gap = take()
+            if gap:
+                limiter._sleep(gap)  # pylint: disable=protected-access
+            return func(*args, **kwargs)
+        gap, adaptive = limiter._call(args, kwargs, debug)  # pylint: disable=protected-access
+        if gap:
+            limiter._sleep(gap)  # pylint: disable=protected-access
+
+        if debug:
+            logger.debug("calling %s with args <%s> and kwargs <%s>", func, bounded_repr(args), bounded_repr(kwargs))
+        if adaptive is not None:
+            return limiter._adapt(adaptive, func, args, kwargs)  # pylint: disable=protected-access
         return func(*args, **kwargs)
+    return rate_limited
 
-    rate_limited.__wrapped__ = func  # setup external bypass
+
+def _wrap_coroutine(func, limiter):
+    """Return the wrapper of a coroutine function, waiting with the event loop running, see `_wrap`."""
+    async def rate_limited(*args, **kwargs):
+        debug = limiter.debug
+        if debug is None:
+            debug = logger.isEnabledFor(logging.DEBUG)
+        take = limiter._fast  # pylint: disable=protected-access
+        if take is not None and not debug:
+            gap = take()
+            if gap:
+                await limiter._asleep(gap)  # pylint: disable=protected-access
+            return await func(*args, **kwargs)
+        gap, adaptive = limiter._call(args, kwargs, debug, False)  # pylint: disable=protected-access
+        if gap:
+            await limiter._asleep(gap)  # pylint: disable=protected-access
+
+        if debug:
+            logger.debug("calling %s with args <%s> and kwargs <%s>", func, bounded_repr(args), bounded_repr(kwargs))
+        if adaptive is not None:
+            return await limiter._aadapt(adaptive, func, args, kwargs)  # pylint: disable=protected-access
+        return await func(*args, **kwargs)
     return rate_limited
+
+
+# kwargs of the decorators, others (e.g. of IRateLimitProperties providers) are ignored
+_LIMITER_KWARGS = frozenset(inspect.signature(RateLimiter).parameters) - {'func', 'method'}
+
+
+def _rate_limited(func, **kwargs):
+    return _wrap(func, RateLimiter(func=func, **{k: v for k, v in kwargs.items() if k in _LIMITER_KWARGS}))
+
+
+def _rate_limited_method(func, **kwargs):
+    return _wrap(func, RateLimiter(func=func, method=True,
+                                   **{k: v for k, v in kwargs.items() if k in _LIMITER_KWARGS}))
@@ -0,0 +1,203 @@
+"""Rate limiting algorithms that can be selected for limiters.
+
+Engines are stateless strategy objects.  All mutable data lives in the
+limiter state (see `.state.LimiterState`), so an engine instance can be
+safely shared between any number of limiters.  Each engine does a constant
+amount of integer work per call, with times and intervals given as
+nanoseconds of `.state.clock`.  Engines take `n` permits at once, as if
+reserved one after another, so weighted calls cost no more than others.
+
+Every engine stores the time of the most recent admitted (or reserved) call
+in `state.updated`.  New calls are never given a slot ahead of that time,
+which keeps blocked callers in FIFO order.
+"""
+from .state import NEVER
+
+
+class FixedWindow:  # pylint: disable=too-few-public-methods
+    """Allow max_count calls, then wait for interval after the last one.
+
+    This is the original cs.ratelimit algorithm and the default engine.
+    """
+
+    name = 'fixed_window'
+
+    def reserve(self, state, now, max_count, interval, block, n=1):
+        """Return the time the next call, taking `n` (at least 1) permits, may run at.
+
+        The slot is committed to `state` when it is not after `now` or
+        when `block` is True, otherwise `state` is left untouched.
+        """
+        # pylint: disable=too-many-arguments
+        slot = max(now, state.updated)  # never ahead of slots already reserved
+        counter = state.counter
+        if max_count and counter >= max_count:
+            counter = 0
+            if interval:
+                slot = max(slot, state.updated + interval)
+        counter += n
+        if max_count and counter > max_count:  # the last permits spill into later windows
+            windows = -(-counter // max_count) - 1
+            counter -= windows * max_count
+            slot += windows * interval
+        if slot > now and not block:
+            return slot
+
+        state.counter = counter
+        state.updated = slot
+        return slot
+
+
+class TokenBucket:  # pylint: disable=too-few-public-methods
+    """Refill tokens at max_count per interval, holding at most `burst` tokens.
+
+    `burst` defaults to max_count.  Blocked callers borrow tokens from the
+    future, so the bucket level can drop below zero while calls wait.
+    """
+
+    name = 'token_bucket'
+
+    def __init__(self, burst=None):
+        """Set the bucket capacity, defaults to the max_count of the limiter."""
+        self.burst = burst
+
+    def reserve(self, state, now, max_count, interval, block, n=1):
+        """Return the time the next call may run at, see `FixedWindow.reserve`."""
+        # pylint: disable=too-many-arguments
+        if not max_count or not interval:
+            return now
+        capacity = self.burst or max_count
+
+        slot = max(now, state.updated)
+        tokens = state.tokens
+        if tokens is None or state.updated == NEVER:
+            tokens = capacity
+        else:
+            tokens = min(capacity, tokens + (slot - state.updated) * max_count / interval)
+        if tokens < n:
+            slot += -int((tokens - n) * interval // max_count)  # ceil of the wait for the missing tokens
+            tokens = n
+        if slot > now and not block:
+            return slot
+
+        state.tokens = tokens - n
+        state.updated = slot
+        return slot
+
+
+class GCRA:  # pylint: disable=too-few-public-methods
+    """Generic cell rate algorithm, a token bucket tracked by one timestamp.
+
+    Calls are spaced interval / max_count apart on average with up to
+    `burst` calls (default max_count) allowed back to back.  The theoretical
+    arrival time of the next call is kept in `state.tat`.
+    """
+
+    name = 'gcra'
+
+    def __init__(self, burst=None):
+        """Set the burst size, defaults to the max_count of the limiter."""
+        self.burst = burst
+
+    def reserve(self, state, now, max_count, interval, block, n=1):
+        """Return the time the next call may run at, see `FixedWindow.reserve`."""
+        # pylint: disable=too-many-arguments
+        if not max_count or not interval:
+            return now
+        emission = -(-interval // max_count)  # rounded up, never faster than the limit
+        tolerance = emission * ((self.burst or max_count) - 1)
+
+        tat = max(now, state.tat)
+        slot = max(now, tat + (n - 1) * emission - tolerance)
+        if slot > now and not block:
+            return slot
+
+        state.tat = tat + n * emission
+        state.updated = slot
+        return slot
+
+
+class SlidingWindow:  # pylint: disable=too-few-public-methods
+    """Sliding window counter weighing the previous window by its overlap.
+
+    The call count over the trailing interval is estimated from the counts of
+    the current and previous fixed windows, which avoids the 2x max_count
+    bursts a fixed window allows at window boundaries.  The current window
+    start and previous window count are kept in `state.window` and
+    `state.previous`.
+    """
+
+    name = 'sliding_window'
+
+    def reserve(self, state, now, max_count, interval, block, n=1):
+        """Return the time the next call may run at, see `FixedWindow.reserve`.
+
+        Permits fill one window after the other.  Once a full window
+        follows a full one, every further window takes the same count, so
+        those are skipped at once and this takes at most a few steps.
+        """
+        # pylint: disable=too-many-arguments,too-many-locals
+        if not max_count or not interval:
+            return now
+
+        slot = max(now, state.updated)
+        window, counter, previous = _roll(
+            state.window if state.window != NEVER else slot, state.counter, state.previous, slot, interval)
+        # after a full window each window takes max_count - 1 permits, or one every other window for max_count 1
+        per, span = (max_count - 1, 1) if max_count > 1 else (1, 2)
+        while True:
+            if not counter and n > per and previous == max_count - 1:
+                skipped = (n - 1) // per
+                window += skipped * span * interval
+                n -= skipped * per
+                slot = max(slot, window)
+            # a decaying previous window keeps the estimate above max_count - 1 until the window ends
+            taken = min(n, max_count - counter - (1 if previous else 0))
+            if taken > 0:
+                over = previous - max_count + counter + taken
+                if over > 0:  # earliest time the previous window has decayed enough to make room
+                    slot = max(slot, window + -(-interval * over // previous))
+                counter += taken
+                n -= taken
+            if n <= 0:
+                break
+            window, counter, previous = window + interval, 0, counter  # window full, go on in the next one
+            slot = max(slot, window)
+        if slot > now and not block:
+            return slot
+
+        state.window, state.counter, state.previous = window, counter, previous
+        state.updated = slot
+        return slot
+
+
+def _roll(window, counter, previous, now, interval):
+    """Advance a sliding window so that it contains `now`."""
+    elapsed = (now - window) // interval
+    if elapsed >= 1:
+        previous = counter if elapsed == 1 else 0
+        counter = 0
+        window += elapsed * interval
+    return window, counter, previous
+
+
+ENGINES = {engine.name: engine() for engine in (FixedWindow, TokenBucket, GCRA, SlidingWindow)}
+
+
+def get_engine(engine=None, **options):
+    """Return an engine instance for a registered engine name or instance.
+
+    None selects the default `FixedWindow` engine.  Named engines use their
+    default settings unless `options` (e.g. burst) are given to create a new
+    instance with.
+    """
+    if engine is None:
+        engine = FixedWindow.name
+    if isinstance(engine, str):
+        try:
+            engine = ENGINES[engine]
+        except KeyError:
+            raise ValueError(f"unknown rate limit engine {engine!r}, expected one of {sorted(ENGINES)}") from None
+        if options:
+            engine = type(engine)(**options)
+    return engine
@@ -6,4 +6,33 @@ class RateLimitError(Exception):
 
 
 class RateLimitExceeded(RateLimitError):
-    """A rate limit has been exceeded."""
+    """A rate limit has been exceeded.
+
+    retry_after: seconds until the call could be made, None when unknown
+    limit: maximum number of calls per interval of the exceeded limit
+    interval: datetime.timedelta of the exceeded limit
+    limiter: the limited callable, or the `.decorators.RateLimiter` of
+             other code
+
+    Without a message, one is only formatted from these when the error is
+    shown, so rejecting calls costs little.
+    """
+
+    def __init__(self, *args, retry_after=None, limit=None, interval=None, limiter=None):
+        """Create the error, see class docstring for kwargs."""
+        super().__init__(*args)
+        self.retry_after = retry_after
+        self.limit = limit
+        self.interval = interval
+        self.limiter = limiter
+
+    def __str__(self):
+        """Return the message, formatting it from the limit when none was given."""
+        if self.args:
+            return super().__str__()
+        return (f"attempt to exceed rate limit of {self.limiter} with {self.limit} calls per "
+                f"{self.interval} timedelta was made.")
+
+
+class RateLimitBackendError(RateLimitError):
+    """A rate limiter state backend failed."""
@@ -0,0 +1,162 @@
+"""Rate limited task submission to thread and process pools.
+
+Workers calling a blocking rate limited callable sleep in the limiter while
+holding a slot of their pool, so pools get padded with threads that only
+wait.  A `RateLimitedExecutor` wraps any `concurrent.futures.Executor` and
+hands tasks to it only once the limit admits them::
+
+    with RateLimitedExecutor(ThreadPoolExecutor(4), RateLimitProperties(
+            max_count=10, interval=timedelta(seconds=1))) as executor:
+        futures = [executor.submit(call_vendor, request) for request in requests]
+
+One dispatcher thread per executor waits for the permits of the queued
+tasks in submission order, the workers of the pool never wait for the
+limit.
+"""
+from collections import deque
+from concurrent import futures
+import inspect
+import threading
+import time
+
+from .decorators import RateLimiter
+from .exceptions import RateLimitExceeded
+
+
+class RateLimitedExecutor(futures.Executor):  # pylint: disable=too-many-instance-attributes
+    """Executor submitting tasks to `executor` at the rate allowed by `limit`.
+
+    executor: `concurrent.futures.Executor` running the tasks, e.g. a
+              thread or process pool.  It is shut down with this executor.
+    limit: `.interfaces.IRateLimitProperties` provider or `.decorators.RateLimiter`
+           limiting the start of tasks.  Tasks always wait for their
+           permits, whatever `block` is.
+    max_pending: number of tasks waiting for permits beyond which `submit`
+                 raises RateLimitExceeded, 0 for no limit
+
+    Futures are returned right away and resolve with the result of the
+    task once it ran.  Tasks whose future is cancelled before they are
+    handed to `executor` don't run.  Task outcomes are reported to the
+    adaptive limit of `limit`, if any, without their latency, which
+    includes waiting for a worker.  Coroutine functions raise TypeError,
+    pace them with `.pacing.apaced` instead.
+    """
+
+    def __init__(self, executor, limit, max_pending=0):
+        """Wrap `executor`, see class docstring for args."""
+        self.executor = executor
+        self.limiter = limit if isinstance(limit, RateLimiter) else RateLimiter(properties=lambda: limit)
+        self.max_pending = max_pending
+        adaptive = getattr(limit, 'adaptive', None)
+        self._adaptive = None if callable(adaptive) else adaptive  # resolved per call, nothing to report to
+        self._pending = deque()  # (future, fn, args, kwargs) in submission order
+        self._cond = threading.Condition(threading.Lock())
+        self._shutdown = False
+        self._dispatcher = None
+
+    def submit(self, fn, /, *args, **kwargs):  # pylint: disable=arguments-differ
+        """Queue `fn(*args, **kwargs)` to run once the limit admits it, returning its future."""
+        if inspect.iscoroutinefunction(fn):
+            raise TypeError(f"workers can't await coroutine function {fn!r}, pace its calls with apaced() instead")
+        with self._cond:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new futures after shutdown")
+            if self.max_pending and len(self._pending) >= self.max_pending:
+                raise RateLimitExceeded(f"{self.max_pending} tasks already wait for {self.limiter}",
+                                        limiter=self.limiter)
+            future = futures.Future()
+            self._pending.append((future, fn, args, kwargs))
+            if self._dispatcher is None:
+                self._dispatcher = threading.Thread(target=self._dispatch, name='cs.ratelimit executor',
+                                                    daemon=True)
+                self._dispatcher.start()
+            self._cond.notify()
+        return future
+
+    def __len__(self):
+        """Return the number of tasks waiting for permits."""
+        return len(self._pending)
+
+    def shutdown(self, wait=True, *, cancel_futures=False):
+        """Stop accepting tasks and shut down `executor` once the queued tasks were handed to it.
+
+        With `cancel_futures` the queued tasks are cancelled instead.
+        Without `wait` this returns right away, queued tasks still run as
+        their permits come.
+        """
+        with self._cond:
+            self._shutdown = True
+            if cancel_futures:
+                while self._pending:
+                    self._pending.popleft()[0].cancel()
+            self._cond.notify()
+            dispatcher = self._dispatcher
+        if dispatcher is None:
+            self.executor.shutdown(wait=wait)
+        elif wait:
+            dispatcher.join()
+            self.executor.shutdown(wait=True)
+        # otherwise the dispatcher shuts `executor` down once it handed the queued tasks to it
+
+    def _dispatch(self):
+        """Hand queued tasks to `executor` as their permits come, until shut down."""
+        while True:
+            with self._cond:
+                while not self._pending and not self._shutdown:
+                    self._cond.wait()
+                if not self._pending:
+                    break
+                task = self._pending[0]
+            error = None
+            if not task[0].cancelled():
+                try:
+                    self._wait(self.limiter.reserve())
+                except Exception as raised:  # pylint: disable=broad-exception-caught
+                    error = raised  # e.g. from a backend, fail the task rather than the dispatcher
+            with self._cond:
+                if self._pending and self._pending[0] is task:
+                    self._pending.popleft()
+            if error is None:
+                self._start(*task)
+            elif task[0].set_running_or_notify_cancel():
+                task[0].set_exception(error)
+        self.executor.shutdown(wait=False)
+
+    def _wait(self, seconds):
+        """Wait for the slot of the next task, stopping early when its future is cancelled by `shutdown`."""
+        deadline = time.monotonic() + seconds
+        with self._cond:
+            while self._pending and not self._pending[0][0].cancelled():
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    return
+                self._cond.wait(left)
+
+    def _start(self, future, fn, args, kwargs):
+        """Submit a task whose permits were taken to `executor`, resolving `future` with its outcome."""
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            inner = self.executor.submit(fn, *args, **kwargs)
+        except BaseException as error:  # pylint: disable=broad-exception-caught
+            future.set_exception(error)
+            return
+        inner.add_done_callback(lambda done: _resolve(future, done, self._adaptive))
+
+    def __repr__(self):
+        """Show the executor and number of tasks waiting."""
+        return f"<{type(self).__name__} of {self.executor!r} with {len(self._pending)} tasks waiting>"
+
+
+def _resolve(future, done, adaptive=None):
+    """Resolve `future` with the outcome of the `done` future of the task, reporting it to `adaptive`."""
+    if done.cancelled():  # running futures can't be cancelled, report it as an error
+        future.set_exception(futures.CancelledError())
+    elif done.exception() is not None:
+        if adaptive is not None:
+            adaptive.failed(done.exception())
+        future.set_exception(done.exception())
+    else:
+        if adaptive is not None:
+            adaptive.observe()
+        future.set_result(done.result())
@@ -0,0 +1,209 @@
+"""Per-limiter switches, statistics and hooks for observing rate limited callables.
+
+`.decorators.RateLimiter` instances are instrumented, decorated callables
+expose theirs as ``.ratelimit``.  E.g. ``my_func.ratelimit.debug = True``
+turns on debug logging for just that limiter while the application is
+running, and ``my_func.ratelimit.stats()`` returns its `LimiterStats`.
+"""
+from bisect import bisect_left
+import reprlib
+import threading
+import weakref
+
+
+# bounded reprs, so logging a call doesn't format huge payloads
+_repr = reprlib.Repr()
+_repr.maxstring = 80
+_repr.maxother = 80
+bounded_repr = _repr.repr
+
+# upper bounds (seconds) of the wait time histogram buckets
+WAIT_BUCKETS = (.001, .005, .01, .05, .1, .5, 1, 5, 10, 60, 600, float('inf'))
+
+
+class LimiterStats:  # pylint: disable=too-many-instance-attributes
+    """Counters of the calls made through a limiter.
+
+    admitted: calls allowed to run, including those that waited
+    rejected: calls refused with RateLimitExceeded
+    blocked: admitted calls that had to wait for their slot
+    blocked_seconds: total seconds admitted calls waited for
+    max_blocked_seconds: longest wait of a call
+    wait_histogram: number of blocked calls by wait time, keyed by the upper
+                    bound in seconds of `WAIT_BUCKETS`
+
+    Each thread counts its admitted and rejected calls on its own, without
+    any lock, and `snapshot` sums the counts of all threads.  Only calls
+    that wait take a lock private to the stats, never the limiter lock.
+    """
+
+    __slots__ = ('_lock', '_local', '_threads', '_retired', '_zero', 'blocked', 'blocked_seconds',
+                 'max_blocked_seconds', 'histogram', '__weakref__')
+
+    def __init__(self):
+        """Create zeroed counters."""
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._threads = {}  # [admitted, rejected] counts of live threads by id
+        self._retired = [0, 0]  # counts of threads that ended
+        self._zero = (0, 0)  # counts at the last reset
+        self.reset()
+
+    @property
+    def admitted(self):
+        """Return the number of admitted calls."""
+        with self._lock:
+            return self._counts()[0]
+
+    @property
+    def rejected(self):
+        """Return the number of rejected calls."""
+        with self._lock:
+            return self._counts()[1]
+
+    def reset(self):
+        """Zero all counters."""
+        with self._lock:
+            self._zero = self._totals()
+            self.blocked = 0
+            self.blocked_seconds = 0.0
+            self.max_blocked_seconds = 0.0
+            self.histogram = [0] * len(WAIT_BUCKETS)
+
+    def admit(self, wait):
+        """Count an admitted call that waits `wait` seconds for its slot."""
+        if wait:
+            with self._lock:
+                self.blocked += 1
+                self.blocked_seconds += wait
+                self.max_blocked_seconds = max(self.max_blocked_seconds, wait)
+                self.histogram[bisect_left(WAIT_BUCKETS, wait)] += 1
+        try:
+            self._local.counts[0] += 1
+        except AttributeError:
+            self._thread_counts()[0] += 1
+
+    def reject(self):
+        """Count a rejected call."""
+        try:
+            self._local.counts[1] += 1
+        except AttributeError:
+            self._thread_counts()[1] += 1
+
+    def snapshot(self):
+        """Return the current counters as a dict, see class docstring for keys."""
+        with self._lock:
+            admitted, rejected = self._counts()
+            return {
+                'admitted': admitted,
+                'rejected': rejected,
+                'blocked': self.blocked,
+                'blocked_seconds': self.blocked_seconds,
+                'max_blocked_seconds': self.max_blocked_seconds,
+                'wait_histogram': dict(zip(WAIT_BUCKETS, self.histogram)),
+            }
+
+    def _totals(self):
+        """Return the admitted and rejected counts of all threads since the stats were created."""
+        admitted, rejected = self._retired
+        for counts in self._threads.values():
+            admitted += counts[0]
+            rejected += counts[1]
+        return admitted, rejected
+
+    def _counts(self):
+        """Return the admitted and rejected counts since the last reset."""
+        admitted, rejected = self._totals()
+        return admitted - self._zero[0], rejected - self._zero[1]
+
+    def _thread_counts(self):
+        """Start counting the calls of the calling thread, returning its [admitted, rejected] counts."""
+        owner = _ThreadCounts(self)
+        with self._lock:
+            self._threads[id(owner.counts)] = owner.counts
+        self._local.owner = owner  # dropped when the thread ends, see `_ThreadCounts.__del__`
+        self._local.counts = owner.counts
+        return owner.counts
+
+    def _retire(self, counts):
+        """Keep the `counts` of a thread that ended in the totals."""
+        with self._lock:
+            del self._threads[id(counts)]
+            self._retired[0] += counts[0]
+            self._retired[1] += counts[1]
+
+    def __repr__(self):
+        """Show the counters."""
+        return f"<{type(self).__name__} {self.snapshot()!r}>"
+
+
+class _ThreadCounts:  # pylint: disable=too-few-public-methods
+    """Counts of the calls of one thread through a `LimiterStats`, kept in its totals when the thread ends."""
+
+    __slots__ = ('stats', 'counts')
+
+    def __init__(self, stats):
+        """Start zeroed counts for `stats`."""
+        self.stats = weakref.ref(stats)
+        self.counts = [0, 0]
+
+    def __del__(self):
+        """Hand the counts to the stats, unless they are gone too."""
+        stats = self.stats()
+        if stats is not None:
+            stats._retire(self.counts)  # pylint: disable=protected-access
+
+
+class Instrumentation:
+    """Instrumentation settings, statistics and hooks of one limiter.
+
+    debug: True logs limiter decisions and calls at DEBUG level, False
+           skips all logging work.  None (default) logs when the
+           `cs.ratelimit.decorators` logger is enabled for DEBUG, which
+           costs one cached level check per call.
+    metrics: `LimiterStats` of all calls made through the limiter
+    on_admit: called with the limited callable and the seconds it waits
+              for its slot (0 when it runs right away) for admitted calls
+    on_reject: called with the limited callable and the RateLimitExceeded
+               error for rejected calls, the error is None when none is
+               raised (e.g. `RateLimiter.try_acquire`)
+    on_wait: called like on_admit, but only for calls that have to wait,
+             before they start waiting
+
+    Limiters that don't limit a callable pass themselves to hooks instead.
+
+    Hooks run in the calling thread without any limiter lock held.
+    """
+
+    __slots__ = ('debug', 'metrics', 'on_admit', 'on_reject', 'on_wait')
+
+    def __init__(self, debug=None, metrics=None, on_admit=None, on_reject=None, on_wait=None):
+        """Set the initial switches and hooks, see class docstring."""
+        # pylint: disable=too-many-arguments
+        self.debug = debug
+        self.metrics = metrics if metrics is not None else LimiterStats()
+        self.on_admit = on_admit
+        self.on_reject = on_reject
+        self.on_wait = on_wait
+
+    def stats(self):
+        """Return a `LimiterStats.snapshot` of the calls made through the limiter."""
+        return self.metrics.snapshot()
+
+    def admit(self, func, wait, metrics=None):
+        """Record an admitted call, also in `metrics` when given, and run the hooks."""
+        self.metrics.admit(wait)
+        if metrics is not None and metrics is not self.metrics:
+            metrics.admit(wait)
+        if wait and self.on_wait is not None:
+            self.on_wait(func, wait)
+        if self.on_admit is not None:
+            self.on_admit(func, wait)
+
+    def reject(self, func, error, metrics=None):
+        """Record a rejected call, also in `metrics` when given, and run the hooks."""
+        self.metrics.reject()
+        if metrics is not None and metrics is not self.metrics:
+            metrics.reject()
+        if self.on_reject is not None:
+            self.on_reject(func, error)
@@ -1,4 +1,10 @@
-"""Interfaces used to connect the rate limiting components together."""
+"""Interfaces used to connect the rate limiting components together.
+
+The limiters don't need zope, this module is only imported by code using
+the interfaces, e.g. through `.components` and ``configure.zcml``.  The
+classes of the package providing them are declared here, see the end of
+the module.
+"""
 from datetime import datetime
 import functools
 import threading
@@ -7,8 +13,12 @@ from zope import interface
 from zope import schema
 from zope.interface.common.mapping import IReadMapping
 
+from .engines import ENGINES
+
 
 def _is_rate_limiter_state_schema(rl_state):
+    if IRateLimiterBackend.providedBy(rl_state):  # pylint: disable=no-value-for-parameter
+        return True
     if 'updated' not in rl_state or 'counter' not in rl_state:
         raise schema.ValidationError("expected schema to contain 'updated' and 'counter' keys")
     if not isinstance(rl_state['updated'], datetime):
@@ -18,6 +28,15 @@ def _is_rate_limiter_state_schema(rl_state):
     return True
 
 
+def _is_rate_limit_engine(engine):
+    if isinstance(engine, str):
+        if engine not in ENGINES:
+            raise schema.ValidationError(f"expected engine name to be one of {sorted(ENGINES)}")
+    elif not callable(getattr(engine, 'reserve', None)):
+        raise schema.ValidationError("expected engine to be a name or provide a reserve() method")
+    return True
+
+
 def _instanceis(classinfo, obj):
     return isinstance(obj, classinfo)
 
@@ -32,6 +51,23 @@ class IRateLimiterState(IReadMapping):  # pylint: disable=too-many-ancestors
     """
 
 
+class IRateLimiterBackend(interface.Interface):  # pylint: disable=inherit-non-class
+    """Rate limiter state kept outside of the process, e.g. shared by many processes.
+
+    Backends can be used in place of an `IRateLimiterState` mapping.  They are
+    responsible for their own atomicity, the limiter lock isn't held while
+    calling them.
+    """
+
+    def acquire(engine, max_count, interval, block, n=1):  # pylint: disable=no-self-argument
+        """Atomically reserve `n` permits and return the nanoseconds until they may be used.
+
+        `engine` is the engine instance of the limiter, `max_count` and
+        `interval` (integer nanoseconds) its current limits.  When `block` is False and the
+        returned delay is greater than 0, no permits were reserved.
+        """
+
+
 class IRateLimitProperties(interface.Interface):  # pylint: disable=inherit-non-class
     """Call rate limit properties."""
 
@@ -56,9 +92,17 @@ class IRateLimitProperties(interface.Interface):  # pylint: disable=inherit-non-
             required=True
         )
 
+    max_wait = schema.Timedelta(
+            title="Maximum wait",
+            description="longest time blocking calls may wait for their slot, calls that " +
+                        "would wait longer raise RateLimitExceeded.  None waits as long as needed.",
+            required=False
+        )
+
     state = schema.Field(
             title="Rate limit state information",
-            description="Contains mutable information tracking callable state",
+            description="Contains mutable information tracking callable state, either a " +
+                        "IRateLimiterState mapping or IRateLimiterBackend provider",
             required=True,
             constraint=_is_rate_limiter_state_schema
         )
@@ -70,5 +114,51 @@ class IRateLimitProperties(interface.Interface):  # pylint: disable=inherit-non-
             constraint=functools.partial(_instanceis, type(threading.RLock()))
         )
 
+    engine = schema.Field(
+            title="Rate limit engine",
+            description="Name of a registered engine in cs.ratelimit.engines.ENGINES or an " +
+                        "engine instance.  Defaults to the 'fixed_window' counter.",
+            required=False,
+            constraint=_is_rate_limit_engine
+        )
+
+    metrics = schema.Field(
+            title="Rate limit statistics",
+            description="cs.ratelimit.instrumentation.LimiterStats counting the calls " +
+                        "limited by these properties",
+            required=False
+        )
+
+    queue = schema.Field(
+            title="Waiter queue",
+            description="cs.ratelimit.queueing.WaiterQueue admitting blocked calls in priority " +
+                        "and arrival order, None to admit them in the order they reserve slots",
+            required=False
+        )
+
+    adaptive = schema.Field(
+            title="Adaptive limit",
+            description="cs.ratelimit.adaptive.AdaptiveLimit adjusting max_count to the " +
+                        "outcome of calls, None to keep max_count as configured",
+            required=False
+        )
+
     def mapping():  # pylint: disable=no-method-argument
         """Return schema attributes as key value pairs in a referenced dict instance."""
+
+
+def _declare_implementations():
+    """Declare the interfaces provided by the zope-free classes of the package."""
+    # pylint: disable=import-outside-toplevel
+    from .backends.composite import CompositeState
+    from .backends.redis import RedisState
+    from .backends.shm import SharedMemoryState
+    from .backends.striped import StripedState
+    from .properties import RateLimitProperties
+
+    interface.classImplements(RateLimitProperties, IRateLimitProperties)
+    for backend in (CompositeState, RedisState, SharedMemoryState, StripedState):
+        interface.classImplements(backend, IRateLimiterBackend)
+
+
+_declare_implementations()
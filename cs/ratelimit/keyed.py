@@ -0,0 +1,104 @@
+"""Per-key rate limiter state, e.g. one limit per tenant, host or API key.
+
+See `KeyedRateLimiter` and the `key` kwarg of `.decorators.ratelimited`.
+"""
+from collections import OrderedDict
+import threading
+
+from .state import LimiterState, clock as monotonic_clock, to_ns
+
+
+class _Shard:  # pylint: disable=too-few-public-methods
+    """Least recently used states for a subset of keys, guarded by one lock."""
+
+    __slots__ = ('rlock', 'states')
+
+    def __init__(self):
+        self.rlock = threading.RLock()
+        self.states = OrderedDict()
+
+
+class KeyedRateLimiter:
+    """Bounded registry of independent rate limiter states selected by key.
+
+    Keys are spread over `shards` lock-striped shards, so calls for keys in
+    different shards don't contend on a single lock.  Each shard keeps its
+    states in least recently used order and holds at most
+    max_keys / shards of them, evicting the least recently used key when
+    full.  When `ttl` (datetime.timedelta) is set, keys that haven't been
+    admitted a call for that long are evicted as well, by the time of
+    `clock` (defaults to the monotonic clock of limiters).
+
+    Evicting a key forgets its limit, so a ttl shorter than the limiter
+    interval (twice the interval for the 'sliding_window' engine) can let
+    a returning key burst early.  The same applies to keys evicted while
+    the registry is at max_keys.
+
+    `restore`, when set, is called with the key and the new state of keys
+    the registry doesn't keep state for yet, e.g. by
+    `.persistence.SnapshotRegistry` to resume keys from a snapshot lazily.
+    """
+
+    def __init__(self, max_keys=100000, ttl=None, shards=16, clock=None):
+        """Create an empty registry, see class docstring for kwargs."""
+        if max_keys < 1 or shards < 1:
+            raise ValueError("expected max_keys and shards to be positive integers")
+        self.max_keys = max_keys
+        self.ttl = ttl
+        self.clock = clock if clock is not None else monotonic_clock
+        self._shards = tuple(_Shard() for _ in range(min(shards, max_keys)))
+        self._shard_max_keys = -(-max_keys // len(self._shards))  # ceil
+        self.restore = None
+
+    def rlock(self, key):
+        """Return the lock guarding the state of `key`."""
+        return self._shards[hash(key) % len(self._shards)].rlock
+
+    def state(self, key):
+        """Return the `.state.LimiterState` for `key`, creating it when needed.
+
+        Callers must hold `rlock(key)` while calling this and while using
+        the returned state.
+        """
+        shard = self._shards[hash(key) % len(self._shards)]
+        states = shard.states
+        try:
+            states.move_to_end(key)
+            return states[key]
+        except KeyError:
+            pass
+
+        if self.ttl:
+            expired = self.clock() - to_ns(self.ttl)
+            while states:
+                oldest = next(iter(states.values()))
+                if oldest.updated >= expired:
+                    break
+                states.popitem(last=False)
+        while len(states) >= self._shard_max_keys:
+            states.popitem(last=False)
+        state = states[key] = LimiterState()
+        if self.restore is not None:
+            self.restore(key, state)
+        return state
+
+    def items(self):
+        """Yield the keys state is being kept for along with a copy of their state."""
+        for shard in self._shards:
+            with shard.rlock:
+                items = [(key, state.copy()) for key, state in shard.states.items()]
+            yield from items
+
+    def __contains__(self, key):
+        """Return True if state is being kept for `key`."""
+        return key in self._shards[hash(key) % len(self._shards)].states
+
+    def __len__(self):
+        """Return the number of keys state is being kept for."""
+        return sum(len(shard.states) for shard in self._shards)
+
+    def clear(self):
+        """Forget the state of all keys."""
+        for shard in self._shards:
+            with shard.rlock:
+                shard.states.clear()
@@ -0,0 +1,80 @@
+"""Paced iteration, e.g. over paginated API results or rows sent to a sink.
+
+`paced` and `apaced` yield the items of an (async) iterable as the limit
+admits them, without wrapping a callable per item::
+
+    for page in paced(fetch_pages(), RateLimitProperties(max_count=5, interval=timedelta(seconds=1))):
+        store(page)
+
+    async for rows in apaced(read_rows(), limit, chunk=100):
+        await sink.write(rows)
+
+Items are pulled from the source as the consumer asks for them, at most
+as many at once as there are permits, so slow consumers hold back the
+source and memory use stays flat.
+"""
+from itertools import islice
+
+from .decorators import RateLimiter
+
+
+def paced(iterable, limit, chunk=None):
+    """Yield the items of `iterable` at the rate allowed by `limit`, sleeping until their permits come.
+
+    limit: `.interfaces.IRateLimitProperties` provider or `.decorators.RateLimiter`.
+           Items always wait for their permits, whatever `block` is.
+    chunk: yield lists of up to `chunk` items instead, as many as there
+           are permits available right now, or one item once the next
+           permit comes
+
+    Each item takes one permit.  With `chunk`, permits taken for items the
+    source runs out of before filling the last list are lost.
+    """
+    limiter = _limiter(limit)
+    iterator = iter(iterable)
+    if not chunk:
+        for item in iterator:
+            limiter.acquire()
+            yield item
+        return
+    for item in iterator:
+        permits = limiter.acquire_many(chunk)
+        if not permits:
+            limiter.acquire()
+            permits = 1
+        yield [item, *islice(iterator, permits - 1)]
+
+
+async def apaced(iterable, limit, chunk=None):
+    """Yield the items of an async (or plain) `iterable` like `paced`, waiting with the event loop running."""
+    limiter = _limiter(limit)
+    # pylint: disable=unnecessary-dunder-call  # aiter() and anext() need Python 3.10
+    iterator = iterable.__aiter__() if hasattr(iterable, '__aiter__') else _aiter(iterable)
+    async for item in iterator:
+        permits = limiter.acquire_many(chunk) if chunk else 0
+        if not permits:
+            delay = limiter.reserve()
+            if delay:
+                await limiter._asleep(delay)  # pylint: disable=protected-access
+            permits = 1
+        if not chunk:
+            yield item
+            continue
+        items = [item]
+        while len(items) < permits:
+            try:
+                items.append(await iterator.__anext__())
+            except StopAsyncIteration:
+                break
+        yield items
+
+
+def _limiter(limit):
+    """Return the `RateLimiter` of `limit`, a limiter or an IRateLimitProperties provider."""
+    return limit if isinstance(limit, RateLimiter) else RateLimiter(properties=lambda: limit)
+
+
+async def _aiter(iterable):
+    """Iterate over a plain iterable asynchronously."""
+    for item in iterable:
+        yield item
@@ -0,0 +1,330 @@
+"""Snapshots of limiter state surviving restarts of the process.
+
+Limiter state lives in memory, so a restarted process starts with fresh
+limits and may burst max_count calls at vendors still counting the calls
+of the previous process.  A `SnapshotRegistry` saves the state of named
+limiters, including the keys of their `.keyed.KeyedRateLimiter`
+registries, to a compact binary file periodically or at exit, and restores
+it when the limiters are registered again on startup::
+
+    snapshots = SnapshotRegistry('/var/lib/myapp/limits.snapshot')
+    snapshots.register('vendor', call_vendor.ratelimit)
+    snapshots.start(interval=60)  # saves every minute and at exit
+
+Snapshot files hold one fixed size record per limiter or key, sorted by a
+hash of its name.  They are memory-mapped and records are found by binary
+search when needed, so startup doesn't read the whole file and keys are
+only restored once they are used again.  Keys are named by their repr,
+so only str and int keys and tuples of those are saved, unless a
+`key_name` is given to `SnapshotRegistry.register`.
+
+Times are saved relative to the wall clock, the monotonic clock limiters
+measure time with starts over when the host reboots.  Wall clock steps
+between saving and restoring shift the restored times by as much.
+"""
+import atexit
+import hashlib
+import logging
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+
+from .exceptions import RateLimitError
+from .keyed import KeyedRateLimiter
+from .state import NEVER, LimiterState, clock
+
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct('<8sQq')  # magic, record count, wall clock minus monotonic clock when saved
+_MAGIC = b'csrlsnp\x01'
+# records are the hash of a name followed by the `LimiterState` fields
+# updated, counter, tat, tokens (NaN for None), window and previous
+_IDENT = struct.Struct('<Q')
+_RECORD = struct.Struct('<QqqqdqQ')
+_TIMES = (0, 2, 4)  # fields of a record holding times
+
+
+def _ident(name):
+    """Return the 64 bit hash records of `name` are sorted and found by."""
+    return int.from_bytes(hashlib.blake2b(name.encode(), digest_size=8).digest(), 'little')
+
+
+def _wall_offset():
+    """Return the nanoseconds the wall clock is ahead of the monotonic clock."""
+    return time.time_ns() - clock()
+
+
+def save_snapshot(path, states):
+    """Write (name, `.state.LimiterState`) pairs to a snapshot file, replacing the file at `path` atomically.
+
+    Snapshots of `path` still mapped need `StateSnapshot.detach` first, on
+    Windows mapped files can't be replaced.
+    """
+    records = {_ident(name): state for name, state in states}
+    temporary = f'{path}.{os.getpid()}.tmp'
+    with open(temporary, 'wb') as file:
+        file.write(_HEADER.pack(_MAGIC, len(records), _wall_offset()))
+        for ident in sorted(records):
+            state = records[ident]
+            file.write(_RECORD.pack(ident, state.updated, state.counter, state.tat,
+                                    math.nan if state.tokens is None else state.tokens, state.window,
+                                    state.previous))
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temporary, path)
+
+
+class StateSnapshot:
+    """Memory-mapped snapshot file written by `save_snapshot`.
+
+    Records are looked up in the mapped file by binary search, nothing is
+    read ahead.  Raises RateLimitError for files that aren't snapshots.
+    Use as a context manager, or `close` it, to unmap the file.
+    """
+
+    def __init__(self, path):
+        """Map the snapshot file at `path`."""
+        with open(path, 'rb') as file:
+            if os.fstat(file.fileno()).st_size < _HEADER.size:
+                raise RateLimitError(f"{path!r} isn't a limiter state snapshot")
+            self._map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._count, saved_offset = _HEADER.unpack_from(self._map, 0)
+        if magic != _MAGIC or len(self._map) != _HEADER.size + self._count * _RECORD.size:
+            self.close()
+            raise RateLimitError(f"{path!r} isn't a limiter state snapshot")
+        self._shift = saved_offset - _wall_offset()  # from saved to current monotonic clock readings
+
+    def __len__(self):
+        """Return the number of records."""
+        return self._count
+
+    def __contains__(self, name):
+        """Return True if the snapshot holds state for `name`."""
+        return self._find(_ident(name)) is not None
+
+    def _find(self, ident):
+        """Return the offset of the record of `ident`, or None."""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            offset = _HEADER.size + middle * _RECORD.size
+            found = _IDENT.unpack_from(self._map, offset)[0]
+            if found == ident:
+                return offset
+            if found < ident:
+                low = middle + 1
+            else:
+                high = middle
+        return None
+
+    def restore(self, name, state):
+        """Set `state` (a `LimiterState` or state mapping) to the one saved for `name`, returning False if none was."""
+        offset = self._find(_ident(name))
+        if offset is None:
+            return False
+        fields = list(_RECORD.unpack_from(self._map, offset)[1:])
+        for index in _TIMES:
+            if fields[index] > NEVER:
+                fields[index] += self._shift
+        saved = LimiterState.__new__(LimiterState)
+        saved.updated, saved.counter, saved.tat, tokens, saved.window, saved.previous = fields
+        saved.tokens = None if math.isnan(tokens) else tokens
+        if isinstance(state, LimiterState):
+            state.restore(saved)
+        else:
+            saved.to_mapping(state)
+        return True
+
+    def detach(self):
+        """Copy the records out of the file and unmap it, so that the file may be replaced."""
+        mapped = self._map
+        if isinstance(mapped, mmap.mmap):
+            self._map = mapped[:]  # lookups in other threads go on in the copy
+            mapped.close()
+
+    def close(self):
+        """Unmap the file, no records are found afterwards."""
+        mapped = self._map
+        self._map, self._count = b'', 0
+        if isinstance(mapped, mmap.mmap):
+            mapped.close()
+
+    def __enter__(self):
+        """Return the snapshot."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Unmap the file."""
+        self.close()
+
+    def __repr__(self):
+        """Show the number of records."""
+        return f"<{type(self).__name__} with {self._count} records>"
+
+
+class SnapshotRegistry:
+    """Named limiters saved to and restored from the snapshot file at `path`.
+
+    The snapshot found at `path` when the registry is created is used to
+    restore limiters as they are registered, and the keys of their keyed
+    registries as they are used again.  Missing or unreadable snapshots
+    start all limiters afresh.  Use as a context manager, or `close` it,
+    to unmap the snapshot once limiters no longer need restoring.
+    """
+
+    def __init__(self, path):
+        """Open the snapshot at `path`, if any."""
+        self.path = path
+        self.snapshot = None
+        self._limiters = {}  # names of limiters and the functions naming their keys
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()  # one writer of the temporary file at a time
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            self.snapshot = StateSnapshot(path)
+        except FileNotFoundError:
+            pass
+        except (OSError, RateLimitError) as error:
+            logger.warning("ignoring limiter state snapshot %s: %s", path, error)
+
+    def register(self, name, limiter, key_name=None):
+        """Restore `limiter` from the snapshot and include it in the snapshots saved, returning it.
+
+        `limiter` is a rate limited callable, a `.decorators.RateLimiter`,
+        an `.interfaces.IRateLimitProperties` provider or a
+        `.keyed.KeyedRateLimiter`.  Names identify limiters between
+        restarts.  State kept by backends shared between processes isn't
+        saved, it outlives the process already.  Limiters resolving their
+        state per call, e.g. from the instances of a method, raise
+        ValueError, register the properties of each instance instead.
+
+        `key_name`, when given, returns the str naming a key of the keyed
+        registry of `limiter` between restarts, needed for keys other than
+        str, int or tuples of those.  Others raise TypeError when used.
+        """
+        registered = getattr(limiter, 'ratelimit', limiter)
+        if _resolved_per_call(registered):
+            raise ValueError(f"can't save {registered!r} registered as {name!r}, it resolves its state per call")
+        with self._lock:
+            self._limiters[name] = registered, key_name
+        snapshot = self.snapshot
+        keys = registered if isinstance(registered, KeyedRateLimiter) else getattr(registered, 'keys', None)
+        if snapshot is not None:
+            state, rlock = _memory_state(registered)
+            if state is not None:
+                with rlock:
+                    snapshot.restore(name, state)
+            if keys is not None:
+                keys.restore = lambda key, state: snapshot.restore(_key_name(name, key, key_name), state)
+        return limiter
+
+    def states(self):
+        """Yield (name, state) pairs of copies of the state of all registered limiters and keys."""
+        with self._lock:
+            limiters = list(self._limiters.items())
+        for name, (limiter, key_name) in limiters:
+            state, rlock = _memory_state(limiter)
+            if state is not None:
+                with rlock:
+                    saved = state.copy() if isinstance(state, LimiterState) else LimiterState.from_mapping(state)
+                yield name, saved
+            keys = limiter if isinstance(limiter, KeyedRateLimiter) else getattr(limiter, 'keys', None)
+            if keys is not None:
+                for key, keyed in keys.items():
+                    yield _key_name(name, key, key_name), keyed
+
+    def save(self):
+        """Save the state of all registered limiters to `path`."""
+        with self._save_lock:
+            snapshot = self.snapshot
+            if snapshot is not None:
+                snapshot.detach()  # unmapped, so that the file may be replaced
+            save_snapshot(self.path, self.states())
+
+    def close(self):
+        """Unmap the snapshot restored from, limiters and keys registered or used afterwards start afresh."""
+        if self.snapshot is not None:
+            self.snapshot.close()
+
+    def __enter__(self):
+        """Return the registry."""
+        return self
+
+    def __exit__(self, *exc_info):
+        """Unmap the snapshot restored from."""
+        self.close()
+
+    def start(self, interval=None):
+        """Save at exit, and every `interval` seconds from a daemon thread when given."""
+        atexit.register(self.save)
+        if interval and self._thread is None:
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, args=(interval,), name='cs.ratelimit snapshots',
+                                            daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        """Stop saving periodically and at exit, then save a last time."""
+        atexit.unregister(self.save)
+        if self._thread is not None:
+            self._stop.set()
+            self._thread.join()
+            self._thread = None
+        self.save()
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.save()
+            except OSError as error:
+                logger.warning("failed saving limiter state snapshot %s: %s", self.path, error)
+
+    def __repr__(self):
+        """Show the path and number of registered limiters."""
+        return f"<{type(self).__name__} {self.path!r} of {len(self._limiters)} limiters>"
+
+
+def _key_name(name, key, key_name=None):
+    """Return the name of the state of `key` in the keyed registry of limiter `name`.
+
+    Keys are named by `key_name` when given, or else by their repr, which
+    is only stable between processes for str and int keys and tuples of
+    those.  Other keys raise TypeError.
+    """
+    if key_name is not None:
+        return f'{name}[{key_name(key)}]'
+    if not _nameable(key):
+        raise TypeError(f"can't name key {key!r} of limiter {name!r} between restarts, register it with a key_name")
+    return f'{name}[{key!r}]'
+
+
+def _nameable(key):
+    if isinstance(key, tuple):
+        return all(_nameable(part) for part in key)
+    return isinstance(key, (str, int))
+
+
+def _resolved_per_call(limiter):
+    """Return True if `limiter` resolves its state for each call, e.g. per instance of a method."""
+    if isinstance(limiter, KeyedRateLimiter):
+        return False
+    return (getattr(limiter, '_properties', None) is not None or callable(getattr(limiter, 'state', None))
+            or callable(getattr(limiter, 'rlock', None)))
+
+
+def _memory_state(limiter):
+    """Return the state kept in memory by `limiter` and the lock guarding it, or None and None."""
+    if isinstance(limiter, KeyedRateLimiter):
+        return None, None
+    state, rlock = limiter.state, getattr(limiter, 'rlock', None)
+    if not isinstance(state, LimiterState) and hasattr(state, 'acquire'):
+        # backends keeping their state in memory, e.g. composite and striped states
+        state, rlock = getattr(state, 'state', None), getattr(state, 'rlock', rlock)
+        if not isinstance(state, LimiterState):
+            return None, None
+    return state, rlock
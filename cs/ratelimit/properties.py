@@ -0,0 +1,109 @@
+"""Per-instance rate limit properties, without any zope dependency.
+
+`RateLimitProperties` keeps its config in plain slots, so reading and
+changing limits at runtime costs a plain attribute access.  The zope
+interfaces and component factories declaring and creating them are in
+`.interfaces` and `.components`, which are only imported when used.
+"""
+from collections.abc import MutableMapping
+from datetime import timedelta
+import threading
+
+from .engines import get_engine
+from .instrumentation import LimiterStats
+from .state import LimiterState
+
+
+class RateLimitProperties:
+    """Can be used to create per-instance vs per-class rate limiters.
+
+    See `.interfaces.IRateLimitProperties` for the attributes and usage
+    examples in the README for more details.  Values are checked when
+    created, not when changed at runtime.
+    """
+
+    # pylint: disable=too-many-arguments,too-many-instance-attributes
+    __slots__ = ('max_count', 'interval', 'block', 'state', 'rlock', 'engine', 'metrics', 'queue', 'max_wait',
+                 'adaptive')
+
+    def __init__(self, max_count=0, interval=timedelta(seconds=0),
+                 block=False, state=None, rlock=None, engine=None, metrics=None, queue=None, max_wait=None,
+                 adaptive=None):
+        """Set instance configuration and initialize mutable state.
+
+        See `.interfaces.IRateLimitProperties` definition for detailed
+        info about the accepted kwargs.
+        """
+        if max_count and (not isinstance(max_count, int) or max_count < 0):
+            raise ValueError(f"expected max_count to be an integer of at least 0, got {max_count!r}")
+        if engine is not None and not isinstance(engine, str) and not callable(getattr(engine, 'reserve', None)):
+            raise ValueError("expected engine to be a name or provide a reserve() method")
+        get_engine(engine if isinstance(engine, str) else None)  # validate names
+        self.max_count = max_count if max_count else 0
+        self.interval = interval if interval else timedelta(seconds=0)
+        self.block = block if block else False
+        self.state = state if state is not None else LimiterState()
+        self.rlock = rlock if rlock else threading.RLock()
+        self.engine = engine
+        self.metrics = metrics if metrics is not None else LimiterStats()
+        self.queue = queue
+        self.max_wait = max_wait
+        self.adaptive = adaptive
+        if adaptive is not None:
+            adaptive.bind(self)
+
+    def mapping(self):
+        """Satisfies `IRateLimitProperties` by providing internal state in a `mapping` attr."""
+        return _SlotsMapping(self)
+
+    def stats(self):
+        """Return a `LimiterStats.snapshot` of the calls limited by these properties."""
+        return self.metrics.snapshot()
+
+    def __repr__(self):
+        """Show the limit."""
+        return f"<{type(self).__name__} {self.max_count} per {self.interval}>"
+
+
+class _SlotsMapping(MutableMapping):
+    """Mapping reading and writing the slots of an object, like the `__dict__` of objects without slots."""
+
+    __slots__ = ('_obj',)
+
+    def __init__(self, obj):
+        self._obj = obj
+
+    def __getitem__(self, key):
+        if key not in type(self._obj).__slots__:
+            raise KeyError(key)
+        return getattr(self._obj, key)
+
+    def __setitem__(self, key, value):
+        if key not in type(self._obj).__slots__:
+            raise KeyError(key)
+        setattr(self._obj, key, value)
+
+    def __delitem__(self, key):
+        raise TypeError(f"{type(self._obj).__name__} attributes can't be removed")
+
+    def __iter__(self):
+        return iter(type(self._obj).__slots__)
+
+    def __len__(self):
+        return len(type(self._obj).__slots__)
+
+
+def ratelimitproperties_factory(**kwargs):
+    """Create per-instance rate limiters from text-based config.
+
+    Essentially same as RateLimitProperties, except interval and max_wait
+    can be an integer or float that will be converted into a timedelta based
+    on seconds, and a `burst` size may be given along with the name of an
+    engine that accepts one.
+    """
+    for name in ('interval', 'max_wait'):
+        if kwargs.get(name) is not None and not isinstance(kwargs[name], timedelta):
+            kwargs[name] = timedelta(seconds=kwargs[name])
+    if 'burst' in kwargs:
+        kwargs['engine'] = get_engine(kwargs.get('engine'), burst=int(kwargs.pop('burst')))
+    return RateLimitProperties(**kwargs)
@@ -0,0 +1,100 @@
+"""Fair queueing of threads blocked on a rate limiter.
+
+Blocking limiters reserve the next slot for each caller in the order they
+take the limiter lock.  A `WaiterQueue` admits blocked callers by priority
+lane and then in the order they arrived instead, e.g. interactive calls
+ahead of backfill jobs, and bounds the number of callers waiting.
+"""
+import heapq
+import itertools
+import threading
+
+from .state import clock as monotonic_clock
+
+
+class WaiterQueue:
+    """Queue of threads waiting for the permits of a limiter.
+
+    Waiters are admitted one at a time, those in lower priority lanes first
+    and in arrival order within a lane.  Only the waiter at the head of the
+    queue takes permits, the others sleep until it was admitted, so calls
+    arriving while others wait never take permits ahead of them.
+
+    max_depth: number of waiting callers beyond which callers are turned
+               away right away, 0 for no limit
+
+    Lower lanes are admitted as long as they have waiters, so a busy lane
+    starves the lanes above it.
+    """
+
+    __slots__ = ('max_depth', '_cond', '_waiters', '_arrivals')
+
+    def __init__(self, max_depth=0):
+        """Create an empty queue, see class docstring."""
+        self.max_depth = max_depth
+        self._cond = threading.Condition(threading.Lock())
+        self._waiters = []  # heap of (priority, arrival)
+        self._arrivals = itertools.count()
+
+    def __len__(self):
+        """Return the number of waiting callers."""
+        return len(self._waiters)
+
+    def wait(self, take, priority=0, timeout=None, clock=monotonic_clock, sleep=None):
+        """Wait for the turn of the caller and for `take` to admit it.
+
+        take: callable taking the permits of the caller if they are available
+              right now and returning 0 (or less), or the nanoseconds until
+              they may be otherwise
+        priority: lane of the caller, lower lanes are admitted first
+        timeout: nanoseconds to wait at most, None to wait as long as needed
+        clock: callable returning the monotonic nanoseconds `take` works with
+        sleep: callable the head of the queue sleeps seconds with until its
+               permits come, e.g. the `sleep` of a `.testing.FakeClock`
+               passed as `clock`.  It waits on the queue by default.
+
+        Returns the nanoseconds waited, None when the queue is full, or
+        minus the nanoseconds until the permits may come when they can't be
+        taken within `timeout`.  That is -1 for callers still behind others,
+        whose permits aren't known yet.
+        """
+        # pylint: disable=too-many-branches
+        start = clock()
+        with self._cond:
+            if not self._waiters and take() <= 0:
+                return 0
+            if self.max_depth and len(self._waiters) >= self.max_depth:
+                return None
+            waiter = (priority, next(self._arrivals))
+            heapq.heappush(self._waiters, waiter)
+            try:
+                while True:
+                    pause = None
+                    if self._waiters[0] is waiter:
+                        pause = take()
+                        if pause <= 0:
+                            return clock() - start
+                    if timeout is not None:
+                        left = timeout - (clock() - start)
+                        if left <= 0 or (pause is not None and pause > left):
+                            return -pause if pause is not None else -1
+                        pause = left if pause is None else pause
+                    if sleep is not None and self._waiters[0] is waiter:
+                        self._cond.release()
+                        try:
+                            sleep(pause / 1e9)
+                        finally:
+                            self._cond.acquire()
+                    else:
+                        self._cond.wait(None if pause is None else pause / 1e9)
+            finally:
+                if self._waiters[0] is waiter:
+                    heapq.heappop(self._waiters)
+                else:
+                    self._waiters.remove(waiter)
+                    heapq.heapify(self._waiters)
+                self._cond.notify_all()
+
+    def __repr__(self):
+        """Show the number of waiters."""
+        return f"<{type(self).__name__} with {len(self._waiters)} waiters>"
@@ -0,0 +1,135 @@
+"""Mutable rate limiter state and the clock it is measured with.
+
+Limiters measure time in integer nanoseconds of the monotonic clock, so
+wall clock adjustments (e.g. NTP steps) don't cause spurious waits or
+bursts.  datetime and timedelta values are only used at the public
+configuration and `.interfaces.IRateLimiterState` mapping boundaries.
+"""
+from datetime import datetime, timedelta
+import time
+
+
+clock = time.monotonic_ns
+
+# time of events that never happened, before any reading of the clock
+NEVER = -(1 << 62)
+
+_MICROSECOND = timedelta(microseconds=1)
+_TIMES = frozenset(('updated', 'tat', 'window'))
+# wall clock time at which the monotonic clock read 0
+_WALL_EPOCH = datetime.now() - timedelta(microseconds=time.monotonic_ns() // 1000)
+
+
+def to_ns(interval):
+    """Return a timedelta or number of seconds as integer nanoseconds."""
+    if isinstance(interval, timedelta):
+        return interval // _MICROSECOND * 1000
+    return int(interval * 1000000000) if interval else 0
+
+
+def to_datetime(ns):
+    """Return the datetime of a clock reading, datetime.min for NEVER."""
+    if ns <= NEVER:
+        return datetime.min
+    return _WALL_EPOCH + timedelta(microseconds=ns // 1000)
+
+
+def from_datetime(value):
+    """Return the clock reading of a datetime, NEVER for datetime.min."""
+    if not value or value == datetime.min:
+        return NEVER
+    return (value - _WALL_EPOCH) // _MICROSECOND * 1000
+
+
+class LimiterState:
+    """Default mutable state of a rate limiter.
+
+    Engines use the attributes, whose times are `clock` readings.  The
+    state also provides the `.interfaces.IRateLimiterState` mapping, which
+    exposes the times as datetime values.
+
+    updated: time of the latest admitted or reserved call
+    counter: calls counted in the current window
+    tokens: tokens left in a token bucket, None for a full bucket
+    tat: theoretical arrival time of the next call for GCRA
+    window: start of the current sliding window
+    previous: calls counted in the previous sliding window
+    """
+
+    __slots__ = ('updated', 'counter', 'tokens', 'tat', 'window', 'previous')
+
+    def __init__(self, updated=NEVER, counter=0):
+        """Initialize state for a limiter that hasn't admitted any calls."""
+        self.updated = updated
+        self.counter = counter
+        self.tokens = None
+        self.tat = NEVER
+        self.window = NEVER
+        self.previous = 0
+
+    def copy(self):
+        """Return a copy of this state."""
+        state = LimiterState.__new__(LimiterState)
+        state.restore(self)
+        return state
+
+    def restore(self, other):
+        """Set the values of this state to those of `other`."""
+        self.updated = other.updated
+        self.counter = other.counter
+        self.tokens = other.tokens
+        self.tat = other.tat
+        self.window = other.window
+        self.previous = other.previous
+
+    @classmethod
+    def from_mapping(cls, mapping):
+        """Return a new state with the values of an `IRateLimiterState` mapping."""
+        state = cls()
+        for key in cls.__slots__:
+            value = mapping.get(key)
+            if value is not None:
+                state[key] = value
+        return state
+
+    def to_mapping(self, mapping):
+        """Store the values of this state in an `IRateLimiterState` mapping."""
+        for key in self.__slots__:
+            if key in ('updated', 'counter') or key in mapping or getattr(self, key) != getattr(_INITIAL, key):
+                mapping[key] = self[key]
+
+    def __getitem__(self, key):
+        """Return a value, times are returned as datetime values."""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        value = getattr(self, key)
+        return to_datetime(value) if key in _TIMES else value
+
+    def __setitem__(self, key, value):
+        """Set a value, times are given as datetime values."""
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, from_datetime(value) if key in _TIMES else value)
+
+    def __contains__(self, key):
+        """Return True for the keys of the mapping."""
+        return key in self.__slots__
+
+    def __iter__(self):
+        """Iterate over the keys of the mapping."""
+        return iter(self.__slots__)
+
+    def __len__(self):
+        """Return the number of keys of the mapping."""
+        return len(self.__slots__)
+
+    def get(self, key, default=None):
+        """Return a value like `__getitem__`, or `default` for unknown keys."""
+        return self[key] if key in self.__slots__ else default
+
+    def __repr__(self):
+        """Show the state as a mapping."""
+        return repr({key: self[key] for key in self.__slots__})
+
+
+_INITIAL = LimiterState()
@@ -1,34 +1,158 @@
-"""Test helpers."""
-from queue import LifoQueue
-import logging
+"""Test helpers for code using limiters."""
+import asyncio
+import math
+import socket
+import socketserver
+import threading
+import time
 
-from zope.component.testlayer import ZCMLFileLayer
+from .backends import redis
+from .state import clock, to_ns
 
-import cs.ratelimit
 
+class FakeClock:
+    """Virtual monotonic clock advancing only when told or slept on.
 
-RATELIMIT_INTEGRATION_LAYER = ZCMLFileLayer(cs.ratelimit,
-                                            zcml_file='ftesting.zcml',
-                                            name='RatelimitComponents')
+    Pass it as the `clock` of limiters to test or simulate them without
+    waiting, e.g. hours of traffic in milliseconds:
 
+    >>> clock = FakeClock()
+    >>> @ratelimited(max_count=10, interval=timedelta(minutes=1), block=True, clock=clock)
+    ... def my_func():
+    ...     pass
+    >>> for _ in range(600):
+    ...     my_func()
+    >>> clock.elapsed() // 60
+    59.0
 
-# Setup Queue (thread-safe memory) logging handler for test referencing (allows tests to review Queue)
-# to check last entry:
-# >>> 'My String' in logger_queue.get_nowait()
-# True
-logger_queue = LifoQueue()
+    Sleeping advances the clock to the time the sleeper wakes up at, unless
+    another sleeper already advanced it further.  The clock starts at the
+    time of the real monotonic clock by default, so states converted to
+    mappings hold sensible datetimes.
+    """
 
+    def __init__(self, start=None):
+        """Start the clock at `start` nanoseconds, or the current time of the real clock."""
+        self.start = self.now = clock() if start is None else start
+        self._lock = threading.Lock()
 
-class QueuingHandler(logging.Handler):
-    """Provides LIFO access to handled log lines."""
+    def __call__(self):
+        """Return the current virtual time in nanoseconds."""
+        return self.now
 
-    def __init__(self, *args, **kwargs):
-        """Initialize by copying the queue and sending everything else to superclass."""
-        logging.Handler.__init__(self, *args, **kwargs)
+    def elapsed(self):
+        """Return the seconds elapsed since the clock started."""
+        return (self.now - self.start) / 1e9
 
-    def emit(self, record):
-        """Add the formatted log message (sans newlines) to the queue."""
-        logger_queue.put(self.format(record).rstrip('\n'))
+    def advance(self, seconds):
+        """Move the clock forward by `seconds` (or a timedelta)."""
+        with self._lock:
+            self.now += to_ns(seconds)
 
+    def sleep(self, seconds):
+        """Advance the clock to the time a sleep of `seconds` started now ends at, returning right away."""
+        wake = self.now + to_ns(seconds)
+        with self._lock:
+            self.now = max(self.now, wake)
 
-logging.getLogger().addHandler(QueuingHandler())
+    async def asleep(self, seconds):
+        """Sleep like `sleep`, then let other tasks run."""
+        self.sleep(seconds)
+        await asyncio.sleep(0)
+
+
+class FakeRedisServer:
+    """Local Redis protocol server for testing `.backends.redis.RedisState`.
+
+    Only the commands used by the backend are understood, and the backend
+    script is run by an equivalent Python function instead of Lua.
+    """
+
+    def __init__(self, host='127.0.0.1', port=0):
+        """Bind to `host` and `port`, an unused port is picked by default."""
+        self.store = {}
+        self.scripts = {}
+        self.lock = threading.Lock()
+        fake = self
+
+        class Handler(socketserver.StreamRequestHandler):
+            """Reply to commands until the client disconnects."""
+
+            def handle(self):
+                fake.connections.add(self.connection)
+                while True:
+                    try:
+                        command = redis._read_reply(self.rfile)  # pylint: disable=protected-access
+                    except ConnectionError:
+                        return
+                    self.wfile.write(fake.execute(*command))
+
+        self.connections = set()
+        self.server = socketserver.ThreadingTCPServer((host, port), Handler)
+        self.host, self.port = self.server.server_address[:2]
+
+    def __enter__(self):
+        """Serve requests in a background thread."""
+        threading.Thread(target=self.server.serve_forever, args=(.01,), daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop serving requests and disconnect clients."""
+        self.server.shutdown()
+        for connection in self.connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+        self.server.server_close()
+
+    def execute(self, name, *args):  # pylint: disable=too-many-return-statements
+        """Return the encoded reply to a command."""
+        name = name.decode().upper()
+        with self.lock:
+            if name == 'PING':
+                return b'+PONG\r\n'
+            if name == 'FLUSHALL':
+                self.store.clear()
+                self.scripts.clear()
+                return b'+OK\r\n'
+            if name == 'SCRIPT' and args[0].decode().upper() == 'LOAD':
+                sha = f'{len(self.scripts):040x}'
+                self.scripts[sha] = args[1].decode()
+                return b'$40\r\n%s\r\n' % sha.encode()
+            if name == 'EVALSHA':
+                script = self.scripts.get(args[0].decode())
+                if script is None:
+                    return b'-NOSCRIPT No matching script.\r\n'
+                if script != redis.SCRIPT:
+                    return b'-ERR unknown script\r\n'
+                numkeys = int(args[1])
+                keys, argv = args[2:2 + numkeys], [a.decode() for a in args[2 + numkeys:]]
+                return b':%d\r\n' % self._redis_state_script(keys[0], *argv)
+        return b'-ERR unknown command\r\n'
+
+    def _redis_state_script(self, key, engine, max_count, interval, block, n, burst):  # pylint: disable=R0913,R0914
+        """Python version of `.backends.redis.SCRIPT`."""
+        max_count, interval, block, n, burst = int(max_count), int(interval), block == '1', int(n), int(burst)
+        now = time.time_ns() // 1000
+        if max_count <= 0 or interval <= 0:
+            return 0
+        state = self.store.setdefault(key, {})
+        if engine == 'fixed_window':
+            updated, counter = state.get('updated', 0), state.get('counter', 0)
+            slot = max(now, updated)
+            reset = counter + n > max_count
+            if reset:
+                slot = max(slot, updated + interval)
+                counter = 0
+            if slot > now and not block:
+                return math.ceil(slot - now)
+            state.update(updated=slot, counter=counter + n)
+        else:
+            emission = interval / max_count
+            tat = max(now, state.get('tat', now))
+            slot = max(now, tat + emission * (n - burst))
+            if slot > now and not block:
+                return math.ceil(slot - now)
+            state.update(tat=tat + emission * n, updated=slot)
+        return math.ceil(slot - now)
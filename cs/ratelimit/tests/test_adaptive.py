@@ -0,0 +1,206 @@
+from datetime import timedelta
+from operator import attrgetter
+import asyncio
+import unittest
+
+from ..adaptive import AdaptiveLimit
+from ..components import RateLimitProperties
+from ..decorators import RateLimiter, ratelimited, ratelimitedmethod
+from ..exceptions import RateLimitError
+from ..testing import FakeClock
+
+
+class Throttled(Exception):
+
+    def __init__(self, retry_after=None):
+        super().__init__(retry_after)
+        self.retry_after = retry_after
+
+
+class UnitTestAdaptiveLimit(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limit = RateLimitProperties(max_count=10, interval=timedelta(seconds=1))
+
+    def adaptive(self, **kwargs):
+        adaptive = AdaptiveLimit(errors=(Throttled,), clock=self.clock, **kwargs)
+        adaptive.bind(self.limit)
+        return adaptive
+
+    def test_bind(self):
+        adaptive = self.adaptive()
+        self.assertEqual(10, adaptive.ceiling)
+        self.assertEqual(10.0, adaptive.count)
+        self.assertIn('max_count=10.0 of 1..10', repr(adaptive))
+
+    def test_decrease_once_per_interval(self):
+        adaptive = self.adaptive()
+        adaptive.throttled()
+        self.assertEqual(5, self.limit.max_count)
+        adaptive.throttled()  # calls in flight throttled together
+        self.assertEqual(5, self.limit.max_count)
+        self.clock.advance(1)
+        adaptive.throttled()
+        self.assertEqual(2, self.limit.max_count)
+        for _ in range(5):
+            self.clock.advance(1)
+            adaptive.throttled()
+        self.assertEqual(1, self.limit.max_count)  # floor
+
+    def test_increase_up_to_ceiling(self):
+        adaptive = self.adaptive(ceiling=12)
+        adaptive.throttled()
+        self.assertEqual(5, self.limit.max_count)
+        for _ in range(6):
+            adaptive.observe()
+        self.assertEqual(6, self.limit.max_count)  # about one per max_count calls
+        for _ in range(1000):
+            adaptive.observe()
+        self.assertEqual(12, self.limit.max_count)
+
+    def test_failed(self):
+        adaptive = self.adaptive()
+        adaptive.failed(ValueError())
+        self.assertEqual(10, self.limit.max_count)
+        adaptive.failed(Throttled())
+        self.assertEqual(5, self.limit.max_count)
+
+    def test_retry_after_holds_increase(self):
+        adaptive = self.adaptive(retry_after=attrgetter('retry_after'))
+        adaptive.failed(Throttled(retry_after=30))
+        for _ in range(100):
+            adaptive.observe()
+        self.assertEqual(5, self.limit.max_count)
+        self.clock.advance(30)
+        for _ in range(100):
+            adaptive.observe()
+        self.assertEqual(10, self.limit.max_count)
+
+    def test_max_latency(self):
+        adaptive = self.adaptive(max_latency=timedelta(seconds=2))
+        adaptive.observe(1)
+        self.assertEqual(10, self.limit.max_count)
+        adaptive.observe(3)
+        self.assertEqual(5, self.limit.max_count)
+
+    def test_unlimited(self):
+        self.limit.max_count = 0
+        with self.assertRaises(ValueError):
+            self.adaptive()
+        adaptive = self.adaptive(ceiling=8)
+        self.assertEqual(0, self.limit.max_count)
+        adaptive.throttled()
+        self.assertEqual(4, self.limit.max_count)
+        for _ in range(1000):
+            adaptive.observe()
+        self.assertEqual(8, self.limit.max_count)
+
+    def test_unbound(self):
+        adaptive = AdaptiveLimit(errors=(Throttled,))
+        with self.assertRaises(RateLimitError):
+            adaptive.throttled()
+        with self.assertRaises(RateLimitError):
+            adaptive.failed(Throttled())
+        with self.assertRaises(RateLimitError):
+            adaptive.observe()
+
+    def test_invalid_decrease(self):
+        with self.assertRaises(ValueError):
+            AdaptiveLimit(decrease=1)
+
+
+class UnitTestAdaptiveLimiters(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.throttle = False
+
+    def call(self):
+        if self.throttle:
+            raise Throttled()
+
+    def test_decorator(self):
+        adaptive = AdaptiveLimit(errors=[Throttled], clock=self.clock)
+
+        @ratelimited(max_count=4, interval=timedelta(seconds=1), block=True, adaptive=adaptive, clock=self.clock)
+        def my_callable():
+            self.call()
+        my_callable()
+        self.throttle = True
+        with self.assertRaises(Throttled):
+            my_callable()
+        self.assertEqual(2, my_callable.ratelimit.max_count)
+        self.throttle = False
+        for _ in range(10):
+            my_callable()
+        self.assertEqual(4, my_callable.ratelimit.max_count)
+
+    def test_coroutine(self):
+        adaptive = AdaptiveLimit(errors=(Throttled,), clock=self.clock)
+
+        @ratelimited(max_count=4, interval=timedelta(seconds=1), block=True, adaptive=adaptive, clock=self.clock)
+        async def my_callable():
+            self.call()
+        self.throttle = True
+        with self.assertRaises(Throttled):
+            asyncio.run(my_callable())
+        self.assertEqual(2, my_callable.ratelimit.max_count)
+
+    def test_map(self):
+        adaptive = AdaptiveLimit(errors=(Throttled,), clock=self.clock)
+
+        @ratelimited(max_count=4, interval=timedelta(seconds=1), adaptive=adaptive, clock=self.clock)
+        def my_callable(throttle):
+            self.throttle = throttle
+            self.call()
+        results = my_callable.ratelimit.map([False, True, False])
+        next(results)
+        with self.assertRaises(Throttled):
+            next(results)
+        self.assertEqual(2, my_callable.ratelimit.max_count)
+
+    def test_callable_max_count(self):
+        with self.assertRaises(ValueError):
+            ratelimited(max_count=lambda: 5, interval=timedelta(seconds=1), adaptive=AdaptiveLimit())(self.call)
+
+    def test_callable_interval(self):
+        adaptive = AdaptiveLimit(errors=(Throttled,), clock=self.clock)
+
+        @ratelimited(max_count=4, interval=lambda: timedelta(seconds=10), adaptive=adaptive, clock=self.clock)
+        def my_callable():
+            self.call()
+        my_callable()
+        adaptive.throttled()
+        self.assertEqual(2, my_callable.ratelimit.max_count)
+        self.clock.advance(5)
+        adaptive.throttled()  # within the interval resolved by the limiter
+        self.assertEqual(2, my_callable.ratelimit.max_count)
+        self.clock.advance(5)
+        adaptive.throttled()
+        self.assertEqual(1, my_callable.ratelimit.max_count)
+
+    def test_limiter_without_adaptive(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1))
+        self.assertIsNone(limiter.adaptive)
+
+    def test_properties(self):
+        clock = self.clock
+
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=4, interval=timedelta(seconds=1),
+                                              adaptive=AdaptiveLimit(errors=(Throttled,), clock=clock))
+                self.throttle = False
+
+            @ratelimitedmethod(attrgetter('rl'))
+            def my_callable(self):
+                if self.throttle:
+                    raise Throttled()
+
+        instance, other = MyClass(), MyClass()
+        instance.throttle = True
+        with self.assertRaises(Throttled):
+            instance.my_callable()
+        self.assertEqual(2, instance.rl.max_count)
+        self.assertEqual(4, other.rl.max_count)  # instances adapt on their own
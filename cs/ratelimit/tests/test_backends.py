@@ -0,0 +1,361 @@
+from datetime import timedelta
+import multiprocessing
+import socket
+import threading
+import time
+import unittest
+import uuid
+
+from ..backends import shm
+from ..backends.composite import CompositeState
+from ..backends.redis import RedisClient, RedisState
+from ..backends.striped import StripedState
+from ..components import RateLimitProperties
+from ..decorators import ratelimited
+from ..engines import ENGINES, GCRA
+from ..exceptions import RateLimitBackendError, RateLimitExceeded
+from ..interfaces import IRateLimiterBackend
+from ..state import to_ns
+from ..testing import FakeClock, FakeRedisServer
+
+
+SECOND = to_ns(1)
+
+
+class UnitTestRedisState(unittest.TestCase):
+
+    def setUp(self):
+        self.server = FakeRedisServer().__enter__()
+        self.client = RedisClient(self.server.host, self.server.port)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.__exit__(None, None, None)
+
+    def test_interface(self):
+        self.assertTrue(IRateLimiterBackend.providedBy(RedisState(self.client, 'key')))
+
+    def test_fixed_window(self):
+        state = RedisState(self.client, 'key')
+        engine = ENGINES['fixed_window']
+        self.assertEqual(0, state.acquire(engine, 2, 10 * SECOND, False))
+        self.assertEqual(0, state.acquire(engine, 2, 10 * SECOND, False))
+        self.assertGreater(state.acquire(engine, 2, 10 * SECOND, False), 9 * SECOND)
+        # blocking reserves the slot
+        self.assertGreater(state.acquire(engine, 2, 10 * SECOND, True), 9 * SECOND)
+        self.assertEqual(1, self.server.store[b'key']['counter'])
+
+    def test_gcra(self):
+        state = RedisState(self.client, 'key')
+        interval = 10 * SECOND
+        self.assertEqual(0, state.acquire(GCRA(burst=1), 10, interval, False))
+        self.assertAlmostEqual(SECOND, state.acquire(GCRA(burst=1), 10, interval, False), delta=SECOND // 10)
+        self.assertAlmostEqual(SECOND, state.acquire(GCRA(burst=1), 10, interval, True), delta=SECOND // 10)
+        self.assertAlmostEqual(2 * SECOND, state.acquire(GCRA(burst=1), 10, interval, True), delta=SECOND // 10)
+        # permits
+        self.assertAlmostEqual(0, state.acquire(GCRA(), 10, interval, False, n=5), delta=SECOND // 10)
+
+    def test_unlimited(self):
+        state = RedisState(self.client, 'key')
+        for _ in range(3):
+            self.assertEqual(0, state.acquire(ENGINES['gcra'], 0, SECOND, False))
+
+    def test_script_reload(self):
+        state = RedisState(self.client, 'key')
+        state.acquire(ENGINES['gcra'], 1, SECOND, False)
+        self.client.execute('FLUSHALL')
+        self.assertEqual(0, state.acquire(ENGINES['gcra'], 1, SECOND, False))
+
+    def test_unsupported_engine(self):
+        state = RedisState(self.client, 'key')
+        with self.assertRaises(ValueError):
+            state.acquire(ENGINES['sliding_window'], 1, SECOND, False)
+
+    def test_errors(self):
+        with self.assertRaises(RateLimitBackendError):
+            self.client.execute('NOPE')
+        sock = socket.socket()
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+        sock.close()
+        state = RedisState(RedisClient('127.0.0.1', port), 'key')
+        with self.assertRaises(RateLimitBackendError):
+            state.acquire(ENGINES['gcra'], 1, SECOND, False)
+
+    def test_failed_handshake(self):
+        client = RedisClient(self.server.host, self.server.port, password='secret')  # AUTH is an unknown command
+        for _ in range(2):  # the unauthenticated connection isn't kept for later commands
+            with self.assertRaises(RateLimitBackendError):
+                client.execute('PING')
+            self.assertIsNone(getattr(client._local, 'conn', None))  # pylint: disable=protected-access
+        self.assertEqual('PONG', self.client.execute('PING'))
+
+    def test_shared_limit(self):
+        def worker():
+            pass
+        # e.g. two processes sharing a quota
+        client2 = RedisClient(self.server.host, self.server.port)
+        self.addCleanup(client2.close)
+        worker1 = ratelimited(max_count=2, interval=timedelta(seconds=10), engine='gcra',
+                              state=RedisState(self.client, 'quota'))(worker)
+        worker2 = ratelimited(max_count=2, interval=timedelta(seconds=10), engine='gcra',
+                              state=RedisState(client2, 'quota'))(worker)
+        worker1()
+        worker2()
+        with self.assertRaises(RateLimitExceeded):
+            worker1()
+        with self.assertRaises(RateLimitExceeded):
+            worker2()
+
+    def test_properties(self):
+        rl = RateLimitProperties(max_count=1, state=RedisState(self.client, 'key'))
+        self.assertIsInstance(rl.state, RedisState)
+
+
+def _shm_worker(segment_name, results):
+    segment = shm.SharedMemorySegment(segment_name, slots=8)
+    state = segment.state('quota')
+    admitted = 0
+    for _ in range(50):
+        if not state.acquire(GCRA(), 20, 60 * SECOND, False):
+            admitted += 1
+    segment.close()
+    results.put(admitted)
+
+
+@unittest.skipIf(shm.fcntl is None, "requires fcntl")
+class UnitTestSharedMemoryState(unittest.TestCase):
+
+    def setUp(self):
+        self.name = f'csrl_test_{uuid.uuid4().hex[:8]}'
+        self.segment = shm.SharedMemorySegment(self.name, slots=8)
+        self.addCleanup(self.segment.unlink)
+        self.addCleanup(self.segment.close)
+
+    def test_interface(self):
+        self.assertTrue(IRateLimiterBackend.providedBy(self.segment.state('key')))
+
+    def test_engines(self):
+        for name, engine in ENGINES.items():
+            state = self.segment.state(name)
+            self.assertEqual(0, state.acquire(engine, 2, 10 * SECOND, False))
+            self.assertEqual(0, state.acquire(engine, 2, 10 * SECOND, False))
+            self.assertGreater(state.acquire(engine, 2, 10 * SECOND, False), 0, name)
+            self.assertGreater(state.acquire(engine, 2, 10 * SECOND, True), 0, name)
+
+    def test_permits(self):
+        state = self.segment.state('key')
+        self.assertEqual(0, state.acquire(ENGINES['gcra'], 4, 10 * SECOND, False, n=3))
+        self.assertGreater(state.acquire(ENGINES['gcra'], 4, 10 * SECOND, False, n=2), 0)
+        self.assertEqual(0, state.acquire(ENGINES['gcra'], 4, 10 * SECOND, False, n=1))
+        self.assertEqual(0, state.acquire(ENGINES['gcra'], 4, 10 * SECOND, False, n=0))
+
+    def test_attach(self):
+        other = shm.SharedMemorySegment(self.name, slots=8)
+        self.addCleanup(other.close)
+        self.segment.state('key').acquire(ENGINES['fixed_window'], 1, 10 * SECOND, False)
+        self.assertGreater(other.state('key').acquire(ENGINES['fixed_window'], 1, 10 * SECOND, False), 0)
+        with self.assertRaises(RateLimitBackendError):
+            shm.SharedMemorySegment(self.name, slots=16)
+
+    def test_full(self):
+        for i in range(8):
+            self.segment.state(str(i)).acquire(ENGINES['gcra'], 1, SECOND, False)
+        with self.assertRaises(RateLimitBackendError):
+            self.segment.state('one too many').acquire(ENGINES['gcra'], 1, SECOND, False)
+
+    def test_processes(self):
+        results = multiprocessing.Queue()
+        workers = [multiprocessing.Process(target=_shm_worker, args=(self.name, results)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(20, sum(results.get() for _ in workers))
+
+    def test_decorator(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10), state=self.segment.state('key'))
+        def my_callable():
+            pass
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+
+
+class UnitTestStripedState(unittest.TestCase):
+
+    def test_interface(self):
+        self.assertTrue(IRateLimiterBackend.providedBy(StripedState()))
+
+    def test_lease(self):
+        state = StripedState(chunk=4)
+        self.assertEqual(0, state.acquire(ENGINES['fixed_window'], 10, 10 * SECOND, False))
+        # the thread drew a chunk, the next calls don't touch the shared state
+        self.assertEqual(4, state.state.counter)
+        for _ in range(3):
+            self.assertEqual(0, state.acquire(ENGINES['fixed_window'], 10, 10 * SECOND, False))
+        self.assertEqual(4, state.state.counter)
+        self.assertEqual(0, state.acquire(ENGINES['fixed_window'], 10, 10 * SECOND, False))
+        self.assertEqual(8, state.state.counter)
+
+    def test_limit(self):
+        state = StripedState(chunk=4)
+        admitted = []
+
+        def worker():
+            admitted.append(sum(not state.acquire(GCRA(), 50, 10 * SECOND, False) for _ in range(100)))
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertLessEqual(sum(admitted), 50)
+        self.assertGreaterEqual(sum(admitted), 50 - 8 * 4)
+
+    def test_blocking(self):
+        state = StripedState(chunk=4)
+        interval = SECOND // 10
+        self.assertEqual(0, state.acquire(GCRA(), 2, interval, False, n=2))
+        self.assertGreater(state.acquire(GCRA(), 2, interval, False), 0)
+        self.assertAlmostEqual(interval // 2, state.acquire(GCRA(), 2, interval, True), delta=interval // 10)
+        self.assertAlmostEqual(interval, state.acquire(GCRA(), 2, interval, True), delta=interval // 10)
+
+    def test_lapse(self):
+        state = StripedState(chunk=4, lease=.01)
+        state.acquire(ENGINES['fixed_window'], 100, 10 * SECOND, False)
+        time.sleep(.02)
+        state.acquire(ENGINES['fixed_window'], 100, 10 * SECOND, False)
+        self.assertEqual(8, state.state.counter)
+
+    def test_limiter_clock(self):
+        clock = FakeClock()
+        state = StripedState(chunk=4, lease=1)
+
+        @ratelimited(max_count=100, interval=timedelta(seconds=10), state=state, clock=clock)
+        def my_callable():
+            pass
+        self.assertIs(clock, state.clock)
+        my_callable()
+        clock.advance(2)  # the lease lapses by the clock of the limiter
+        my_callable()
+        self.assertEqual(8, state.state.counter)
+        self.assertEqual(2, my_callable.ratelimit.stats()['admitted'])
+
+    def test_decorator(self):
+        @ratelimited(max_count=2, interval=timedelta(seconds=10), state=StripedState(chunk=4))
+        def my_callable():
+            pass
+        my_callable()
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+
+    def test_lease_takes_no_lock(self):
+        @ratelimited(max_count=10 ** 6, interval=timedelta(seconds=10), state=StripedState(chunk=100, lease=10))
+        def my_callable():
+            pass
+        drawn, go, leased = threading.Event(), threading.Event(), threading.Event()
+
+        def worker():
+            my_callable()  # draws the lease of the thread
+            drawn.set()
+            go.wait()
+            for _ in range(10):
+                my_callable()
+            leased.set()
+        thread = threading.Thread(target=worker)
+        thread.start()
+        drawn.wait()
+        stats = my_callable.ratelimit.metrics
+        # leased calls take neither the lock of the shared state nor the one of the stats
+        with my_callable.ratelimit.state.rlock, stats._lock:  # pylint: disable=protected-access
+            go.set()
+            self.assertTrue(leased.wait(5))
+        thread.join()
+        self.assertEqual(11, stats.admitted)
+
+
+class UnitTestCompositeState(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def test_interface(self):
+        self.assertTrue(IRateLimiterBackend.providedBy(CompositeState()))
+
+    def test_all_or_nothing(self):
+        minute = RateLimitProperties(max_count=3, interval=timedelta(minutes=1))
+        state = CompositeState([minute], clock=self.clock)
+        engine = ENGINES['fixed_window']
+        for _ in range(2):
+            self.assertEqual(0, state.acquire(engine, 2, SECOND, False))
+        # the per second limit rejects the call, the per minute limit keeps its permit
+        self.assertGreater(state.acquire(engine, 2, SECOND, False), 0)
+        self.assertEqual(2, minute.state.counter)
+        self.clock.advance(1)
+        self.assertEqual(0, state.acquire(engine, 2, SECOND, False))
+        self.clock.advance(1)
+        self.assertEqual(59 * SECOND, state.acquire(engine, 2, SECOND, False))
+        self.assertEqual(1, state.state.counter)
+
+    def test_blocking_waits_for_all(self):
+        state = CompositeState([(2, 10)], clock=self.clock)
+        engine = ENGINES['gcra']
+        self.assertEqual(0, state.acquire(engine, 10, SECOND, True))
+        self.assertEqual(0, state.acquire(engine, 10, SECOND, True))
+        self.assertEqual(5 * SECOND, state.acquire(engine, 10, SECOND, True))
+        self.assertEqual(15 * SECOND, state.acquire(engine, 10, SECOND, True, n=2))
+
+    def test_runtime_change(self):
+        minute = RateLimitProperties(max_count=1, interval=timedelta(minutes=1))
+        state = CompositeState([minute], clock=self.clock)
+        engine = ENGINES['fixed_window']
+        self.assertEqual(0, state.acquire(engine, 0, 0, False))
+        self.assertGreater(state.acquire(engine, 0, 0, False), 0)
+        minute.max_count = 0
+        self.assertEqual(0, state.acquire(engine, 0, 0, False))
+
+    def test_parent(self):
+        parent = CompositeState([(3, 60)], clock=self.clock)
+        first, second = parent.child(None, [(2, 60)]), parent.child(None, [(2, 60)])
+        engine = ENGINES['fixed_window']
+        self.assertEqual(0, first.acquire(engine, 0, 0, False))
+        self.assertEqual(0, first.acquire(engine, 0, 0, False))
+        self.assertGreater(first.acquire(engine, 0, 0, False), 0)
+        self.assertEqual(0, second.acquire(engine, 0, 0, False))
+        self.assertGreater(second.acquire(engine, 0, 0, False), 0)  # parent is full
+        self.assertIs(parent.rlock, second.rlock)
+        self.assertIn('2/0:01:00, 3/0:01:00', repr(second))
+
+    def test_backend_limit(self):
+        with self.assertRaises(ValueError):
+            CompositeState([RateLimitProperties(max_count=1, interval=timedelta(seconds=1),
+                                                state=StripedState())])
+
+    def test_decorator(self):
+        @ratelimited(max_count=2, interval=timedelta(seconds=1), clock=self.clock,
+                     state=CompositeState([(3, 60)], clock=self.clock))
+        def my_callable():
+            pass
+        my_callable()
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+        self.clock.advance(1)
+        my_callable()
+        with self.assertRaises(RateLimitExceeded) as context:
+            my_callable()
+        self.assertAlmostEqual(60, context.exception.retry_after)
+
+    def test_keyed(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10), key=lambda tenant: tenant,
+                     state=CompositeState([(2, 10)], clock=self.clock), clock=self.clock)
+        def my_callable(tenant):
+            pass
+        my_callable('a')
+        with self.assertRaises(RateLimitExceeded):
+            my_callable('a')
+        my_callable('b')
+        with self.assertRaises(RateLimitExceeded):
+            my_callable('c')  # the global limit is used up
+        self.assertEqual(0, my_callable.ratelimit.acquire_many(3, key='d'))
@@ -1,10 +1,16 @@
+from datetime import timedelta
+import os
+import subprocess  # nosec B404
+import sys
 import unittest
 
 from zope import component
+from zope.schema import ValidationError
 from zope.interface.verify import verifyObject
 
-from ..testing import RATELIMIT_INTEGRATION_LAYER
-from ..components import RateLimitProperties
+from . import RATELIMIT_INTEGRATION_LAYER
+from ..components import RateLimitProperties, ratelimitproperties_factory, validate
+from ..engines import TokenBucket
 from ..interfaces import IRateLimitProperties
 
 
@@ -18,6 +24,68 @@ class UnitTestRatelimitProperties(unittest.TestCase):
 
         verifyObject(IRateLimitProperties, rl_prop)
 
+    def test_engine(self):
+        rl_prop = RateLimitProperties(engine='sliding_window')
+        self.assertEqual('sliding_window', rl_prop.engine)
+        with self.assertRaises(ValueError):
+            RateLimitProperties(engine='nope')
+        with self.assertRaises(ValueError):
+            RateLimitProperties(engine=object())
+
+    def test_runtime_changes_not_validated(self):
+        rl_prop = RateLimitProperties(max_count=1)
+        with self.assertRaises(ValueError):
+            RateLimitProperties(max_count=-1)
+        rl_prop.max_count = 'many'  # plain slots, see validate()
+        with self.assertRaises(ValidationError):
+            validate(rl_prop)
+        rl_prop.max_count = 2
+        validate(rl_prop)
+        with self.assertRaises(AttributeError):
+            rl_prop.max_cuont = 3  # pylint: disable=assigning-non-slot
+
+    def test_mapping(self):
+        rl_prop = RateLimitProperties(max_count=1)
+        mapping = rl_prop.mapping()
+        self.assertEqual(1, mapping['max_count'])
+        mapping['max_count'] = 2
+        self.assertEqual(2, rl_prop.max_count)
+        self.assertIn('adaptive', mapping)
+        with self.assertRaises(KeyError):
+            mapping['nope']  # pylint: disable=pointless-statement
+        self.assertEqual(timedelta(0), dict(mapping)['interval'])
+
+    def test_import_without_zope(self):
+        code = ("import logging, sys, cs.ratelimit, cs.ratelimit.backends.composite, cs.ratelimit.backends.striped, "
+                "cs.ratelimit.testing; "
+                "sys.exit(any(name.startswith('zope') for name in sys.modules) or bool(logging.getLogger().handlers))")
+        path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=path)  # nosec B603
+
+    def test_lazy_imports(self):
+        code = ("import sys, cs.ratelimit; "
+                "lazy = ('adaptive', 'executor', 'pacing', 'persistence', 'queueing'); "
+                "assert not any(f'cs.ratelimit.{name}' in sys.modules for name in lazy); "
+                "assert cs.ratelimit.paced is sys.modules['cs.ratelimit.pacing'].paced")
+        path = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+        subprocess.run([sys.executable, '-c', code], check=True, cwd=path)  # nosec B603
+        import cs.ratelimit  # pylint: disable=import-outside-toplevel
+        for name in cs.ratelimit.__all__:
+            self.assertIsNotNone(getattr(cs.ratelimit, name), name)
+        with self.assertRaises(AttributeError):
+            cs.ratelimit.nope  # pylint: disable=pointless-statement
+
+    def test_factory_burst(self):
+        rl_prop = ratelimitproperties_factory(max_count=1, interval=1, engine='token_bucket', burst=5)
+        self.assertIsInstance(rl_prop.engine, TokenBucket)
+        self.assertEqual(5, rl_prop.engine.burst)
+        self.assertEqual(timedelta(seconds=1), rl_prop.interval)
+
+    def test_factory_max_wait(self):
+        rl_prop = ratelimitproperties_factory(max_count=1, interval=1, block=True, max_wait=.5)
+        self.assertEqual(timedelta(seconds=.5), rl_prop.max_wait)
+        self.assertIsNone(ratelimitproperties_factory(max_count=1).max_wait)
+
 
 class IntegrationTestRatelimitProperties(unittest.TestCase):
 
@@ -1,12 +1,18 @@
 from datetime import timedelta, datetime
+from operator import attrgetter
+import asyncio
+import inspect
 import logging
 import threading
+import time
 import unittest
 
+from . import logger_queue
 from ..components import RateLimitProperties
-from ..decorators import _rate_limited, ratelimited, _rate_limited_method, ratelimitedmethod
+from ..decorators import RateLimiter, _rate_limited, ratelimited, _rate_limited_method, ratelimitedmethod
 from ..exceptions import RateLimitExceeded
-from ..testing import logger_queue
+from ..keyed import KeyedRateLimiter
+from ..testing import FakeClock
 
 
 class UnitTestRatelimited(unittest.TestCase):
@@ -115,6 +121,104 @@ class UnitTestRatelimited(unittest.TestCase):
         t2.join()
         self.assertGreaterEqual(datetime.now() - t, timedelta(seconds=.1))
 
+    def test_lock_released_while_blocked(self):
+        rlock = threading.RLock()
+
+        @ratelimited(max_count=1, interval=timedelta(seconds=.2), block=True, rlock=rlock)
+        def my_callable():
+            pass
+        my_callable()
+        t1 = threading.Thread(target=my_callable)
+        t1.start()
+        time.sleep(.05)  # t1 is now waiting for its reserved slot
+        self.assertTrue(t1.is_alive())
+        self.assertTrue(rlock.acquire(timeout=.05))
+        rlock.release()
+        t1.join()
+
+    def test_fifo_reservations(self):
+        calls = []
+
+        @ratelimited(max_count=1, interval=timedelta(seconds=.05), block=True)
+        def my_callable(i):
+            calls.append((i, datetime.now()))
+        threads = []
+        for i in range(4):
+            threads.append(threading.Thread(target=my_callable, args=(i,)))
+            threads[-1].start()
+            time.sleep(.01)  # make reservation order deterministic
+        for thread in threads:
+            thread.join()
+        self.assertEqual([0, 1, 2, 3], [i for i, _ in calls])
+        for k, (_, t) in enumerate(calls):
+            self.assertGreaterEqual(t - calls[0][1], k * timedelta(seconds=.04))
+
+    def test_engine(self):
+        @ratelimited(max_count=2, interval=timedelta(seconds=1), block=False, engine='gcra')
+        def my_callable():
+            pass
+        my_callable()
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+
+        with self.assertRaises(ValueError):
+            ratelimited(max_count=1, engine='nope')(my_callable)
+
+    def test_coroutine(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=.1), block=False)
+        async def my_callable():
+            return 1
+        self.assertTrue(inspect.iscoroutinefunction(my_callable))
+        self.assertEqual(1, asyncio.run(my_callable()))
+        with self.assertRaises(RateLimitExceeded):
+            asyncio.run(my_callable())
+
+    def test_coroutine_blocking(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=.1), block=True)
+        async def my_callable():
+            pass
+
+        ticks = []
+
+        async def ticker():
+            # keeps running while my_callable waits, proving the loop isn't blocked
+            for _ in range(5):
+                ticks.append(datetime.now())
+                await asyncio.sleep(.01)
+
+        async def main():
+            await asyncio.gather(my_callable(), my_callable(), ticker())
+
+        t = datetime.now()
+        asyncio.run(main())
+        self.assertGreaterEqual(datetime.now() - t, timedelta(seconds=.1))
+        self.assertEqual(5, len(ticks))
+        self.assertLess(ticks[-1] - t, timedelta(seconds=.1))
+
+    def test_debug_switch(self):
+        @ratelimited(max_count=2, interval=timedelta(seconds=1), debug=False)
+        def my_callable():
+            pass
+        self.logger.setLevel(logging.DEBUG)
+        my_callable()
+        self.assertTrue(logger_queue.empty())
+        # can be switched on at runtime
+        my_callable.ratelimit.debug = True
+        my_callable()
+        self.assertIn('calling ', logger_queue.get_nowait())
+        self.assertIn('state for ratelimit', logger_queue.get_nowait())
+
+    def test_debug_bounded_repr(self):
+        @ratelimited(debug=True)
+        def my_callable(payload):
+            pass
+        self.logger.setLevel(logging.DEBUG)
+        my_callable('x' * 10000)
+        message = logger_queue.get_nowait()
+        self.assertIn('calling ', message)
+        self.assertLess(len(message), 500)
+
 
 class UnitTestRatelimitedMethod(unittest.TestCase):
     logger = logging.getLogger('cs.ratelimit.decorators')
@@ -218,3 +322,462 @@ class UnitTestRatelimitedMethod(unittest.TestCase):
         instance1.my_callable()
         with self.assertRaises(RateLimitExceeded):
             instance1.my_callable()
+
+    def test_coroutine_method(self):
+        from operator import attrgetter as a
+
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1,
+                                              interval=timedelta(seconds=.1),
+                                              block=True)
+
+            @ratelimitedmethod(a('rl'))
+            async def my_callable(self):
+                return self
+
+        instance1 = MyClass()
+
+        async def main():
+            return await asyncio.gather(instance1.my_callable(), instance1.my_callable())
+
+        t = datetime.now()
+        self.assertEqual([instance1, instance1], asyncio.run(main()))
+        self.assertGreaterEqual(datetime.now() - t, timedelta(seconds=.1))
+
+    def test_rate_limit_property_engine(self):
+        from operator import attrgetter as a
+        from ..engines import TokenBucket
+
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1,
+                                              interval=timedelta(seconds=1),
+                                              block=False,
+                                              engine=TokenBucket(burst=2))
+
+            @ratelimitedmethod(a('rl'))
+            def my_callable(self):
+                pass
+
+        instance1 = MyClass()
+        instance1.my_callable()
+        instance1.my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            instance1.my_callable()
+        self.assertIn('tokens', instance1.rl.state)
+
+    def test_rate_limit_property_resolved_once(self):
+        lookups = []
+
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=2, interval=timedelta(seconds=1))
+
+            def properties(self):
+                lookups.append(self)
+                return self.rl
+
+            @ratelimitedmethod(lambda self: self.properties())
+            def my_callable(self):
+                pass
+
+        instance1 = MyClass()
+        instance1.my_callable()
+        self.assertEqual(1, len(lookups))
+        # properties reassigned at runtime are picked up by the next call
+        instance1.rl.max_count = 1
+        with self.assertRaises(RateLimitExceeded):
+            instance1.my_callable()
+        instance1.rl = RateLimitProperties(max_count=1, interval=timedelta(seconds=1))
+        instance1.my_callable()
+        self.assertEqual(3, len(lookups))
+
+
+class UnitTestRateLimiter(unittest.TestCase):
+
+    def test_try_acquire(self):
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1))
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire(2))  # nothing is taken
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        stats = limiter.stats()
+        self.assertEqual(2, stats['admitted'])
+        self.assertEqual(2, stats['rejected'])
+
+    def test_acquire(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=.05), engine='gcra')
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=.01))
+        t = datetime.now()
+        self.assertTrue(limiter.acquire(timeout=timedelta(seconds=1)))
+        self.assertGreaterEqual(datetime.now() - t, timedelta(seconds=.03))
+
+    def test_reserve(self):
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), engine='gcra')
+        self.assertEqual(0, limiter.reserve(2))
+        self.assertAlmostEqual(.5, limiter.reserve(), delta=.1)
+        self.assertAlmostEqual(1.5, limiter.reserve(2), delta=.1)
+
+    def test_context_manager(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1))
+        with limiter:
+            pass
+        with self.assertRaises(RateLimitExceeded):
+            with limiter:
+                pass
+
+        async def main():
+            async with RateLimiter(max_count=1, interval=timedelta(seconds=.05), block=True) as limiter:
+                pass
+            async with limiter:
+                pass
+
+        t = datetime.now()
+        asyncio.run(main())
+        self.assertGreaterEqual(datetime.now() - t, timedelta(seconds=.04))
+
+    def test_keys(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1), keys=KeyedRateLimiter())
+        self.assertTrue(limiter.try_acquire(key='a'))
+        self.assertTrue(limiter.try_acquire(key='b'))
+        self.assertFalse(limiter.try_acquire(key='a'))
+
+    def test_runtime_config(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1))
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire())
+        limiter.max_count = lambda: 2
+        self.assertTrue(limiter.try_acquire())
+        with self.assertRaises(ValueError):
+            limiter.engine = 'nope'
+        self.assertIsNone(limiter.engine)
+
+    def test_runtime_config_decorated(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10))
+        def my_callable(batch):
+            return batch
+        my_callable([1])
+        with self.assertRaises(RateLimitExceeded):
+            my_callable([2])
+        # calls follow config changed at runtime, whatever it was when decorated
+        my_callable.ratelimit.cost = len
+        self.assertEqual([], my_callable([]))
+        my_callable.ratelimit.cost = None
+        my_callable.ratelimit.block = True
+        my_callable.ratelimit.max_wait = timedelta(seconds=1)
+        with self.assertRaises(RateLimitExceeded):
+            my_callable([3])
+        my_callable.ratelimit.max_count = 2
+        self.assertEqual([4], my_callable([4]))
+
+    def test_decorated(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=1))
+        def my_callable():
+            pass
+        self.assertIsInstance(my_callable.ratelimit, RateLimiter)
+        self.assertIs(my_callable.__wrapped__, my_callable.ratelimit.func)
+        my_callable.ratelimit.try_acquire()  # e.g. shared by other code paths
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+
+
+class UnitTestWeightedPermits(unittest.TestCase):
+
+    def test_cost(self):
+        @ratelimited(max_count=10, interval=timedelta(seconds=1), cost=lambda batch: len(batch))
+        def my_callable(batch):
+            pass
+        my_callable([1] * 6)
+        my_callable([1] * 4)
+        with self.assertRaises(RateLimitExceeded):
+            my_callable([1])
+        self.assertEqual(2, my_callable.ratelimit.stats()['admitted'])
+
+    def test_cost_not_available(self):
+        @ratelimited(max_count=10, interval=timedelta(seconds=1), cost=lambda batch: len(batch))
+        def my_callable(batch):
+            pass
+        my_callable([1] * 6)
+        with self.assertRaises(RateLimitExceeded):
+            my_callable([1] * 6)
+        my_callable([1] * 4)  # the rejected call took nothing
+
+    def test_cost_method(self):
+        class MyClass:
+            @ratelimitedmethod(max_count=3, interval=timedelta(seconds=1), cost=lambda self, n: n)
+            def my_callable(self, n):
+                pass
+
+        instance1 = MyClass()
+        instance1.my_callable(3)
+        with self.assertRaises(RateLimitExceeded):
+            instance1.my_callable(1)
+
+    def test_large_cost(self):
+        for engine in ('fixed_window', 'token_bucket', 'gcra', 'sliding_window'):
+            limiter = RateLimiter(max_count=10 ** 6, interval=timedelta(seconds=1), oversized='borrow', engine=engine)
+            start = time.perf_counter()
+            self.assertTrue(limiter.try_acquire(10 ** 7), engine)  # borrows 9e6 permits
+            self.assertGreater(limiter.reserve(10 ** 6), 9, engine)
+            self.assertLess(time.perf_counter() - start, .1, engine)
+
+    def test_cost_not_an_int(self):
+        with self.assertRaises(ValueError):
+            RateLimiter(max_count=10, interval=timedelta(seconds=1), cost=1.5)
+
+        @ratelimited(max_count=10, interval=timedelta(seconds=1), cost=lambda n: n)
+        def my_callable(n):
+            pass
+        with self.assertRaises(ValueError):
+            my_callable(1.5)
+        with self.assertRaises(ValueError):
+            my_callable.ratelimit.try_acquire(2.0)
+
+    def test_oversized_reject(self):
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), engine='token_bucket')
+        with self.assertRaises(RateLimitExceeded):
+            limiter.try_acquire(3)
+        self.assertTrue(limiter.try_acquire(2))
+        with self.assertRaises(ValueError):
+            RateLimiter(oversized='nope')
+        with self.assertRaises(ValueError):
+            limiter.try_acquire(-1)
+
+    def test_oversized_clamp(self):
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), oversized='clamp')
+        self.assertTrue(limiter.try_acquire(5))
+        self.assertFalse(limiter.try_acquire())
+
+    def test_oversized_borrow(self):
+        for engine in ('fixed_window', 'token_bucket', 'gcra', 'sliding_window'):
+            limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), oversized='borrow', engine=engine)
+            self.assertTrue(limiter.try_acquire(6), engine)
+            # the debt delays later permits
+            self.assertGreater(limiter.reserve(), 1, engine)
+
+    def test_oversized_borrow_waits_for_capacity(self):
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), oversized='borrow', engine='gcra')
+        self.assertTrue(limiter.try_acquire())
+        self.assertFalse(limiter.try_acquire(6))
+        self.assertTrue(limiter.try_acquire())
+
+
+class UnitTestBatches(unittest.TestCase):
+
+    def test_acquire_many(self):
+        limiter = RateLimiter(max_count=3, interval=timedelta(seconds=1))
+        self.assertEqual(2, limiter.acquire_many(2))
+        self.assertEqual(1, limiter.acquire_many(5))
+        self.assertEqual(0, limiter.acquire_many(1))
+        stats = limiter.stats()
+        self.assertEqual(3, stats['admitted'])
+        self.assertEqual(2, stats['rejected'])
+
+    def test_reserve_many(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1), engine='gcra')
+        delays = limiter.reserve_many(3)
+        self.assertEqual(0, delays[0])
+        self.assertAlmostEqual(1, delays[1], delta=.1)
+        self.assertAlmostEqual(2, delays[2], delta=.1)
+        self.assertFalse(limiter.try_acquire())
+
+    def test_reserve_many_mapping_state(self):
+        state = {}
+        limiter = RateLimiter(max_count=2, interval=timedelta(seconds=1), state=state)
+        self.assertEqual(2, limiter.acquire_many(3))
+        self.assertEqual(2, state['counter'])
+
+    def test_map(self):
+        @ratelimited(max_count=2, interval=timedelta(seconds=.05), engine='gcra')
+        def my_callable(value):
+            return value * 2
+
+        start = time.monotonic()
+        self.assertEqual([2, 4, 6, 8], list(my_callable.ratelimit.map([1, 2, 3, 4])))
+        # burst of 2, then one slot each .025 seconds
+        self.assertGreater(time.monotonic() - start, .04)
+        self.assertEqual(4, my_callable.ratelimit.stats()['admitted'])
+
+    def test_map_items(self):
+        limiter = RateLimiter(max_count=10, interval=timedelta(seconds=1))
+        self.assertEqual([1, 2], list(limiter.map([1, 2])))
+        self.assertEqual([(1, 'a'), (2, 'b')], list(limiter.map([1, 2], 'ab', chunk=1)))
+        with self.assertRaises(TypeError):
+            list(limiter.map())
+
+    def test_map_coroutine(self):
+        @ratelimited(max_count=10, interval=timedelta(seconds=1))
+        async def my_callable(value):
+            return value
+
+        with self.assertRaises(TypeError):
+            my_callable.ratelimit.map([1, 2])
+
+    def test_map_method_keys(self):
+        class MyClass:
+            @ratelimitedmethod(max_count=1, interval=timedelta(seconds=10), key=lambda self, value: value)
+            def my_callable(self, value):
+                return value
+
+        instance = MyClass()
+        # each key has a permit available right away
+        start = time.monotonic()
+        self.assertEqual(['a', 'b'], list(MyClass.my_callable.ratelimit.map([instance] * 2, 'ab')))
+        self.assertLess(time.monotonic() - start, 1)
+
+
+class UnitTestMaxWait(unittest.TestCase):
+
+    def test_max_wait(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10), block=True, max_wait=timedelta(seconds=.05))
+        def my_callable():
+            pass
+        my_callable()
+        start = time.monotonic()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            my_callable()
+        self.assertLess(time.monotonic() - start, 1)
+        self.assertAlmostEqual(10, raised.exception.retry_after, delta=1)
+
+    def test_max_wait_zero(self):
+        clock = FakeClock()
+        for max_wait in (0, timedelta(0)):
+            @ratelimited(max_count=1, interval=timedelta(hours=1), block=True, max_wait=max_wait, clock=clock)
+            def my_callable():
+                pass
+            my_callable()
+            with self.assertRaises(RateLimitExceeded) as raised:
+                my_callable()
+            self.assertEqual(0, clock.elapsed())
+            self.assertAlmostEqual(3600, raised.exception.retry_after, delta=1)
+
+    def test_waits_within_max_wait(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=.05), block=True, max_wait=1)
+        def my_callable():
+            pass
+        my_callable()
+        my_callable()
+        self.assertEqual(1, my_callable.ratelimit.stats()['blocked'])
+
+    def test_not_blocking_retry_after(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10))
+        def my_callable():
+            pass
+        my_callable()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            my_callable()
+        self.assertGreater(raised.exception.retry_after, 9)
+
+    def test_properties_max_wait(self):
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1, interval=timedelta(seconds=10), block=True,
+                                              max_wait=timedelta(seconds=.05))
+
+            @ratelimitedmethod(attrgetter('rl'))
+            def my_callable(self):
+                pass
+
+        instance = MyClass()
+        instance.my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            instance.my_callable()
+
+
+class UnitTestRateLimitExceeded(unittest.TestCase):
+
+    def test_details(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10))
+        def my_callable():
+            pass
+        my_callable()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            my_callable()
+        error = raised.exception
+        self.assertEqual(1, error.limit)
+        self.assertEqual(timedelta(seconds=10), error.interval)
+        self.assertIs(my_callable.__wrapped__, error.limiter)
+        self.assertGreater(error.retry_after, 9)
+        self.assertEqual((), error.args)
+        self.assertIn('with 1 calls per 0:00:10 timedelta', str(error))
+
+    def test_message(self):
+        self.assertEqual('nope', str(RateLimitExceeded('nope', retry_after=1)))
+        self.assertIsNone(RateLimitExceeded().retry_after)
+
+    def test_limiter(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=10))
+        with limiter:
+            pass
+        with self.assertRaises(RateLimitExceeded) as raised:
+            with limiter:
+                pass
+        self.assertIs(limiter, raised.exception.limiter)
+
+
+class UnitTestFakeClock(unittest.TestCase):
+
+    def test_simulated_hour(self):
+        clock = FakeClock()
+
+        @ratelimited(max_count=10, interval=timedelta(minutes=1), block=True, clock=clock)
+        def my_callable():
+            pass
+        start = time.monotonic()
+        for _ in range(600):
+            my_callable()
+        self.assertEqual(59 * 60, clock.elapsed())
+        self.assertLess(time.monotonic() - start, 5)
+        # the first call of each minute waits for it
+        self.assertEqual(59, my_callable.ratelimit.stats()['blocked'])
+
+    def test_engines(self):
+        for engine in ('fixed_window', 'token_bucket', 'gcra', 'sliding_window'):
+            clock = FakeClock(start=0)
+            limiter = RateLimiter(max_count=2, interval=timedelta(seconds=10), engine=engine, clock=clock)
+            self.assertEqual(2, limiter.acquire_many(3), engine)
+            clock.advance(20)
+            self.assertTrue(limiter.try_acquire(), engine)
+
+    def test_advance(self):
+        clock = FakeClock()
+
+        @ratelimited(max_count=1, interval=timedelta(hours=1), clock=clock)
+        def my_callable():
+            pass
+        my_callable()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            my_callable()
+        self.assertEqual(3600, raised.exception.retry_after)
+        clock.advance(timedelta(hours=1))
+        my_callable()
+
+    def test_coroutine(self):
+        clock = FakeClock()
+
+        @ratelimited(max_count=1, interval=timedelta(hours=1), block=True, clock=clock)
+        async def my_callable():
+            pass
+
+        async def calls():
+            await my_callable()
+            await my_callable()
+        asyncio.run(calls())
+        self.assertEqual(3600, clock.elapsed())
+
+    def test_keys(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1), clock=clock,
+                              keys=KeyedRateLimiter(ttl=timedelta(seconds=10), shards=1, clock=clock))
+        limiter.try_acquire(key='a')
+        clock.advance(20)
+        limiter.try_acquire(key='b')
+        self.assertNotIn('a', limiter.keys)
+
+    def test_sleepers(self):
+        clock = FakeClock(start=0)
+        clock.sleep(2)
+        clock.sleep(1)
+        self.assertEqual(3, clock.elapsed())
@@ -0,0 +1,134 @@
+import unittest
+
+from ..engines import ENGINES, FixedWindow, GCRA, SlidingWindow, TokenBucket, get_engine
+from ..state import LimiterState
+
+
+T0 = 1000000000000
+SECOND = 1000000000
+
+
+def new_state():
+    return LimiterState()
+
+
+class UnitTestEngines(unittest.TestCase):
+
+    def admitted(self, engine, state, times, max_count=2, interval=SECOND):
+        """Return the times in `times` (seconds after T0) that a non-blocking call is admitted at."""
+        admitted = []
+        for t in times:
+            now = T0 + int(t * SECOND)
+            if engine.reserve(state, now, max_count, interval, False) <= now:
+                admitted.append(t)
+        return admitted
+
+    def test_get_engine(self):
+        self.assertIsInstance(get_engine(), FixedWindow)
+        self.assertIs(ENGINES['gcra'], get_engine('gcra'))
+        engine = TokenBucket(burst=5)
+        self.assertIs(engine, get_engine(engine))
+        self.assertEqual(5, get_engine('token_bucket', burst=5).burst)
+        with self.assertRaises(ValueError):
+            get_engine('nope')
+
+    def test_unlimited(self):
+        for engine in ENGINES.values():
+            state = new_state()
+            self.assertEqual([0, 0, 0], self.admitted(engine, state, [0, 0, 0], max_count=0))
+
+    def test_fixed_window(self):
+        engine = FixedWindow()
+        state = new_state()
+        self.assertEqual([0, 0, 1.5], self.admitted(engine, state, [0, 0, .5, 1.5]))
+        # blocking reserves a slot one interval after the last call
+        now = T0 + 16 * SECOND // 10
+        self.assertEqual(now, engine.reserve(state, now, 2, SECOND, True))
+        self.assertEqual(T0 + 26 * SECOND // 10, engine.reserve(state, now, 2, SECOND, True))
+        self.assertEqual(T0 + 26 * SECOND // 10, state.updated)
+
+    def test_token_bucket(self):
+        engine = TokenBucket()
+        state = new_state()
+        # burst of 2, then refills one token every half second
+        self.assertEqual([0, 0, .5, 1], self.admitted(engine, state, [0, 0, .1, .5, .6, 1]))
+        state = new_state()
+        self.assertEqual([0, 0, 0, 0], self.admitted(TokenBucket(burst=4), state, [0, 0, 0, 0, 0], max_count=2))
+
+    def test_token_bucket_reservations(self):
+        engine = TokenBucket()
+        state = new_state()
+        slots = [engine.reserve(state, T0, 2, SECOND, True) for _ in range(4)]
+        self.assertEqual([T0, T0, T0 + SECOND // 2, T0 + SECOND], slots)
+
+    def test_gcra(self):
+        engine = GCRA()
+        state = new_state()
+        self.assertEqual([0, 0, .5, 1], self.admitted(engine, state, [0, 0, .1, .5, .6, 1]))
+        state = new_state()
+        slots = [GCRA(burst=1).reserve(state, T0, 2, SECOND, True) for _ in range(3)]
+        self.assertEqual([T0, T0 + SECOND // 2, T0 + SECOND], slots)
+
+    def test_sliding_window(self):
+        engine = SlidingWindow()
+        state = new_state()
+        # a fixed window would allow 2 more calls at 1.0
+        self.assertEqual([0, 0, 1.5], self.admitted(engine, state, [0, 0, .9, 1, 1.2, 1.5, 1.6]))
+
+    def test_sliding_window_reservations(self):
+        engine = SlidingWindow()
+        state = new_state()
+        slots = [engine.reserve(state, T0, 2, SECOND, True) for _ in range(4)]
+        self.assertEqual([T0, T0, T0 + 15 * SECOND // 10, T0 + 2 * SECOND], slots)
+
+    def test_sustained_rate(self):
+        # over a long period engines converge on max_count per interval
+        for name in ('token_bucket', 'gcra'):
+            state = new_state()
+            admitted = self.admitted(ENGINES[name], state, [t / 100 for t in range(10000)], max_count=10)
+            self.assertAlmostEqual(1000, len(admitted), delta=15, msg=name)
+        # the sliding window estimate is conservative, but never lets the rate through
+        state = new_state()
+        admitted = self.admitted(SlidingWindow(), state, [t / 100 for t in range(10000)], max_count=10)
+        self.assertLessEqual(len(admitted), 1000)
+        self.assertGreater(len(admitted), 850)
+
+    def test_non_blocking_leaves_state(self):
+        for engine in ENGINES.values():
+            state = new_state()
+            for _ in range(2):
+                engine.reserve(state, T0, 2, SECOND, False)
+            before = repr(state)
+            self.assertGreater(engine.reserve(state, T0, 2, SECOND, False), T0)
+            self.assertEqual(before, repr(state))
+
+    def test_permits(self):
+        # n permits at once land where the last of n single reservations would
+        engines = list(ENGINES.values()) + [TokenBucket(burst=5), GCRA(burst=1)]
+        for engine in engines:
+            for max_count in (1, 3, 10):
+                for taken in (0, 1, 2, 7):
+                    for n in (1, 2, 3, 9, 25):
+                        single, batch = new_state(), new_state()
+                        for state in (single, batch):
+                            for _ in range(taken):
+                                engine.reserve(state, T0, max_count, SECOND, True)
+                        now = T0 + SECOND // 3
+                        for _ in range(n):
+                            slot = engine.reserve(single, now, max_count, SECOND, True)
+                        msg = f'{engine!r} {max_count} {taken} {n}'
+                        # single token bucket reservations round up each wait, n at once only once
+                        batch_slot = engine.reserve(batch, now, max_count, SECOND, True, n)
+                        self.assertAlmostEqual(slot, batch_slot, delta=n, msg=msg)
+                        self.assertAlmostEqual(single.updated, batch.updated, delta=n, msg=msg)
+                        self.assertEqual(
+                            (single.counter, single.tat, single.window, single.previous),
+                            (batch.counter, batch.tat, batch.window, batch.previous), msg)
+                        self.assertAlmostEqual(single.tokens, batch.tokens, msg=msg)
+
+    def test_many_permits(self):
+        for engine in ENGINES.values():
+            state = new_state()
+            slot = engine.reserve(state, T0, 10, SECOND, True, 10 ** 9)
+            self.assertGreaterEqual(slot, T0 + (10 ** 8 - 1) * SECOND, engine)
+            self.assertGreater(engine.reserve(state, T0, 10, SECOND, False), slot - 1)
@@ -0,0 +1,118 @@
+from concurrent import futures
+from datetime import timedelta
+import threading
+import time
+import unittest
+
+from ..adaptive import AdaptiveLimit
+from ..decorators import RateLimiter
+from ..exceptions import RateLimitBackendError, RateLimitExceeded
+from ..executor import RateLimitedExecutor
+from ..properties import RateLimitProperties
+
+
+def _square(value):
+    return value * value
+
+
+def _fail():
+    raise ValueError('task failed')
+
+
+class UnitTestRateLimitedExecutor(unittest.TestCase):
+
+    def test_rate(self):
+        limit = RateLimitProperties(max_count=2, interval=timedelta(seconds=.1), engine='gcra')
+        started = []
+
+        def task(value):
+            started.append(time.monotonic())
+            return _square(value)
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(2), limit) as executor:
+            start = time.monotonic()
+            results = [executor.submit(task, value) for value in range(6)]
+            self.assertEqual([0, 1, 4, 9, 16, 25], [future.result() for future in results])
+        self.assertGreaterEqual(max(started) - start, .19)  # 2 per .1s with a burst of 2
+        self.assertEqual(6, limit.stats()['admitted'])
+
+    def test_workers_dont_wait(self):
+        limit = RateLimitProperties(max_count=1, interval=timedelta(seconds=10))
+        threads = set()
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), limit) as executor:
+            first = executor.submit(lambda: threads.add(threading.current_thread()))
+            first.result()
+            second = executor.submit(_square, 2)
+            time.sleep(.01)
+            self.assertFalse(second.running())
+            self.assertEqual(1, len(executor))
+            # the only worker is free for tasks of other code while the second one waits
+            self.assertEqual(9, executor.executor.submit(_square, 3).result(timeout=1))
+            executor.shutdown(wait=False, cancel_futures=True)
+        self.assertTrue(second.cancelled())
+
+    def test_exceptions(self):
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), RateLimiter()) as executor:
+            with self.assertRaises(ValueError):
+                executor.submit(_fail).result()
+        with self.assertRaises(RuntimeError):
+            executor.submit(_square, 1)
+
+    def test_coroutine_functions(self):
+        async def task():
+            pass
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), RateLimiter()) as executor:
+            with self.assertRaises(TypeError):
+                executor.submit(task)
+
+    def test_adaptive(self):
+        limit = RateLimitProperties(max_count=4, interval=timedelta(seconds=10),
+                                    adaptive=AdaptiveLimit(errors=(ValueError,)))
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), limit) as executor:
+            self.assertEqual(4, executor.submit(_square, 2).result(timeout=1))
+            with self.assertRaises(ValueError):
+                executor.submit(_fail).result(timeout=1)
+        self.assertEqual(2, limit.max_count)
+
+    def test_limiter_errors(self):
+        class FailingState:
+            def acquire(self, engine, max_count, interval, block, n=1):  # pylint: disable=too-many-arguments
+                raise RateLimitBackendError('backend down')
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=1), state=FailingState())
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), limiter) as executor:
+            for _ in range(2):  # the dispatcher keeps going
+                with self.assertRaises(RateLimitBackendError):
+                    executor.submit(_square, 2).result(timeout=1)
+
+    def test_cancel_queued(self):
+        limit = RateLimitProperties(max_count=1, interval=timedelta(seconds=.2))
+        called = []
+        with RateLimitedExecutor(futures.ThreadPoolExecutor(1), limit) as executor:
+            executor.submit(called.append, 1)
+            waiting = executor.submit(called.append, 2)
+            queued = executor.submit(called.append, 3)
+            self.assertTrue(queued.cancel())
+        self.assertTrue(waiting.done())
+        self.assertEqual([1, 2], called)
+
+    def test_shutdown_without_waiting(self):
+        limit = RateLimitProperties(max_count=1, interval=timedelta(seconds=.02), engine='gcra')
+        executor = RateLimitedExecutor(futures.ThreadPoolExecutor(1), limit)
+        results = [executor.submit(_square, value) for value in range(4)]
+        executor.shutdown(wait=False)
+        self.assertEqual([0, 1, 4, 9], [future.result(timeout=1) for future in results])
+        with self.assertRaises(RuntimeError):
+            executor.submit(_square, 1)
+
+    def test_max_pending(self):
+        limit = RateLimitProperties(max_count=1, interval=timedelta(seconds=10))
+        executor = RateLimitedExecutor(futures.ThreadPoolExecutor(1), limit, max_pending=1)
+        executor.submit(_square, 1).result()
+        executor.submit(_square, 2)
+        with self.assertRaises(RateLimitExceeded):
+            executor.submit(_square, 3)
+        executor.shutdown(cancel_futures=True)
+
+    def test_process_pool(self):
+        limit = RateLimitProperties(max_count=10, interval=timedelta(seconds=1))
+        with RateLimitedExecutor(futures.ProcessPoolExecutor(1), limit) as executor:
+            self.assertEqual([1, 4], list(executor.map(_square, [1, 2])))
@@ -0,0 +1,119 @@
+from datetime import timedelta
+from operator import attrgetter
+import threading
+import unittest
+
+from ..components import RateLimitProperties
+from ..decorators import ratelimited, ratelimitedmethod
+from ..exceptions import RateLimitExceeded
+from ..instrumentation import Instrumentation, LimiterStats, bounded_repr
+
+
+class UnitTestLimiterStats(unittest.TestCase):
+
+    def test_counters(self):
+        stats = LimiterStats()
+        stats.admit(0)
+        stats.admit(.02)
+        stats.admit(2)
+        stats.reject()
+        snapshot = stats.snapshot()
+        self.assertEqual(3, snapshot['admitted'])
+        self.assertEqual(1, snapshot['rejected'])
+        self.assertEqual(2, snapshot['blocked'])
+        self.assertAlmostEqual(2.02, snapshot['blocked_seconds'])
+        self.assertEqual(2, snapshot['max_blocked_seconds'])
+        self.assertEqual(1, snapshot['wait_histogram'][.05])
+        self.assertEqual(1, snapshot['wait_histogram'][5])
+        self.assertEqual(2, sum(snapshot['wait_histogram'].values()))
+        stats.reset()
+        self.assertEqual(0, stats.snapshot()['admitted'])
+
+    def test_threads(self):
+        stats = LimiterStats()
+        stats.admit(0)
+        threads = [threading.Thread(target=stats.admit, args=(0,)) for _ in range(4)]
+        threads.append(threading.Thread(target=stats.reject))
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # threads count on their own, the counts of ended threads are kept
+        self.assertEqual((5, 1), (stats.admitted, stats.rejected))
+        stats.reset()
+        stats.reject()
+        self.assertEqual((0, 1), (stats.admitted, stats.rejected))
+
+    def test_bounded_repr(self):
+        self.assertLess(len(bounded_repr(('x' * 10000,))), 100)
+
+
+class UnitTestInstrumentedDecorators(unittest.TestCase):
+
+    def test_stats(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=.05), block=False)
+        def my_callable():
+            pass
+        self.assertIsInstance(my_callable.ratelimit, Instrumentation)
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+        my_callable.ratelimit.on_admit = None  # hooks may be changed at runtime
+        stats = my_callable.ratelimit.stats()
+        self.assertEqual(1, stats['admitted'])
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(0, stats['blocked'])
+
+    def test_hooks(self):
+        events = []
+
+        @ratelimited(max_count=1, interval=timedelta(seconds=.05), block=True,
+                     on_admit=lambda func, wait: events.append(('admit', wait > 0)),
+                     on_wait=lambda func, wait: events.append(('wait', wait > 0)))
+        def my_callable():
+            pass
+        my_callable()
+        my_callable()
+        self.assertEqual([('admit', False), ('wait', True), ('admit', True)], events)
+        stats = my_callable.ratelimit.stats()
+        self.assertEqual(1, stats['blocked'])
+        self.assertGreater(stats['max_blocked_seconds'], 0)
+
+        errors = []
+        my_callable = ratelimited(max_count=1, interval=timedelta(seconds=1),
+                                  on_reject=lambda func, error: errors.append(error))(my_callable)
+        my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+        self.assertIsInstance(errors[0], RateLimitExceeded)
+
+    def test_properties_stats(self):
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1, interval=timedelta(seconds=1))
+
+            @ratelimitedmethod(attrgetter('rl'))
+            def my_callable(self):
+                pass
+
+        instance1 = MyClass()
+        instance2 = MyClass()
+        instance1.my_callable()
+        with self.assertRaises(RateLimitExceeded):
+            instance1.my_callable()
+        instance2.my_callable()
+        self.assertEqual(1, instance1.rl.stats()['admitted'])
+        self.assertEqual(1, instance1.rl.stats()['rejected'])
+        self.assertEqual(1, instance2.rl.stats()['admitted'])
+        # the decorated method counts the calls of all instances
+        self.assertEqual(2, MyClass.my_callable.ratelimit.stats()['admitted'])
+
+    def test_properties_mapping(self):
+        rl = RateLimitProperties(max_count=1, interval=timedelta(seconds=1))
+
+        @ratelimited(**rl.mapping())
+        def my_callable():
+            pass
+        my_callable()
+        self.assertEqual(1, rl.stats()['admitted'])
+        self.assertIs(rl.metrics, my_callable.ratelimit.metrics)
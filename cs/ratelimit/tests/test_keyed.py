@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+import threading
+import unittest
+
+from ..decorators import ratelimited, ratelimitedmethod
+from ..exceptions import RateLimitExceeded
+from ..keyed import KeyedRateLimiter
+from ..state import LimiterState
+
+
+class UnitTestKeyedRateLimiter(unittest.TestCase):
+
+    def test_state(self):
+        keys = KeyedRateLimiter()
+        with keys.rlock('a'):
+            state = keys.state('a')
+            self.assertIsInstance(state, LimiterState)
+            self.assertEqual(datetime.min, state['updated'])
+            self.assertEqual(0, state['counter'])
+            self.assertIs(state, keys.state('a'))
+        self.assertIn('a', keys)
+        self.assertNotIn('b', keys)
+        self.assertEqual(1, len(keys))
+        keys.clear()
+        self.assertEqual(0, len(keys))
+
+    def test_max_keys(self):
+        keys = KeyedRateLimiter(max_keys=10, shards=1)
+        for i in range(100):
+            keys.state(i)
+        self.assertEqual(10, len(keys))
+        self.assertEqual(list(range(90, 100)), [i for i in range(100) if i in keys])
+        # most recently used keys are kept
+        keys.state(90)
+        keys.state(100)
+        self.assertIn(90, keys)
+        self.assertNotIn(91, keys)
+
+    def test_max_keys_sharded(self):
+        keys = KeyedRateLimiter(max_keys=64, shards=8)
+        for i in range(10000):
+            keys.state(str(i))
+        self.assertLessEqual(len(keys), 64)
+
+    def test_ttl(self):
+        keys = KeyedRateLimiter(ttl=timedelta(seconds=1), shards=1)
+        keys.state('idle')['updated'] = datetime.now() - timedelta(seconds=2)
+        keys.state('active')['updated'] = datetime.now()
+        keys.state('new')
+        self.assertNotIn('idle', keys)
+        self.assertIn('active', keys)
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            KeyedRateLimiter(max_keys=0)
+        with self.assertRaises(ValueError):
+            KeyedRateLimiter(shards=0)
+
+
+class UnitTestKeyedDecorators(unittest.TestCase):
+
+    def test_ratelimited(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=1), key=lambda tenant: tenant)
+        def my_callable(tenant):
+            pass
+        my_callable('a')
+        my_callable('b')
+        with self.assertRaises(RateLimitExceeded):
+            my_callable('a')
+
+    def test_shared_keys(self):
+        keys = KeyedRateLimiter(max_keys=1)
+
+        @ratelimited(max_count=1, interval=timedelta(seconds=1), key=lambda tenant: tenant, keys=keys)
+        def my_callable(tenant):
+            pass
+        my_callable('a')
+        my_callable('b')  # evicts 'a'
+        my_callable('a')
+        self.assertEqual(1, len(keys))
+
+    def test_ratelimitedmethod(self):
+        class MyClass:
+            @ratelimitedmethod(max_count=1, interval=timedelta(seconds=1),
+                               key=lambda self, host: host)
+            def my_callable(self, host):
+                pass
+
+        instance1 = MyClass()
+        instance2 = MyClass()
+        instance1.my_callable('a')
+        instance1.my_callable('b')
+        with self.assertRaises(RateLimitExceeded):
+            instance2.my_callable('a')
+
+    def test_syncronization(self):
+        calls = []
+
+        @ratelimited(max_count=5, interval=timedelta(seconds=10), key=lambda i: i % 4)
+        def my_callable(i):
+            calls.append(i)
+
+        def worker(i):
+            for _ in range(10):
+                try:
+                    my_callable(i)
+                except RateLimitExceeded:
+                    pass
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(20, len(calls))
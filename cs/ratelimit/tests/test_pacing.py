@@ -0,0 +1,76 @@
+from datetime import timedelta
+import asyncio
+import unittest
+
+from ..decorators import RateLimiter
+from ..pacing import apaced, paced
+from ..properties import RateLimitProperties
+from ..testing import FakeClock
+
+
+class UnitTestPaced(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.pulled = []
+
+    def limiter(self, max_count=2, engine='gcra'):
+        return RateLimiter(max_count=max_count, interval=timedelta(seconds=1), engine=engine, clock=self.clock)
+
+    def source(self, count):
+        for item in range(count):
+            self.pulled.append(item)
+            yield item
+
+    def test_rate(self):
+        paced_items = paced(self.source(6), self.limiter())
+        self.assertEqual([0, 1, 2, 3, 4, 5], list(paced_items))
+        self.assertEqual(2, self.clock.elapsed())  # burst of 2, then every .5s
+
+    def test_lazy(self):
+        paced_items = paced(self.source(100), self.limiter())
+        self.assertEqual(0, next(paced_items))
+        self.assertEqual(1, next(paced_items))
+        self.assertEqual([0, 1], self.pulled)
+
+    def test_chunk(self):
+        limiter = self.limiter(max_count=4, engine='token_bucket')
+        batches = paced(self.source(7), limiter, chunk=3)
+        self.assertEqual([0, 1, 2], next(batches))  # 3 of the 4 permits
+        self.assertEqual([3], next(batches))  # the one left
+        self.assertEqual([0, 1, 2, 3], self.pulled)
+        self.assertEqual(0, self.clock.elapsed())
+        self.assertEqual([4], next(batches))  # waits for the next permit
+        self.assertEqual(.25, self.clock.elapsed())
+        self.clock.advance(10)
+        self.assertEqual([5, 6], next(batches))
+        self.assertEqual([], list(batches))
+
+    def test_properties(self):
+        limit = RateLimitProperties(max_count=1, interval=timedelta(seconds=.01))
+        self.assertEqual([0, 1], list(paced(range(2), limit)))
+        self.assertEqual(2, limit.stats()['admitted'])
+
+
+class UnitTestApaced(unittest.TestCase):
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def limiter(self):
+        return RateLimiter(max_count=2, interval=timedelta(seconds=1), engine='gcra', clock=self.clock)
+
+    def test_async_iterable(self):
+        async def source():
+            for item in range(6):
+                yield item
+
+        async def consume():
+            return [item async for item in apaced(source(), self.limiter())]
+        self.assertEqual([0, 1, 2, 3, 4, 5], asyncio.run(consume()))
+        self.assertEqual(2, self.clock.elapsed())
+
+    def test_chunk(self):
+        async def consume():
+            return [batch async for batch in apaced(range(5), self.limiter(), chunk=4)]
+        self.assertEqual([[0, 1], [2], [3], [4]], asyncio.run(consume()))
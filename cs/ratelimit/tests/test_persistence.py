@@ -0,0 +1,192 @@
+from datetime import timedelta
+from operator import attrgetter
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from ..backends.striped import StripedState
+from ..components import RateLimitProperties
+from ..decorators import RateLimiter, ratelimited, ratelimitedmethod
+from ..exceptions import RateLimitError, RateLimitExceeded
+from ..keyed import KeyedRateLimiter
+from ..persistence import SnapshotRegistry, StateSnapshot, save_snapshot
+from ..state import NEVER, LimiterState, clock
+
+
+class UnitTestStateSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'limits.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        now = clock()
+        saved = LimiterState(updated=now, counter=3)
+        saved.tokens = 1.5
+        saved.tat = now + 10
+        save_snapshot(self.path, [('a', saved), ('b', LimiterState())] + [(f'n{i}', LimiterState()) for i in range(50)])
+        self.assertEqual(8 * 3 + 52 * 7 * 8, os.path.getsize(self.path))
+
+        snapshot = StateSnapshot(self.path)
+        self.addCleanup(snapshot.close)
+        self.assertEqual(52, len(snapshot))
+        self.assertIn('n42', snapshot)
+        self.assertNotIn('c', snapshot)
+        state = LimiterState()
+        self.assertTrue(snapshot.restore('a', state))
+        self.assertAlmostEqual(now, state.updated, delta=10 ** 7)  # clocks read twice to convert
+        self.assertEqual(state.tat - state.updated, 10)
+        self.assertEqual((3, 1.5), (state.counter, state.tokens))
+        self.assertTrue(snapshot.restore('b', state))
+        self.assertEqual((NEVER, 0, None), (state.updated, state.counter, state.tokens))
+        self.assertFalse(snapshot.restore('c', state))
+        mapping = {}
+        snapshot.restore('a', mapping)
+        self.assertEqual(3, mapping['counter'])
+        snapshot.detach()  # copied out, lookups go on
+        self.assertIn('n42', snapshot)
+        snapshot.close()
+        self.assertFalse(snapshot.restore('a', state))
+
+    def test_invalid(self):
+        for content in (b'', b'not a snapshot file'):
+            with open(self.path, 'wb') as file:
+                file.write(content)
+            with self.assertRaises(RateLimitError):
+                StateSnapshot(self.path)
+
+
+class UnitTestSnapshotRegistry(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'limits.snapshot')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def limited(self):
+        @ratelimited(max_count=2, interval=timedelta(minutes=1), key=lambda tenant: tenant)
+        def my_callable(tenant):
+            pass
+        return my_callable
+
+    def test_warm_restart(self):
+        registry = SnapshotRegistry(self.path)
+        self.assertIsNone(registry.snapshot)
+        before = registry.register('vendor', self.limited())
+        properties = registry.register('properties', RateLimitProperties(max_count=1, interval=timedelta(hours=1)))
+        limiter = registry.register('limiter', RateLimiter(max_count=1, interval=timedelta(hours=1)))
+        for _ in range(2):
+            before('a')
+        before('b')
+        limiter.acquire()
+        properties.state.counter = 1
+        registry.save()
+
+        # the restarted process resumes the limits
+        registry = SnapshotRegistry(self.path)
+        self.addCleanup(registry.close)
+        after = registry.register('vendor', self.limited())
+        limiter = registry.register('limiter', RateLimiter(max_count=1, interval=timedelta(hours=1)))
+        properties = registry.register('properties', RateLimitProperties(max_count=1, interval=timedelta(hours=1)))
+        self.assertFalse(limiter.try_acquire())
+        self.assertEqual(1, properties.state.counter)
+        self.assertEqual(0, len(after.ratelimit.keys))  # keys are restored as they are used
+        with self.assertRaises(RateLimitExceeded):
+            after('a')
+        after('b')
+        with self.assertRaises(RateLimitExceeded):
+            after('b')
+        after('c')
+        registry.save()  # replaces the file the snapshot was mapped from
+        self.assertIsNotNone(registry.snapshot)
+        after('d')
+        with self.assertRaises(RateLimitExceeded):
+            after('a')
+
+    def test_keyed_registry(self):
+        registry = SnapshotRegistry(self.path)
+        keys = registry.register('tenants', KeyedRateLimiter())
+        keys.state(('tenant', 1)).counter = 5
+        registry.save()
+        with SnapshotRegistry(self.path) as registry:
+            keys = registry.register('tenants', KeyedRateLimiter())
+            self.assertEqual(5, keys.state(('tenant', 1)).counter)
+            self.assertEqual(0, keys.state(('tenant', 2)).counter)
+
+    def test_key_names(self):
+        class Tenant:
+            def __init__(self, name):
+                self.name = name
+
+        registry = SnapshotRegistry(self.path)
+        keys = registry.register('objects', KeyedRateLimiter())
+        keys.state(Tenant('a'))
+        with self.assertRaises(TypeError):  # the repr of objects differs between processes
+            registry.save()
+        registry.register('objects', KeyedRateLimiter())
+        keys = registry.register('tenants', KeyedRateLimiter(), key_name=attrgetter('name'))
+        keys.state(Tenant('a')).counter = 5
+        registry.save()
+        with SnapshotRegistry(self.path) as registry:
+            keys = registry.register('tenants', KeyedRateLimiter(), key_name=attrgetter('name'))
+            self.assertEqual(5, keys.state(Tenant('a')).counter)
+
+    def test_state_per_call(self):
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1, interval=timedelta(hours=1))
+
+            @ratelimitedmethod(attrgetter('rl'))
+            def my_callable(self):
+                pass
+
+        registry = SnapshotRegistry(self.path)
+        with self.assertRaises(ValueError):
+            registry.register('method', MyClass.my_callable)
+        with self.assertRaises(ValueError):
+            registry.register('callable', RateLimiter(max_count=1, interval=timedelta(hours=1),
+                                                      state=lambda: LimiterState()))
+        registry.register('properties', MyClass().rl)
+
+    def test_striped_state(self):
+        registry = SnapshotRegistry(self.path)
+        limiter = registry.register('striped', RateLimiter(max_count=100, interval=timedelta(hours=1),
+                                                           state=StripedState(chunk=10)))
+        limiter.acquire()
+        with limiter.state.rlock:  # copies are taken under the lock guarding lease draws
+            saving = threading.Thread(target=registry.save)
+            saving.start()
+            saving.join(.05)
+            self.assertFalse(os.path.exists(self.path))
+        saving.join()
+        with StateSnapshot(self.path) as snapshot:
+            self.assertTrue(snapshot.restore('striped', LimiterState()))
+
+    def test_unreadable_snapshot(self):
+        with open(self.path, 'wb') as file:
+            file.write(b'garbage')
+        registry = SnapshotRegistry(self.path)
+        self.assertIsNone(registry.snapshot)
+        registry.register('limiter', RateLimiter(max_count=1, interval=timedelta(hours=1))).acquire()
+        registry.save()
+        with StateSnapshot(self.path) as snapshot:
+            self.assertEqual(1, len(snapshot))
+
+    def test_periodic(self):
+        registry = SnapshotRegistry(self.path)
+        registry.register('limiter', RateLimiter(max_count=1, interval=timedelta(hours=1)))
+        registry.start(interval=.01)
+        while not os.path.exists(self.path):
+            time.sleep(.01)
+        registry.stop()
+        self.assertIsNone(registry._thread)  # pylint: disable=protected-access
+        with StateSnapshot(self.path) as snapshot:
+            self.assertEqual(1, len(snapshot))
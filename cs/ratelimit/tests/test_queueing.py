@@ -0,0 +1,155 @@
+from datetime import timedelta
+from operator import attrgetter
+import functools
+import threading
+import time
+import unittest
+
+from ..components import RateLimitProperties
+from ..decorators import RateLimiter, ratelimited, ratelimitedmethod
+from ..exceptions import RateLimitExceeded
+from ..queueing import WaiterQueue
+from ..testing import FakeClock
+
+
+class UnitTestWaiterQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.available = 0
+        self.admitted = []
+
+    def take(self, name):
+        # runs with the queue lock held
+        if self.available:
+            self.available -= 1
+            self.admitted.append(name)
+            return 0
+        return 10 ** 7
+
+    def start(self, queue, name, priority):
+        waiters = len(queue)
+        thread = threading.Thread(target=queue.wait, args=(functools.partial(self.take, name), priority))
+        thread.start()
+        while len(queue) == waiters:
+            time.sleep(.001)
+        return thread
+
+    def test_priority_then_arrival_order(self):
+        queue = WaiterQueue()
+        threads = [self.start(queue, 'backfill1', 1), self.start(queue, 'backfill2', 1),
+                   self.start(queue, 'interactive', 0)]
+        self.available = 3
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['interactive', 'backfill1', 'backfill2'], self.admitted)
+        self.assertEqual(0, len(queue))
+
+    def test_no_overtaking(self):
+        queue = WaiterQueue()
+        thread = self.start(queue, 'waiting', 0)
+        self.available = 1
+        # a permit is available, but it belongs to the waiting caller
+        self.assertEqual(-1, queue.wait(functools.partial(self.take, 'late'), 0, timeout=0))
+        thread.join()
+        self.assertEqual(['waiting'], self.admitted)
+
+    def test_max_depth(self):
+        queue = WaiterQueue(max_depth=1)
+        thread = self.start(queue, 'waiting', 0)
+        start = time.monotonic()
+        self.assertIsNone(queue.wait(functools.partial(self.take, 'rejected')))
+        self.assertLess(time.monotonic() - start, .5)
+        self.available = 1
+        thread.join()
+
+    def test_timeout(self):
+        queue = WaiterQueue()
+        self.assertEqual(-10 ** 10, queue.wait(lambda: 10 ** 10, timeout=10 ** 7))  # when the permits come
+        self.assertEqual(0, len(queue))
+        self.available = 1
+        self.assertEqual(0, queue.wait(functools.partial(self.take, 'free')))
+
+
+class UnitTestQueuedLimiters(unittest.TestCase):
+
+    def test_decorator(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=.2), block=True, queue=WaiterQueue(max_depth=1))
+        def my_callable():
+            pass
+        my_callable()
+        thread = threading.Thread(target=my_callable)
+        thread.start()
+        while not len(my_callable.ratelimit.queue):
+            time.sleep(.001)
+        with self.assertRaises(RateLimitExceeded):
+            my_callable()
+        thread.join()
+        stats = my_callable.ratelimit.stats()
+        self.assertEqual(2, stats['admitted'])
+        self.assertEqual(1, stats['rejected'])
+        self.assertEqual(1, stats['blocked'])
+
+    def test_max_wait(self):
+        @ratelimited(max_count=1, interval=timedelta(seconds=10), block=True, max_wait=timedelta(seconds=.05),
+                     queue=WaiterQueue())
+        def my_callable():
+            pass
+        my_callable()
+        with self.assertRaises(RateLimitExceeded) as raised:
+            my_callable()
+        self.assertAlmostEqual(10, raised.exception.retry_after, delta=1)
+
+    def test_priority(self):
+        admitted = []
+
+        @ratelimited(max_count=1, interval=timedelta(seconds=.05), block=True, engine='gcra', queue=WaiterQueue(),
+                     priority=lambda name: 0 if name.startswith('interactive') else 1)
+        def my_callable(name):
+            admitted.append(name)
+        my_callable('first')
+        queue = my_callable.ratelimit.queue
+        threads = []
+        for name in ('backfill', 'interactive'):
+            threads.append(threading.Thread(target=my_callable, args=(name,)))
+            threads[-1].start()
+            while len(queue) < len(threads):
+                time.sleep(.001)
+        for thread in threads:
+            thread.join()
+        self.assertEqual(['first', 'interactive', 'backfill'], admitted)
+
+    def test_acquire_timeout(self):
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=10), queue=WaiterQueue())
+        self.assertTrue(limiter.acquire())
+        self.assertFalse(limiter.acquire(timeout=.01))
+
+    def test_clock(self):
+        clock = FakeClock()
+        limiter = RateLimiter(max_count=1, interval=timedelta(seconds=10), block=True, queue=WaiterQueue(),
+                              clock=clock)
+        limiter.acquire()
+        limiter.acquire()
+        self.assertEqual(10, clock.elapsed())
+        self.assertFalse(limiter.acquire(timeout=5))
+        self.assertEqual(10, clock.elapsed())
+
+    def test_properties(self):
+        class MyClass:
+            def __init__(self):
+                self.rl = RateLimitProperties(max_count=1, interval=timedelta(seconds=.2), block=True,
+                                              queue=WaiterQueue(max_depth=1))
+
+            @ratelimitedmethod(attrgetter('rl'))
+            def my_callable(self):
+                pass
+
+        instance = MyClass()
+        instance.my_callable()
+        thread = threading.Thread(target=instance.my_callable)
+        thread.start()
+        while not len(instance.rl.queue):
+            time.sleep(.001)
+        with self.assertRaises(RateLimitExceeded):
+            instance.my_callable()
+        thread.join()
+        MyClass().my_callable()  # other instances have their own queue
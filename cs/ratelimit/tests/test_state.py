@@ -0,0 +1,46 @@
+from datetime import datetime, timedelta
+import unittest
+
+from ..state import NEVER, LimiterState, clock, from_datetime, to_datetime, to_ns
+
+
+class UnitTestLimiterState(unittest.TestCase):
+
+    def test_to_ns(self):
+        self.assertEqual(1500000000, to_ns(timedelta(seconds=1.5)))
+        self.assertEqual(1500000000, to_ns(1.5))
+        self.assertEqual(0, to_ns(None))
+
+    def test_datetime(self):
+        self.assertEqual(datetime.min, to_datetime(NEVER))
+        self.assertEqual(NEVER, from_datetime(datetime.min))
+        now = clock()
+        self.assertAlmostEqual(now, from_datetime(to_datetime(now)), delta=1000)
+        self.assertAlmostEqual(datetime.now(), to_datetime(now), delta=timedelta(seconds=1))
+
+    def test_mapping(self):
+        state = LimiterState()
+        self.assertEqual(datetime.min, state['updated'])
+        self.assertEqual(0, state['counter'])
+        self.assertIn('tat', state)
+        self.assertNotIn('nope', state)
+        self.assertIsNone(state.get('nope'))
+        with self.assertRaises(KeyError):
+            state['nope'] = 1
+        updated = datetime.now()
+        state['updated'] = updated
+        self.assertAlmostEqual(updated, state['updated'], delta=timedelta(microseconds=1))
+        self.assertEqual(state.updated, from_datetime(updated))
+
+    def test_mapping_round_trip(self):
+        mapping = {'updated': datetime.now(), 'counter': 3}
+        state = LimiterState.from_mapping(mapping)
+        self.assertEqual(3, state.counter)
+        state.tokens = 1.5
+        state.to_mapping(mapping)
+        self.assertEqual({'updated', 'counter', 'tokens'}, set(mapping))
+        self.assertEqual(1.5, mapping['tokens'])
+
+    def test_slots(self):
+        with self.assertRaises(AttributeError):
+            LimiterState().nope = 1
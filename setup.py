@@ -13,6 +13,13 @@ from setuptools import setup, find_packages
 version = '1.3.1'
 
 
+zope_require = [
+    'zope.component',
+    'zope.interface',
+    'zope.schema',
+]
+
+
 tests_require = [
     'zope.testrunner',
     'zope.configuration',
@@ -74,12 +81,10 @@ setup(name='cs.ratelimit',
       zip_safe=False,
       install_requires=[
           'setuptools',
-          'zope.component',
-          'zope.interface',
-          'zope.schema'
       ],
       extras_require={
-            'dev': tests_require + lint_require,
+            'zope': zope_require,
+            'dev': zope_require + tests_require + lint_require,
       },
       entry_points={},
       scripts=['util/run-tests.sh', 'util/lint.sh'],
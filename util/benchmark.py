@@ -0,0 +1,193 @@
+"""Benchmarks of cs.ratelimit limiter overhead, contention and accuracy.
+
+Runs offline against the working tree and reports, for each scenario and
+thread count, the nanoseconds a call takes, the throughput of all threads
+and, for saturated blocking limiters, how far the achieved rate is from
+max_count per interval.  Use ``--json`` for one JSON object per result, to
+keep and compare between versions::
+
+    python util/benchmark.py --threads 1,8,64 --json > before.jsonl
+
+Overhead scenarios:
+ * unlimited: limits that evaluate to False
+ * under_quota: limited, but never close to max_count
+ * saturated_raising: every call is rejected with RateLimitExceeded
+ * method_class: `ratelimitedmethod` with class-level limits
+ * method_properties: `ratelimitedmethod` with an attrgetter provider of
+   per-instance `RateLimitProperties`
+ * striped: under quota with a `StripedState`
+
+Accuracy scenarios (saturated_blocking_<engine>) call a blocking limiter
+as fast as the threads can for ``--duration`` seconds.  The rate error
+leaves out the first interval, which may admit a burst.
+"""
+from datetime import timedelta
+from operator import attrgetter
+import argparse
+import functools
+import json
+import os
+import platform
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+
+# pylint: disable=wrong-import-position
+from cs.ratelimit import RateLimitExceeded, RateLimitProperties, ratelimited, ratelimitedmethod  # noqa: E402
+from cs.ratelimit.backends.striped import StripedState  # noqa: E402
+from cs.ratelimit.engines import ENGINES  # noqa: E402
+
+LOTS = 10 ** 12  # a max_count never reached
+HOUR = timedelta(hours=1)
+
+
+class Instance:
+    """Owner of rate limited methods."""
+
+    def __init__(self):
+        """Give the instance its own properties."""
+        self.rl = RateLimitProperties(max_count=LOTS, interval=HOUR)
+
+    @ratelimitedmethod(max_count=LOTS, interval=HOUR, debug=False)
+    def method_class(self):
+        """Limited by the class."""
+
+    @ratelimitedmethod(attrgetter('rl'), debug=False)
+    def method_properties(self):
+        """Limited by the instance."""
+
+
+def _function(**kwargs):
+    @ratelimited(debug=False, **kwargs)
+    def limited():
+        pass
+    return limited
+
+
+def _raising():
+    limited = _function(max_count=1, interval=HOUR)
+    limited()
+
+    def call():
+        try:
+            limited()
+        except RateLimitExceeded:
+            pass
+    return call
+
+
+OVERHEAD = {
+    'unlimited': _function,
+    'under_quota': lambda: _function(max_count=LOTS, interval=HOUR),
+    'saturated_raising': _raising,
+    'method_class': lambda: Instance().method_class,
+    'method_properties': lambda: Instance().method_properties,
+    'striped': lambda: _function(max_count=LOTS, interval=HOUR, engine='gcra', state=StripedState(chunk=64)),
+}
+
+
+def _run_threads(threads, target):
+    workers = [threading.Thread(target=target) for _ in range(threads)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return time.perf_counter() - start
+
+
+def overhead(name, threads, calls):
+    """Return the result of `calls` calls of the OVERHEAD scenario `name` split between `threads`."""
+    func = OVERHEAD[name]()
+    per_thread = max(1, calls // threads)
+
+    def work():
+        for _ in range(per_thread):
+            func()
+    elapsed = _run_threads(threads, work)
+    total = per_thread * threads
+    return {
+        'scenario': name,
+        'threads': threads,
+        'calls': total,
+        'seconds': elapsed,
+        'ns_per_call': elapsed * threads / total * 1e9,
+        'calls_per_second': total / elapsed,
+    }
+
+
+def accuracy(engine, threads, duration, rate):
+    """Return the result of `threads` calling a blocking `engine` limiter of `rate` calls per second."""
+    interval = .1
+    max_count = max(1, int(rate * interval))
+    func = _function(max_count=max_count, interval=timedelta(seconds=interval), block=True, engine=engine)
+    admitted = []
+    start = time.monotonic()
+    deadline = start + duration
+
+    def work():
+        times = []
+        while True:
+            func()
+            now = time.monotonic()
+            if now > deadline:
+                break
+            times.append(now)
+        admitted.extend(times)
+    elapsed = _run_threads(threads, work)
+    measured = sum(1 for admitted_at in admitted if admitted_at >= start + interval)
+    achieved = measured / (duration - interval)
+    expected = max_count / interval
+    return {
+        'scenario': f'saturated_blocking_{engine}',
+        'threads': threads,
+        'calls': len(admitted),
+        'seconds': elapsed,
+        'ns_per_call': elapsed * threads / max(1, len(admitted)) * 1e9,
+        'calls_per_second': achieved,
+        'expected_calls_per_second': expected,
+        'rate_error': achieved / expected - 1,
+    }
+
+
+def main(argv=None):
+    """Run the benchmarks selected by the command line args."""
+    parser = argparse.ArgumentParser(description=__doc__.split('\n', 1)[0])
+    parser.add_argument('--threads', default='1,2,4,8,16,32,64,128',
+                        help="comma separated thread counts (default: %(default)s)")
+    parser.add_argument('--calls', type=int, default=100000,
+                        help="calls per overhead scenario and thread count (default: %(default)s)")
+    parser.add_argument('--duration', type=float, default=1.0,
+                        help="seconds per accuracy scenario and thread count (default: %(default)s)")
+    parser.add_argument('--rate', type=float, default=1000,
+                        help="calls per second of accuracy scenarios (default: %(default)s)")
+    parser.add_argument('--scenario', action='append',
+                        help="run only the scenarios starting with this, may be repeated")
+    parser.add_argument('--json', action='store_true', help="print one JSON object per result")
+    args = parser.parse_args(argv)
+
+    environment = {'python': platform.python_implementation() + ' ' + platform.python_version(),
+                   'gil': getattr(sys, '_is_gil_enabled', lambda: True)()}
+    selected = args.scenario or ['']
+    runs = [(name, functools.partial(overhead, name, calls=args.calls)) for name in OVERHEAD]
+    runs += [(f'saturated_blocking_{engine}', functools.partial(accuracy, engine, duration=args.duration, rate=args.rate))
+             for engine in ENGINES]
+    if not args.json:
+        print(f"{'scenario':<36} {'threads':>7} {'ns/call':>12} {'calls/s':>14} {'rate error':>10}")
+    for name, benchmark in runs:
+        if not any(name.startswith(prefix) for prefix in selected):
+            continue
+        for threads in (int(threads) for threads in args.threads.split(',')):
+            result = benchmark(threads=threads)
+            if args.json:
+                print(json.dumps({**result, **environment}), flush=True)
+            else:
+                error = f"{result['rate_error']:+.2%}" if 'rate_error' in result else ''
+                print(f"{result['scenario']:<36} {threads:>7} {result['ns_per_call']:>12.0f} "
+                      f"{result['calls_per_second']:>14.0f} {error:>10}", flush=True)
+
+
+if __name__ == '__main__':
+    main()